@@ -26,6 +26,8 @@ Press Ctrl+Alt+F1 to return to the graphical session.
 
     max-browser-cache-size = 1024*1024*250; # 250MB, in bytes, not including profile
 
+    max-renderer-memory = 1024*1024*1536; # 1.5GB, in bytes, renderer memory above which the kiosk page is reloaded when idle
+
     module = { config, lib, pkgs, ... }:
     let
       sessionName = "kiosk-browser";
@@ -76,7 +78,8 @@ Press Ctrl+Alt+F1 to return to the graphical session.
         extraGroups = [
           "dialout" # Access to serial ports for the Senso flex
           "input" # Access to /dev/input for detecting keyboards in kiosk
-        ];
+        ] ++ lib.optional config.playos.networking.watchdog.enable
+          config.playos.networking.watchdog.statusSocketGroup; # Connectivity status for the kiosk
       };
 
       # Note that setting up "/home" as persistent fails due to https://github.com/NixOS/nixpkgs/issues/6481
@@ -175,6 +178,8 @@ Press Ctrl+Alt+F1 to return to the graphical session.
 
               ${pkgs.playos-kiosk-browser}/bin/kiosk-browser \
                 --max-cache-size ${toString max-browser-cache-size} \
+                --renderer-memory-limit ${toString max-renderer-memory} \
+                --metrics-port ${toString config.playos.monitoring.metricsPort} \
                 ${config.playos.kioskUrl} \
                 http://localhost:3333/
 
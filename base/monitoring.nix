@@ -53,6 +53,12 @@ in
         description = "List of extra systemd service names (globs) to monitor";
         type = types.listOf types.str;
       };
+
+      metricsPort = mkOption {
+        default = 8094;
+        description = "Local UDP port on which services can push metrics in InfluxDB line protocol";
+        type = types.port;
+      };
     };
   };
 
@@ -280,6 +286,12 @@ in
 
         ## INPUTS: collected metrics
 
+        # metrics pushed by PlayOS services, e.g. the network watchdog
+        inputs.socket_listener = {
+          service_address = "udp://127.0.0.1:${toString cfg.metricsPort}";
+          data_format = "influx";
+        };
+
         inputs.mem = {
           fieldinclude = [
             "cached"
@@ -17,9 +17,9 @@ let
     ];
 
     nativeCheckInputs = with python3Packages; [
-      types-requests
       ruff
       mypy
+      pytest
     ];
 
     checkPhase = ''
@@ -34,13 +34,14 @@ let
           --exclude setup.py \
           .
 
+      pytest -v
+
       runHook postCheck
      '';
 
       propagatedBuildInputs = with python3Packages; [
         dbus-python
         pygobject3
-        requests
         playos-proxy-utils
       ];
   };
@@ -51,35 +52,110 @@ in
       enable = mkEnableOption "Run network watchdog";
 
       checkURLs = mkOption {
-        example = [ "https://play.dividat.com" "https://api.dividat.com" ];
+        example = [ "https://play.dividat.com" "head+https://api.dividat.com" ];
         type = types.nonEmptyListOf types.str;
-        description = "List of URLs to determine if internet is reachable. If at least one URL is reachable, then we believe internet is reachable. URLs are tried sequentially.";
+        description = "List of URLs to determine if internet is reachable. If at least one URL is reachable, then we believe internet is reachable. URLs are tried sequentially, unless `concurrentChecks` is enabled. By default a URL is checked with a GET request, prefix it with `head+`, `tls+` (https only) or `tcp+` to only send a HEAD request, do a TLS handshake or open a TCP connection instead.";
+      };
+
+      concurrentChecks = mkOption {
+        default = true;
+        type = types.bool;
+        description = "Probe all `checkURLs` at once and consider the check successful as soon as the first one succeeds, instead of trying them one after the other.";
       };
 
       maxNumFailures = mkOption {
         default = 3;
         type = types.ints.positive;
-        description = "How many times to check before determining that internet connectivity is “lost”. Total wait time is `(maxNumFailures - 1) * checkInterval` plus a worst-case factor `(maxNumFailures - 1) *len(checkURLs) * checkUrlTimeout`";
+        description = "How many times to check before determining that internet connectivity is “lost”. Total wait time is `(maxNumFailures - 1) * minCheckInterval` plus a worst-case factor `(maxNumFailures - 1) * checkUrlTimeout` (multiplied by `len(checkURLs)` if `concurrentChecks` is disabled)";
       };
 
       checkInterval = mkOption {
         type = types.numbers.positive;
-        description = "Interval for checking `checkUrl` in seconds";
+        description = "Interval for checking `checkUrl` in seconds while connected";
         default = 60*3;
       };
 
+      minCheckInterval = mkOption {
+        type = types.numbers.positive;
+        description = "Interval in seconds for re-checking after a failed check, and the initial interval of the backoff while never connected. Must not be larger than `checkInterval`.";
+        default = lib.min 15 cfg.checkInterval;
+        defaultText = literalExpression "min 15 config.playos.networking.watchdog.checkInterval";
+      };
+
+      maxCheckInterval = mkOption {
+        type = types.numbers.positive;
+        description = "Upper bound in seconds of the exponential backoff between checks while never connected. Must not be smaller than `checkInterval`.";
+        default = lib.max (60*10) cfg.checkInterval;
+        defaultText = literalExpression "max 600 config.playos.networking.watchdog.checkInterval";
+      };
+
+      checkIntervalJitter = mkOption {
+        type = types.numbers.between 0 1;
+        description = "Fraction by which check intervals are randomized, to avoid many devices checking in lockstep. Intervals stay within `minCheckInterval` and `maxCheckInterval`.";
+        default = 0.1;
+      };
+
       settingChangeDelay = mkOption {
         default = 60*5;
         type = types.numbers.positive;
         description = "How many seconds to pause the watchdog for after any connman (service) setting changes (e.g. user has changed the wifi passphrase).";
       };
 
+      connmanSettleTime = mkOption {
+        default = 2;
+        type = types.numbers.nonnegative;
+        description = "Connman service property changes are merged into a single change until none happened for this many seconds, so that a burst of changes (e.g. on DHCP renewal) starts `settingChangeDelay` only once.";
+      };
+
+      ignoredConnmanProperties = mkOption {
+        default = [ "Strength" ];
+        type = types.listOf types.str;
+        description = "Connman service properties whose changes do not trigger `settingChangeDelay`.";
+      };
+
+      remediationSteps = mkOption {
+        default = [ "dns" "failover" "reconnect" "technology" "restart" ];
+        type = types.nonEmptyListOf (types.enum [ "dns" "failover" "reconnect" "technology" "restart" ]);
+        description = "Steps tried in order once connectivity is lost, until one restores it: re-resolve the check URL hosts with fresh connections (`dns`), make another connected service the default (`failover`, e.g. ethernet when wifi is broken), reconnect the default connman service (`reconnect`), power cycle its technology (`technology`) and restart connman (`restart`).";
+      };
+
+      remediationSettleTime = mkOption {
+        default = 20;
+        type = types.numbers.positive;
+        description = "How many seconds to wait after a remediation step before checking whether it restored connectivity.";
+      };
+
       checkUrlTimeout = mkOption {
         default = 5;
         type = types.numbers.positive;
         description = "Timeout in seconds for the individual HTTP request.";
       };
 
+      captiveCheckURL = mkOption {
+        default = "http://captive.dividat.com/";
+        type = types.nullOr types.str;
+        description = "URL answering `Open Sesame`, checked to detect captive portals when checks fail. The connectivity and captive portal status is published on `statusSocket` for other components, e.g. the kiosk.";
+      };
+
+      statusSocket = mkOption {
+        description = "Unix socket publishing the connectivity status as JSON lines";
+        readOnly = true;
+        default = "/run/playos-network-watchdog/status.sock";
+      };
+
+      statusSocketGroup = mkOption {
+        description = "Group allowed to subscribe to `statusSocket`";
+        type = types.str;
+        default = "playos-network-status";
+      };
+
+      exportMetrics = mkOption {
+        default = config.playos.monitoring.enable or false;
+        defaultText = literalExpression "config.playos.monitoring.enable";
+        type = types.bool;
+        description = "Send probe timings and success counts to the local monitoring stack (see `playos.monitoring.metricsPort`).";
+      };
+
       debug = mkOption {
         default = false;
         type = types.bool;
@@ -95,6 +171,15 @@ in
   };
 
   config = lib.mkIf cfg.enable {
+    assertions = [
+      {
+        assertion = cfg.minCheckInterval <= cfg.checkInterval && cfg.checkInterval <= cfg.maxCheckInterval;
+        message = "playos.networking.watchdog: minCheckInterval <= checkInterval <= maxCheckInterval must hold";
+      }
+    ];
+
+    users.groups.${cfg.statusSocketGroup} = {};
+
     systemd.services."playos-network-watchdog" = {
       description = "PlayOS network watchdog";
 
@@ -108,16 +193,33 @@ in
         StandardOutput = "journal";
         StandardError = "inherit";
         Environment = "PYTHONUNBUFFERED=1";
+        # event history, also dumped to /tmp on SIGUSR1
+        RuntimeDirectory = "playos-network-watchdog";
         ExecStart =
             let
                 checkURLflags = lib.strings.concatMapStrings (url: " --check-url '${url}'") cfg.checkURLs;
+                ignoredPropertyFlags = lib.strings.concatMapStrings (name: " --ignored-connman-property '${name}'") cfg.ignoredConnmanProperties;
             in
             ''${watchdog}/bin/playos-network-watchdog \
                  ${checkURLflags} \
+                 ${ignoredPropertyFlags} \
                 --max-num-failures ${toString cfg.maxNumFailures} \
                 --check-interval ${toString cfg.checkInterval} \
+                --min-check-interval ${toString cfg.minCheckInterval} \
+                --max-check-interval ${toString cfg.maxCheckInterval} \
+                --check-interval-jitter ${toString cfg.checkIntervalJitter} \
                 --check-url-timeout ${toString cfg.checkUrlTimeout} \
-                --setting-change-delay ${toString cfg.settingChangeDelay}''
+                --setting-change-delay ${toString cfg.settingChangeDelay} \
+                --connman-settle-time ${toString cfg.connmanSettleTime} \
+                --remediation-steps ${lib.concatStringsSep "," cfg.remediationSteps} \
+                --remediation-settle-time ${toString cfg.remediationSettleTime} \
+                --history-socket /run/playos-network-watchdog/history.sock \
+                --status-socket ${cfg.statusSocket} \
+                --status-socket-group ${cfg.statusSocketGroup}''
+                + (lib.optionalString (cfg.captiveCheckURL != null) " --captive-check-url '${cfg.captiveCheckURL}'")
+                + (lib.optionalString cfg.concurrentChecks " --concurrent-checks")
+                + (lib.optionalString cfg.exportMetrics
+                    " --metrics-port ${toString config.playos.monitoring.metricsPort} --metrics-interval ${toString config.playos.monitoring.collectionIntervalSeconds}")
                 + (lib.optionalString cfg.debug " --debug");
         User = "root";
         RestartSec = "10s";
@@ -4,9 +4,12 @@ setuptools.setup(
     name="playos_network_watchdog",
     version="0.1.0",
     description="PlayOS Network Watchdog",
-    py_modules=['watchdog'],
+    py_modules=['watchdog', 'watchdog_simulator'],
     packages=setuptools.find_packages(),
     entry_points={
-        'console_scripts': ['playos-network-watchdog = watchdog:main' ]
+        'console_scripts': [
+            'playos-network-watchdog = watchdog:main',
+            'playos-network-watchdog-simulator = watchdog_simulator:main',
+        ]
     }
 )
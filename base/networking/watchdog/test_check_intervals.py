@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+import watchdog
+from watchdog import backoff_check_interval, jittered_check_interval
+
+CHECK_INTERVAL = 60
+MIN_CHECK_INTERVAL = 15
+MAX_CHECK_INTERVAL = 600
+JITTER = 0.1
+
+
+@pytest.fixture
+def cfg():
+    random.seed(0)
+    return watchdog.parse_args([
+        '--check-url', 'https://simulated.invalid',
+        '--check-interval', str(CHECK_INTERVAL),
+        '--min-check-interval', str(MIN_CHECK_INTERVAL),
+        '--max-check-interval', str(MAX_CHECK_INTERVAL),
+        '--check-interval-jitter', str(JITTER),
+        '--max-num-failures', '3',
+        '--check-url-timeout', '5',
+        '--setting-change-delay', '300',
+    ])
+
+
+def test_jitter_stays_within_bounds(cfg):
+    intervals = [jittered_check_interval(cfg, CHECK_INTERVAL) for _ in range(1000)]
+    assert CHECK_INTERVAL * (1 - JITTER) <= min(intervals)
+    assert max(intervals) <= CHECK_INTERVAL * (1 + JITTER)
+    # actually spread out
+    assert len(set(intervals)) > 1
+
+
+def test_jitter_is_clamped_to_min_and_max_interval(cfg):
+    assert all(jittered_check_interval(cfg, MIN_CHECK_INTERVAL) >= MIN_CHECK_INTERVAL for _ in range(1000))
+    assert all(jittered_check_interval(cfg, MAX_CHECK_INTERVAL) <= MAX_CHECK_INTERVAL for _ in range(1000))
+
+
+def test_backoff_doubles_up_to_max_interval(cfg):
+    cfg.check_interval_jitter = 0
+    assert [backoff_check_interval(cfg, n) for n in range(1, 8)] == [15, 30, 60, 120, 240, 480, 600]
+    # without overflowing after many attempts
+    assert backoff_check_interval(cfg, 10_000) == MAX_CHECK_INTERVAL
+
+
+def test_fully_backed_off_checks_are_spread_out(cfg):
+    intervals = {backoff_check_interval(cfg, 100) for _ in range(100)}
+    assert len(intervals) > 1
+    assert all(MAX_CHECK_INTERVAL * (1 - JITTER) <= i <= MAX_CHECK_INTERVAL for i in intervals)
+
+
+def test_check_interval_bounds_are_validated():
+    with pytest.raises(SystemExit):
+        watchdog.parse_args([
+            '--check-url', 'https://simulated.invalid',
+            '--check-interval', '60',
+            '--min-check-interval', '120',
+            '--max-num-failures', '3',
+            '--check-url-timeout', '5',
+            '--setting-change-delay', '300',
+        ])
@@ -0,0 +1,85 @@
+import http.server
+import json
+import socket
+import threading
+
+import pytest
+
+from watchdog import Connectivity, ConnectivityBroker, URLCheckError, find_captive_portal
+
+FAILED = [URLCheckError("https://example.com", "timed out")]
+
+
+@pytest.fixture
+def subscriber(tmp_path):
+    """Connect to a broker, returning it and a reader of published lines."""
+    broker = ConnectivityBroker()
+    path = str(tmp_path / "status")
+    broker.serve(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.settimeout(5)
+    lines = sock.makefile()
+
+    def read():
+        return json.loads(lines.readline())
+
+    yield broker, read
+    sock.close()
+
+
+def test_publishes_status_changes(subscriber):
+    broker, read = subscriber
+    assert read() == {"status": Connectivity.DISCONNECTED, "portal_url": None}
+
+    broker.handle_check(None)
+    broker.handle_check(None)
+    broker.handle_check(FAILED, "http://portal.example/login")
+    broker.handle_check(FAILED, "http://portal.example/login")
+    broker.handle_check(FAILED)
+    broker.handle_check(None)
+
+    # unchanged statuses are not published again
+    assert read() == {"status": Connectivity.CONNECTED, "portal_url": None}
+    assert read() == {"status": Connectivity.CAPTIVE, "portal_url": "http://portal.example/login"}
+    assert read() == {"status": Connectivity.DISCONNECTED, "portal_url": None}
+    assert read() == {"status": Connectivity.CONNECTED, "portal_url": None}
+
+
+class CaptiveHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        match self.path:
+            case "/open":
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b"Open Sesame")
+            case "/redirect":
+                self.send_response(302)
+                self.send_header("Location", "http://portal.example/login")
+                self.end_headers()
+            case "/replaced":
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b"Please log in")
+            case _:
+                self.send_response(404)
+                self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def captive_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), CaptiveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_find_captive_portal(captive_server):
+    assert find_captive_portal(f"{captive_server}/open", 5) is None
+    assert find_captive_portal(f"{captive_server}/redirect", 5) == "http://portal.example/login"
+    assert find_captive_portal(f"{captive_server}/replaced", 5) == f"{captive_server}/replaced"
+    assert find_captive_portal(f"{captive_server}/missing", 5) is None
@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+
+import watchdog
+from watchdog import CONNMAN_MAX_BURST_SECONDS, ConnmanChangeCoalescer
+from watchdog_simulator import EPOCH, VirtualLoop
+
+SETTLE_TIME = 2
+WIFI = '/net/connman/service/wifi'
+
+
+@pytest.fixture
+def loop():
+    return VirtualLoop()
+
+
+@pytest.fixture
+def changes(loop):
+    cfg = watchdog.parse_args([
+        '--check-url', 'https://simulated.invalid',
+        '--check-interval', '60',
+        '--max-num-failures', '3',
+        '--check-url-timeout', '5',
+        '--setting-change-delay', '300',
+        '--connman-settle-time', str(SETTLE_TIME),
+    ])
+    events = []
+    coalescer = ConnmanChangeCoalescer(cfg, loop, events.append)
+    coalescer.remember_services([(WIFI, {'State': 'online', 'Strength': 50})])
+    return coalescer, events
+
+
+def test_unchanged_and_ignored_values_are_dropped(loop, changes):
+    coalescer, events = changes
+    coalescer.property_changed(WIFI, 'State', 'online')
+    coalescer.property_changed(WIFI, 'Strength', 40)
+    loop.run_until(60)
+    assert events == []
+
+    coalescer.property_changed(WIFI, 'State', 'ready')
+    loop.run_until(120)
+    assert [(e.property, e.value) for e in events] == [('State', 'ready')]
+
+
+def test_changes_are_merged_until_settled(loop, changes):
+    coalescer, events = changes
+    loop.run_until(10)
+    coalescer.property_changed(WIFI, 'State', 'ready')
+    loop.run_until(11)
+    coalescer.property_changed(WIFI, 'IPv4', 'dhcp')
+    loop.run_until(11 + SETTLE_TIME - 0.5)
+    assert events == []
+
+    loop.run_until(11 + SETTLE_TIME)
+    [event] = events
+    assert event.property == 'State, IPv4'
+    assert event.service == WIFI
+    # dated at the first change
+    assert event.time == EPOCH + datetime.timedelta(seconds=10)
+
+
+def test_long_bursts_are_flushed(loop, changes):
+    coalescer, events = changes
+    for second in range(2 * CONNMAN_MAX_BURST_SECONDS):
+        loop.run_until(second)
+        coalescer.property_changed(WIFI, 'IPv4', second)
+    assert len(events) >= 1
+    assert events[0].time == EPOCH
+
+
+def test_removed_services_are_forgotten(loop, changes):
+    coalescer, events = changes
+    coalescer.forget_service(WIFI)
+    coalescer.property_changed(WIFI, 'State', 'online')
+    loop.run_until(60)
+    assert len(events) == 1
+
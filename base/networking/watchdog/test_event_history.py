@@ -0,0 +1,71 @@
+import datetime
+import json
+import socket
+
+from watchdog import EventHistory, RemediationStep
+
+
+def record_events(history: EventHistory, count: int, start: datetime.datetime):
+    for i in range(count):
+        history.record(start + datetime.timedelta(seconds=i), "check", success=i % 2 == 0, service="wifi")
+
+
+def test_history_is_bounded():
+    history = EventHistory(3)
+    record_events(history, 5, datetime.datetime.now() - datetime.timedelta(seconds=5))
+    events = json.loads(history.to_json())
+    # the oldest events are dropped
+    assert [e["success"] for e in events] == [True, False, True]
+
+
+def test_json_shape():
+    history = EventHistory(10)
+    now = datetime.datetime(2026, 1, 2, 3, 4, 5)
+    history.record(now, "remediation", step=RemediationStep.RECONNECT, service="wifi", duration=0.5)
+    assert json.loads(history.to_json()) == [{
+        "time": "2026-01-02T03:04:05",
+        "kind": "remediation",
+        "step": "reconnect",
+        "service": "wifi",
+        "duration": 0.5,
+    }]
+
+
+def test_recent_events():
+    history = EventHistory(100)
+    record_events(history, 10, datetime.datetime.now() - datetime.timedelta(hours=2))
+    record_events(history, 3, datetime.datetime.now() - datetime.timedelta(seconds=10))
+    assert len(json.loads(history.to_json(seconds=60))) == 3
+    assert len(json.loads(history.to_json())) == 13
+
+
+def test_dump(tmp_path):
+    history = EventHistory(10)
+    record_events(history, 2, datetime.datetime.now())
+    with open(history.dump(str(tmp_path))) as f:
+        assert json.load(f) == json.loads(history.to_json())
+
+
+def query(path: str, request: bytes) -> list:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(path)
+        sock.sendall(request)
+        sock.shutdown(socket.SHUT_WR)
+        response = b""
+        while chunk := sock.recv(4096):
+            response += chunk
+    return json.loads(response)
+
+
+def test_serve(tmp_path):
+    history = EventHistory(100)
+    record_events(history, 10, datetime.datetime.now() - datetime.timedelta(hours=2))
+    record_events(history, 3, datetime.datetime.now() - datetime.timedelta(seconds=10))
+    path = str(tmp_path / "history")
+    history.serve(path)
+
+    assert len(query(path, b"")) == 13
+    assert len(query(path, b"60\n")) == 3
+    # invalid periods get all events
+    assert len(query(path, b"recent\n")) == 13
@@ -0,0 +1,73 @@
+import re
+
+import pytest
+
+from watchdog import LATENCY_BUCKETS_MS, LATENCY_METRICS_MEASUREMENT, METRICS_MEASUREMENT, Phase, ProbeMetrics
+
+TIMESTAMP = 1_700_000_000_000_000_000
+URL = "https://example.com/a path,with=specials\\"
+
+
+def split_unescaped(text: str, separator: str, maxsplit: int = -1) -> list[str]:
+    """Split at separators not escaped by a backslash, keeping escapes."""
+    parts, current, escaped = [], "", False
+    for char in text:
+        if escaped:
+            current += char
+            escaped = False
+        elif char == "\\":
+            current += char
+            escaped = True
+        elif char == separator and maxsplit != 0:
+            parts.append(current)
+            current = ""
+            maxsplit -= 1
+        else:
+            current += char
+    return parts + [current]
+
+
+def unescape(text: str) -> str:
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+def parse_line(line: str) -> tuple[str, dict[str, str], dict[str, str], int]:
+    """Parse a line of InfluxDB line protocol into measurement, tags, fields and timestamp."""
+    series, fields, timestamp = split_unescaped(line, " ")
+    measurement, *tags = split_unescaped(series, ",")
+    return (
+        measurement,
+        {unescape(key): unescape(value) for key, value in (split_unescaped(tag, "=", 1) for tag in tags)},
+        dict(field.split("=", 1) for field in fields.split(",")),
+        int(timestamp),
+    )
+
+
+def test_line_protocol():
+    metrics = ProbeMetrics()
+    metrics.record(URL, success=True, timings={Phase.TTFB: 0.020, Phase.TOTAL: 0.030})
+    metrics.record(URL, success=True, timings={Phase.TTFB: 0.200, Phase.TOTAL: 0.300})
+    metrics.record(URL, success=False, timings={Phase.TTFB: 20})
+
+    [(url, lines)] = metrics.to_line_protocol(TIMESTAMP).items()
+    assert url == URL
+    assert lines.endswith("\n")
+    parsed = [parse_line(line) for line in lines.splitlines()]
+
+    measurement, tags, fields, timestamp = parsed[0]
+    assert measurement == METRICS_MEASUREMENT
+    assert tags == {"url": URL}
+    assert fields == {"successes": "2i", "failures": "1i", "success_ratio": str(2 / 3)}
+    assert timestamp == TIMESTAMP
+
+    latencies = {tags["phase"]: fields for measurement, tags, fields, _ in parsed[1:]
+                 if measurement == LATENCY_METRICS_MEASUREMENT and tags["url"] == URL}
+    assert set(latencies) == {Phase.TTFB, Phase.TOTAL}
+
+    ttfb = latencies[Phase.TTFB]
+    assert ttfb["count"] == "3i"
+    assert float(ttfb["sum"]) == pytest.approx(20.22)
+    # buckets are cumulative, 20 ms, 200 ms and 20 s
+    expected = {10: 0, 25: 1, 50: 1, 100: 1, 250: 2, 500: 2, 1000: 2, 2500: 2, 5000: 2, 10000: 2}
+    assert [ttfb[f"le_{bound}ms"] for bound in LATENCY_BUCKETS_MS] == [f"{expected[bound]}i" for bound in LATENCY_BUCKETS_MS]
+    assert ttfb["le_inf"] == "3i"
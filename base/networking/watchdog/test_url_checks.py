@@ -0,0 +1,156 @@
+import errno
+import http.server
+import socket
+import threading
+import time
+
+import pytest
+
+import watchdog
+from watchdog import (CheckURL, FailureKind, ProbeMetrics, ProbeMode, ProbeTransport, classify_failure,
+                      failure_kind, perform_url_checks, perform_url_checks_concurrently)
+
+
+@pytest.mark.parametrize('spec, url, mode', [
+    ("https://example.com/", "https://example.com/", ProbeMode.GET),
+    ("get+https://example.com/", "https://example.com/", ProbeMode.GET),
+    ("head+http://example.com/path?query", "http://example.com/path?query", ProbeMode.HEAD),
+    ("tls+https://example.com", "https://example.com", ProbeMode.TLS),
+    ("tcp+http://example.com:8080", "http://example.com:8080", ProbeMode.TCP),
+])
+def test_parse_check_url(spec, url, mode):
+    check = CheckURL.parse(spec)
+    assert check == CheckURL(url, mode)
+    # printed as configured, omitting the default mode
+    assert str(CheckURL.parse(str(check))) == str(check)
+
+
+@pytest.mark.parametrize('spec', [
+    "ftp://example.com/",
+    "example.com",
+    "udp+https://example.com/",
+    "tls+http://example.com/",
+    "head+",
+])
+def test_parse_invalid_check_url(spec):
+    with pytest.raises(ValueError):
+        CheckURL.parse(spec)
+
+
+def test_check_urls_are_parsed_from_arguments():
+    cfg = watchdog.parse_args([
+        '--check-url', 'head+https://first.example/',
+        '--check-url', 'https://second.example/',
+        '--check-interval', '60',
+        '--max-num-failures', '3',
+        '--check-url-timeout', '5',
+        '--setting-change-delay', '300',
+    ])
+    assert cfg.check_urls == [CheckURL("https://first.example/", ProbeMode.HEAD), CheckURL("https://second.example/")]
+
+
+class NoContentHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def responding_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), NoContentHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield CheckURL(f"http://127.0.0.1:{server.server_address[1]}/")
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def hanging_url():
+    # accepts connections, but never responds
+    with socket.create_server(('127.0.0.1', 0)) as sock:
+        yield CheckURL(f"http://127.0.0.1:{sock.getsockname()[1]}/")
+
+
+def test_concurrent_checks_cancel_remaining_ones(responding_url, hanging_url):
+    metrics = ProbeMetrics()
+    transport = ProbeTransport(proxy=None)
+    started = time.monotonic()
+    assert perform_url_checks_concurrently([hanging_url, responding_url], 5, transport, metrics) is None
+
+    # the hanging check is cancelled rather than running into the timeout
+    deadline = time.monotonic() + 1
+    while any(t.name.startswith("url-check") for t in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not any(t.name.startswith("url-check") for t in threading.enumerate())
+    assert time.monotonic() - started < 5
+    assert list(metrics.to_line_protocol(0)) == [responding_url.url]
+    transport.close()
+
+
+def test_classify_failure():
+    assert classify_failure(OSError(errno.ENETUNREACH, "Network is unreachable")) == FailureKind.LOCAL
+    assert classify_failure(ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")) == FailureKind.REMOTE
+    assert classify_failure(TimeoutError("timed out")) == FailureKind.REMOTE
+    assert classify_failure(socket.gaierror(socket.EAI_NONAME, "Name or service not known")) == FailureKind.REMOTE
+    # may be the name servers of a single domain
+    assert classify_failure(socket.gaierror(socket.EAI_AGAIN, "Temporary failure")) == FailureKind.REMOTE
+
+
+class FakeSocket:
+    """Refuses IPv4 connections, IPv6 ones are unreachable."""
+
+    def __init__(self, family, *_args):
+        self.family = family
+
+    def settimeout(self, _timeout):
+        pass
+
+    def connect(self, _address):
+        if self.family == socket.AF_INET6:
+            raise OSError(errno.ENETUNREACH, "Network is unreachable")
+        else:
+            raise ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def dual_stack(monkeypatch):
+    """Hosts resolve to an IPv4 and an IPv6 address, unresolvable hosts fail with EAI_AGAIN."""
+    def getaddrinfo(host, port, **_kwargs):
+        if host.startswith('unresolvable'):
+            raise socket.gaierror(socket.EAI_AGAIN, "Temporary failure in name resolution")
+        return [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('192.0.2.1', port)),
+            (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('2001:db8::1', port, 0, 0)),
+        ]
+    monkeypatch.setattr(watchdog.socket, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(watchdog.socket, 'socket', FakeSocket)
+
+
+@pytest.mark.parametrize('check', [perform_url_checks, perform_url_checks_concurrently])
+def test_remote_failure_of_any_address_is_remote(dual_stack, check):
+    urls = [CheckURL("http://first.example/"), CheckURL("http://second.example/")]
+    errs = check(urls, 1, ProbeTransport(proxy=None))
+    # the other URL is checked as well
+    assert [e.url for e in errs] == [str(url) for url in urls]
+    assert [e.kind for e in errs] == [FailureKind.REMOTE, FailureKind.REMOTE]
+    assert "refused" in errs[0].reason
+
+
+@pytest.mark.parametrize('check', [perform_url_checks, perform_url_checks_concurrently])
+def test_unavailable_resolver_for_one_host_is_remote(dual_stack, check):
+    urls = [CheckURL("http://unresolvable.example/"), CheckURL("http://second.example/")]
+    errs = check(urls, 1, ProbeTransport(proxy=None))
+    assert [e.url for e in errs] == [str(url) for url in urls]
+    assert failure_kind(errs) == FailureKind.REMOTE
+
+
+def test_unavailable_resolver_for_all_hosts_is_local(dual_stack):
+    urls = [CheckURL("http://unresolvable.example/"), CheckURL("http://unresolvable-too.example/")]
+    errs = perform_url_checks(urls, 1, ProbeTransport(proxy=None))
+    assert failure_kind(errs) == FailureKind.LOCAL
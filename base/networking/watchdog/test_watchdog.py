@@ -0,0 +1,120 @@
+import datetime
+
+import pytest
+
+import watchdog
+from watchdog import (ConnmanServicePropertyChangedEvent, EventHistory, ProbeMetrics, ProbeTransport,
+                      RemediationStep, StateNeverConnected, StateOnceConnected, URLCheckError)
+from watchdog_simulator import VirtualLoop
+
+ETHERNET = '/net/connman/service/ethernet'
+WIFI = '/net/connman/service/wifi'
+CHECK_INTERVAL = 60
+MAX_NUM_FAILURES = 3
+
+
+class FakeMonitor:
+    def __init__(self, default_service: str):
+        self.default_service: str | None = default_service
+        self.last_update = ConnmanServicePropertyChangedEvent(
+            time = datetime.datetime.fromtimestamp(0),
+            property = "",
+            service = "",
+            value = ""
+        )
+
+    def get_current_proxy(self):
+        return None
+
+    def recheck_proxies(self):
+        pass
+
+    def fail_over_default_service(self):
+        self.default_service = WIFI
+
+    def reconnect_default_service(self):
+        pass
+
+    def restart_default_technology(self):
+        pass
+
+
+class ScriptedWatchdog(watchdog.Watchdog):
+    """Checks succeed on the services in `working`, and take no time."""
+
+    def __init__(self, cfg, monitor: FakeMonitor, loop: VirtualLoop):
+        super().__init__(cfg, monitor, loop, ProbeTransport(None), ProbeMetrics(), EventHistory(100))
+        self.working = {ETHERNET, WIFI}
+        self.remediations: list[RemediationStep] = []
+
+    def _run_remediation_step(self, step: RemediationStep):
+        self.remediations.append(step)
+        match step:
+            case RemediationStep.FAILOVER:
+                self._monitor.fail_over_default_service()
+
+    def _start_probe(self, state):
+        service = self._monitor.default_service
+        err = None if service in self.working else [URLCheckError("https://example.com", "timed out")]
+        self._probing = True
+        self._loop.call_soon_threadsafe(self._on_probe_done, state, err, service)
+
+
+@pytest.fixture
+def cfg():
+    return watchdog.parse_args([
+        '--check-url', 'https://simulated.invalid',
+        '--check-interval', str(CHECK_INTERVAL),
+        '--max-num-failures', str(MAX_NUM_FAILURES),
+        '--check-url-timeout', '5',
+        '--setting-change-delay', '300',
+        '--remediation-steps', 'failover,restart',
+        '--remediation-settle-time', '20',
+    ])
+
+
+@pytest.fixture
+def loop():
+    return VirtualLoop()
+
+
+def test_service_states_are_kept_per_service(cfg, loop):
+    monitor = FakeMonitor(ETHERNET)
+    dog = ScriptedWatchdog(cfg, monitor, loop)
+    dog.working = {WIFI}
+    dog.start()
+    loop.run_until(10)
+    assert dog._state == StateNeverConnected(1, last_failure=watchdog.FailureKind.REMOTE)
+
+    # failures over ethernet do not count against wifi
+    monitor.default_service = WIFI
+    loop.run_until(10 + CHECK_INTERVAL)
+    assert dog._state == StateOnceConnected(MAX_NUM_FAILURES)
+
+    # and ethernet resumes where it was
+    monitor.default_service = ETHERNET
+    loop.run_until(10 + 2 * CHECK_INTERVAL)
+    assert dog._service == ETHERNET
+    assert isinstance(dog._state, StateNeverConnected) and dog._state.failed_attempts > 1
+
+
+def test_failover_success_is_recorded_on_new_default_service(cfg, loop):
+    monitor = FakeMonitor(ETHERNET)
+    dog = ScriptedWatchdog(cfg, monitor, loop)
+    dog.start()
+    loop.run_until(10)
+    assert dog._state == StateOnceConnected(MAX_NUM_FAILURES)
+
+    # ethernet breaks, until remediation fails over to wifi
+    dog.working = {WIFI}
+    loop.run_until(3600)
+    assert dog.remediations == [RemediationStep.FAILOVER]
+    assert dog._service == WIFI
+    assert dog._state == StateOnceConnected(MAX_NUM_FAILURES)
+    assert dog._service_health[WIFI].checks > 0 and dog._service_health[WIFI].failed_checks == 0
+
+    # ethernet is still broken, and considered lost after another failed check
+    assert dog._service_states[ETHERNET] == StateOnceConnected(1)
+    monitor.default_service = ETHERNET
+    loop.run_until(3600 + CHECK_INTERVAL)
+    assert dog.remediations == [RemediationStep.FAILOVER, RemediationStep.FAILOVER]
@@ -0,0 +1,69 @@
+import pytest
+
+import watchdog
+from watchdog import RemediationStep
+from watchdog_simulator import simulate
+
+CHECK_INTERVAL = 60
+MIN_CHECK_INTERVAL = 15
+MAX_NUM_FAILURES = 3
+CHECK_URL_TIMEOUT = 5
+# Failing checks until considered disconnected, after the last successful one
+MAX_TIME_TO_DETECT = CHECK_INTERVAL + MAX_NUM_FAILURES * (MIN_CHECK_INTERVAL + CHECK_URL_TIMEOUT)
+
+
+@pytest.fixture
+def cfg():
+    return watchdog.parse_args([
+        '--check-url', 'https://simulated.invalid',
+        '--check-interval', str(CHECK_INTERVAL),
+        '--min-check-interval', str(MIN_CHECK_INTERVAL),
+        '--max-num-failures', str(MAX_NUM_FAILURES),
+        '--check-url-timeout', str(CHECK_URL_TIMEOUT),
+        '--setting-change-delay', '300',
+    ])
+
+
+def trace(*events, duration=3600):
+    return {"duration": duration, "events": list(events)}
+
+
+def test_no_remediation_while_connected(cfg):
+    result = simulate(cfg, trace({"at": 600, "signal": "IPv4"}), seed=0)
+    assert result.outages == []
+    assert sum(result.steps.values()) == 0
+
+
+def test_outage_fixed_by_reconnect(cfg):
+    result = simulate(cfg, trace({"at": 600, "network": "down", "fixed_by": "reconnect"}), seed=0)
+    [outage] = result.outages
+    assert outage.detected_at is not None
+    assert outage.detected_at - outage.start <= MAX_TIME_TO_DETECT
+    assert outage.recovered_at is not None
+    assert result.steps[RemediationStep.RECONNECT] == 1
+    assert result.steps[RemediationStep.TECHNOLOGY] == 0
+    assert result.steps[RemediationStep.RESTART] == 0
+    assert result.spurious_steps == 0
+
+
+def test_outage_fixed_by_restart(cfg):
+    result = simulate(cfg, trace({"at": 600, "network": "down", "fixed_by": "restart"}), seed=0)
+    [outage] = result.outages
+    assert outage.detected_at is not None
+    assert outage.detected_at - outage.start <= MAX_TIME_TO_DETECT
+    assert outage.recovered_at is not None
+    assert result.steps[RemediationStep.RESTART] == 1
+
+
+def test_long_outage_does_not_restart_repeatedly(cfg):
+    result = simulate(cfg, trace({"at": 600, "network": "down"}, {"at": 1800, "network": "up"}), seed=0)
+    [outage] = result.outages
+    assert outage.recovered_at is not None and outage.recovered_at >= 1800
+    assert result.steps[RemediationStep.RESTART] == 1
+
+
+def test_short_local_failure_is_not_remediated(cfg):
+    result = simulate(cfg, trace({"at": 600, "network": "down", "kind": "local"}, {"at": 610, "network": "up"}), seed=0)
+    [outage] = result.outages
+    assert outage.detected_at is None
+    assert sum(result.steps.values()) == 0
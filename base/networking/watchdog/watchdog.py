@@ -1,44 +1,119 @@
 from __future__ import annotations # for recursive State typing
+# D-Bus, GLib and proxy_utils are imported lazily where needed, so that the first
+# check can run while they are loading.
 import argparse
-import requests
-import time
+import base64
+import errno
+import grp
+import http.client
+import json
+import os
+import random
+import select
+import signal
+import socket
+import socketserver
+import ssl
 import subprocess
+import time
+import urllib.parse
 from collections import deque
 import datetime
-import dbus # type: ignore
-from dbus.mainloop.glib import DBusGMainLoop # type: ignore
-from gi.repository import GLib # type: ignore
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 import threading
 import math
-import proxy_utils
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import enum
-from typing import List
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, List, Protocol
+
+if TYPE_CHECKING:
+    import proxy_utils
 
 CLIENT_HEADERS = {'User-Agent': 'PlayOS watchdog 1.0'}
+# Response bodies up to this size are read, so that the connection can be kept
+# alive. Connections with larger bodies are dropped instead.
+MAX_DRAINED_BODY_BYTES = 64 * 1024
 CONNMAN_RESTART_COMMAND = "systemctl restart connman.service"
-CONNMAN_SIGNAL_IGNORELIST = [
+CONNMAN_IGNORED_PROPERTIES = [
     "Strength", # each wifi scan updates this
 ]
+# Bursts of connman changes are reported at least this often
+CONNMAN_MAX_BURST_SECONDS = 30
+# Service properties that can change which proxy is in use
+CONNMAN_PROXY_PROPERTIES = [
+    "Proxy",
+    "State", # the proxy is taken from the first online or ready service
+]
+# Connect() returns once the service is connected, which can take a while for wifi
+CONNMAN_CONNECT_TIMEOUT = 30
+# Powering a technology off is announced once its devices are down, power it
+# on again after this long if that announcement does not come
+CONNMAN_POWER_OFF_TIMEOUT = 10
 
 logger = logging.getLogger(__name__)
 
 ## Helpers
 
-def parse_args():
+def parse_args(argv: List[str] | None = None):
     parser = argparse.ArgumentParser(
         description="PlayOS network watchdog",
         epilog="See the nix watchdog module for extra documentation"
     )
-    parser.add_argument('--check-url', dest="check_urls", action='append', required=True,
-                        help="Flag can be repeated multiple times")
-    parser.add_argument('--check-interval', type=float, required=True)
+    parser.add_argument('--check-url', dest="check_urls", action='append', required=True, type=CheckURL.parse,
+                        help="Flag can be repeated multiple times. Prefix with head+, tls+ or tcp+ to change the probe mode.")
+    parser.add_argument('--check-interval', type=float, required=True,
+                        help="Interval between checks while connected")
+    parser.add_argument('--min-check-interval', type=float,
+                        help="Interval for re-checking after a failure, defaults to --check-interval")
+    parser.add_argument('--max-check-interval', type=float,
+                        help="Upper bound of the backoff while never connected, defaults to --check-interval")
+    parser.add_argument('--check-interval-jitter', type=float, default=0,
+                        help="Randomize check intervals by this fraction, e.g. 0.1 for ±10%%")
     parser.add_argument('--max-num-failures', type=int, required=True)
     parser.add_argument('--check-url-timeout', type=float, required=True)
     parser.add_argument('--setting-change-delay', type=float, required=True)
+    parser.add_argument('--remediation-steps', type=RemediationStep.parse_list, default=list(RemediationStep),
+                        help="Comma separated steps to try in order once disconnected, "
+                             f"any of {', '.join(RemediationStep)}. Defaults to all of them.")
+    parser.add_argument('--remediation-settle-time', type=float, default=20,
+                        help="Seconds to wait after a remediation step before checking whether it helped")
+    parser.add_argument('--ignored-connman-property', dest="ignored_connman_properties", action='append',
+                        help="Service property whose changes are ignored, flag can be repeated multiple times. "
+                             f"Defaults to {', '.join(CONNMAN_IGNORED_PROPERTIES)}.")
+    parser.add_argument('--connman-settle-time', type=float, default=2,
+                        help="Connman changes are merged until none happened for this many seconds")
+    parser.add_argument('--concurrent-checks', action='store_true',
+                        help="Probe all check URLs at once instead of one after the other")
+    parser.add_argument('--metrics-port', type=int,
+                        help="Periodically send probe metrics in InfluxDB line protocol to this local UDP port")
+    parser.add_argument('--metrics-interval', type=float, default=60)
+    parser.add_argument('--status-socket',
+                        help="Publish connectivity and captive portal status as JSON lines on this Unix socket")
+    parser.add_argument('--status-socket-group',
+                        help="Group allowed to subscribe to the status socket, besides the user of the watchdog")
+    parser.add_argument('--captive-check-url',
+                        help="URL answering 'Open Sesame', used to detect captive portals when not behind a proxy")
+    parser.add_argument('--history-size', type=int, default=10000,
+                        help="Number of events (checks, state changes, connman changes) to keep in memory")
+    parser.add_argument('--history-socket',
+                        help="Serve the event history as JSON on this Unix socket")
+    parser.add_argument('--history-dump-dir', default="/tmp",
+                        help="Directory to dump the event history to on SIGUSR1")
     parser.add_argument('--debug', action='store_true')
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+
+    if args.ignored_connman_properties is None:
+        args.ignored_connman_properties = CONNMAN_IGNORED_PROPERTIES
+    if args.min_check_interval is None:
+        args.min_check_interval = args.check_interval
+    if args.max_check_interval is None:
+        args.max_check_interval = args.check_interval
+    if not args.min_check_interval <= args.check_interval <= args.max_check_interval:
+        parser.error("--min-check-interval <= --check-interval <= --max-check-interval must hold")
+
+    return args
 
 
 def log(msg):
@@ -49,54 +124,589 @@ def debug(msg):
     logger.debug(msg)
 
 
+class ProbeMode(enum.StrEnum):
+    GET = "get"
+    HEAD = "head"
+    # only establish a TLS session, for https URLs
+    TLS = "tls"
+    # only establish a TCP connection
+    TCP = "tcp"
+
+
+@dataclass(frozen=True)
+class CheckURL:
+    url: str
+    mode: ProbeMode = ProbeMode.GET
+
+    @staticmethod
+    def parse(spec: str) -> CheckURL:
+        """Parse a URL, optionally prefixed with a probe mode, e.g. `tcp+https://example.com`."""
+        mode_prefix, sep, url = spec.partition('+')
+        if sep and mode_prefix in list(ProbeMode):
+            check = CheckURL(url, ProbeMode(mode_prefix))
+        else:
+            check = CheckURL(spec)
+
+        parsed = urllib.parse.urlsplit(check.url)
+        if parsed.scheme not in ['http', 'https'] or not parsed.hostname:
+            raise ValueError(f"Unsupported URL: {spec}")
+        if check.mode == ProbeMode.TLS and parsed.scheme != 'https':
+            raise ValueError(f"Probe mode {check.mode} requires an https URL: {spec}")
+        return check
+
+    def __str__(self):
+        return self.url if self.mode == ProbeMode.GET else f"{self.mode}+{self.url}"
+
+
+# Ways to restore connectivity, from cheapest to most disruptive
+class RemediationStep(enum.StrEnum):
+    # drop pooled connections and check that check URL hosts still resolve
+    DNS = "dns"
+    # make another connected service (e.g. ethernet next to wifi) the default
+    FAILOVER = "failover"
+    # disconnect and reconnect the default connman service
+    RECONNECT = "reconnect"
+    # power cycle the technology (wifi, ethernet) of the default service
+    TECHNOLOGY = "technology"
+    RESTART = "restart"
+
+    @classmethod
+    def parse_list(cls, value: str) -> List[RemediationStep]:
+        try:
+            return [cls(step.strip()) for step in value.split(",")]
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+
+
+class FailureKind(enum.StrEnum):
+    # The device itself is offline, e.g. no route or DNS resolver unreachable.
+    # Checking further URLs is pointless.
+    LOCAL = "local"
+    # The network works, but the URL did not respond properly
+    REMOTE = "remote"
+
+
+# errnos that indicate a problem with the local network, regardless of URL
+LOCAL_FAILURE_ERRNOS = [
+    errno.ENETUNREACH,
+    errno.ENETDOWN,
+    errno.EADDRNOTAVAIL,
+]
+
+
+# Resolver failures are remote for a single URL, see `failure_kind`
+def classify_failure(e: Exception) -> FailureKind:
+    if isinstance(e, socket.gaierror):
+        return FailureKind.REMOTE
+    elif isinstance(e, OSError) and e.errno in LOCAL_FAILURE_ERRNOS:
+        return FailureKind.LOCAL
+    else:
+        return FailureKind.REMOTE
+
+
+def is_resolver_unavailable(e: Exception) -> bool:
+    """EAI_AGAIN, when no DNS resolver answered, but also when the name servers
+    of the host's domain failed (SERVFAIL)."""
+    return isinstance(e, socket.gaierror) and e.errno == socket.EAI_AGAIN
+
+
+def has_default_route() -> bool:
+    """Check the kernel routing tables for an IPv4 or IPv6 default route.
+
+    Returns True if the tables can not be read, to not cause false alarms.
+    """
+    RTF_UP = 0x0001
+    RTF_REJECT = 0x0200
+    try:
+        with open('/proc/net/route') as f:
+            # Iface Destination Gateway Flags RefCnt Use Metric Mask ...
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if fields[1] == '00000000' and fields[7] == '00000000' and int(fields[3], 16) & RTF_UP:
+                    return True
+        with open('/proc/net/ipv6_route') as f:
+            # Destination PrefixLength Source PrefixLength NextHop Metric RefCnt Use Flags Iface
+            for line in f.readlines():
+                fields = line.split()
+                flags = int(fields[8], 16)
+                if fields[1] == '00' and flags & RTF_UP and not flags & RTF_REJECT:
+                    return True
+        return False
+    except (OSError, IndexError, ValueError):
+        return True
+
+
 @dataclass
 class URLCheckError:
     url: str
     reason: str
+    kind: FailureKind = FailureKind.REMOTE
+    resolver_unavailable: bool = False
 
     def __str__(self):
-        return f"URL check for {self.url} failed: {self.reason}"
+        return f"URL check for {self.url} failed ({self.kind}): {self.reason}"
+
+
+# An unavailable resolver is only local if the hosts of all URLs agree, rather
+# than the name servers of one domain failing.
+def failure_kind(errs: List[URLCheckError]) -> FailureKind:
+    if any(e.kind == FailureKind.LOCAL for e in errs) or (len(errs) > 0 and all(e.resolver_unavailable for e in errs)):
+        return FailureKind.LOCAL
+    else:
+        return FailureKind.REMOTE
+
+
+## Probe transport
+
+@dataclass(frozen=True)
+class ConnectionKey:
+    scheme: str
+    host: str
+    port: int
+
+    @staticmethod
+    def from_url(url: urllib.parse.SplitResult) -> ConnectionKey:
+        if url.scheme not in ['http', 'https'] or not url.hostname:
+            raise ValueError(f"Unsupported URL: {url.geturl()}")
+        default_port = 443 if url.scheme == 'https' else 80
+        return ConnectionKey(url.scheme, url.hostname, url.port or default_port)
+
+
+class Phase(enum.StrEnum):
+    DNS = "dns"
+    CONNECT = "connect"
+    PROXY_CONNECT = "proxy_connect"
+    TLS = "tls"
+    TTFB = "ttfb" # from sending the request until the response headers arrived
+    TOTAL = "total"
+
+
+# Durations of completed phases, in seconds
+PhaseTimings = dict[Phase, float]
+
+
+@contextmanager
+def timed(timings: PhaseTimings, phase: Phase) -> Iterator[None]:
+    """Record the duration of the block, unless it fails."""
+    start = time.monotonic()
+    yield
+    timings[phase] = time.monotonic() - start
+
+
+def timed_create_connection(host: str, port: int, timeout: float, timings: PhaseTimings) -> socket.socket:
+    """Like `socket.create_connection`, but timing DNS and TCP connect separately."""
+    with timed(timings, Phase.DNS):
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+
+    with timed(timings, Phase.CONNECT):
+        errors: List[OSError] = []
+        for family, sock_type, proto, _, address in addresses:
+            sock = socket.socket(family, sock_type, proto)
+            try:
+                sock.settimeout(timeout)
+                sock.connect(address)
+                return sock
+            except OSError as e:
+                sock.close()
+                errors.append(e)
+        if len(errors) == 0:
+            raise OSError(f"No addresses found for {host}")
+        # Only local if all addresses failed locally, e.g. IPv6 addresses of
+        # a dual-stack host are unreachable on an IPv4-only network.
+        raise next((e for e in errors if classify_failure(e) == FailureKind.REMOTE), errors[-1])
+
+
+class TimedConnection(http.client.HTTPConnection):
+    """HTTP connection recording connection phases into `timings`.
+
+    Nothing is recorded when an already established connection is reused.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timings: PhaseTimings = {}
+        self.canceller: ProbeCanceller | None = None
+
+    def connect(self):
+        self.sock = timed_create_connection(self.host, self.port, self.timeout, self.timings)
+        # cancelled while connecting, before the socket could be shut down
+        if self.canceller is not None and self.canceller.cancelled:
+            raise ProbeCancelled()
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self._tunnel_host:
+            with timed(self.timings, Phase.PROXY_CONNECT):
+                self._tunnel()
+
+
+class TLSResumingConnection(TimedConnection):
+    """HTTPS connection that resumes a previous TLS session when connecting."""
+
+    default_port = http.client.HTTPS_PORT
+
+    def __init__(self, host, port, server_hostname: str, context: ssl.SSLContext,
+                 tls_session: ssl.SSLSession | None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._server_hostname = server_hostname
+        self._context = context
+        self._tls_session = tls_session
+
+    def connect(self):
+        # TCP connection and proxy CONNECT tunnel, if any
+        super().connect()
+        with timed(self.timings, Phase.TLS):
+            self.sock = self._context.wrap_socket(
+                self.sock,
+                server_hostname=self._server_hostname,
+                session=self._tls_session)
+
+
+class ProbeCancelled(Exception):
+    """Raised by probes cancelled through a `ProbeCanceller`."""
+
+
+class ProbeCanceller:
+    """Cancel probes in flight, once their result is no longer needed.
+
+    Connections are registered for the duration of a probe. Cancelling shuts
+    their sockets down, so that blocked reads and writes fail right away. A
+    TCP connect that is under way still runs until it completes or times out,
+    the probe fails right after.
+
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections: set[TimedConnection] = set()
+        self.cancelled = False
+
+    @contextmanager
+    def registered(self, conn: TimedConnection) -> Iterator[None]:
+        with self._lock:
+            if self.cancelled:
+                raise ProbeCancelled()
+            self._connections.add(conn)
+        conn.canceller = self
+        try:
+            yield
+        finally:
+            conn.canceller = None
+            with self._lock:
+                self._connections.discard(conn)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+        for conn in connections:
+            sock = conn.sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass # e.g. not connected yet, or already closed
+
+
+class ProbeTransport:
+    """Keep-alive HTTP(S) connections for URL checks.
+
+    Idle connections are pooled per (scheme, host, port) and TLS sessions are
+    resumed when a connection has to be re-established. A transport is bound to
+    a single proxy, a new one has to be created when the proxy changes.
+
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, proxy: proxy_utils.ProxyConf | None, ssl_context: ssl.SSLContext | None = None):
+        self.proxy = proxy
+        self._ssl_context = ssl_context or ssl.create_default_context()
+        self._lock = threading.Lock()
+        self._idle_connections: dict[ConnectionKey, TimedConnection] = {}
+        self._tls_sessions: dict[ConnectionKey, ssl.SSLSession] = {}
+        self._closed = False
+
+    def probe(self, check: CheckURL, timeout: float, timings: PhaseTimings,
+              canceller: ProbeCanceller | None = None):
+        """Probe the URL according to its mode, raising on failure.
+
+        Durations of the phases that completed are recorded in `timings`, even
+        if the probe fails. The probe fails with `ProbeCancelled` once
+        cancelled through `canceller`.
+        """
+        parsed = urllib.parse.urlsplit(check.url)
+        key = ConnectionKey.from_url(parsed)
+        if canceller is None:
+            canceller = ProbeCanceller()
+
+        match check.mode:
+            case ProbeMode.TCP:
+                self._connect_only(key, self._connect(key, timeout, tls=False), timings, canceller)
+
+            case ProbeMode.TLS:
+                self._connect_only(key, self._connect(key, timeout), timings, canceller)
+
+            case ProbeMode.GET | ProbeMode.HEAD:
+                method = check.mode.upper()
+                conn = self._checkout(key)
+                if conn is not None:
+                    try:
+                        self._request(key, conn, method, parsed, timeout, timings, canceller)
+                        return
+                    except (ConnectionError, ssl.SSLEOFError) as e:
+                        if canceller.cancelled:
+                            raise ProbeCancelled() from e
+                        # connection was closed by the server since it was last used
+                        debug(f"Pooled connection to {key.host} failed ({e}), reconnecting")
+
+                self._request(key, self._connect(key, timeout), method, parsed, timeout, timings, canceller)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for conn in self._idle_connections.values():
+                conn.close()
+            self._idle_connections.clear()
+
+    # Connections are established lazily, on `connect` or the first request.
+    # Without `tls`, no TLS handshake is done for https URLs.
+    def _connect(self, key: ConnectionKey, timeout: float, tls: bool = True) -> TimedConnection:
+        conn: TimedConnection
+        if self.proxy is None:
+            if key.scheme == 'https' and tls:
+                conn = TLSResumingConnection(key.host, key.port,
+                    server_hostname=key.host,
+                    tls_session=self._tls_sessions.get(key),
+                    context=self._ssl_context,
+                    timeout=timeout)
+            else:
+                conn = TimedConnection(key.host, key.port, timeout=timeout)
+        else:
+            if key.scheme == 'https' and tls:
+                conn = TLSResumingConnection(self.proxy.hostname, self.proxy.port,
+                    server_hostname=key.host,
+                    tls_session=self._tls_sessions.get(key),
+                    context=self._ssl_context,
+                    timeout=timeout)
+                conn.set_tunnel(key.host, key.port, headers=self._proxy_headers())
+            elif key.scheme == 'https':
+                conn = TimedConnection(self.proxy.hostname, self.proxy.port, timeout=timeout)
+                conn.set_tunnel(key.host, key.port, headers=self._proxy_headers())
+            else:
+                conn = TimedConnection(self.proxy.hostname, self.proxy.port, timeout=timeout)
+        return conn
+
+    def _connect_only(self, key: ConnectionKey, conn: TimedConnection, timings: PhaseTimings,
+                      canceller: ProbeCanceller):
+        conn.timings = timings
+        try:
+            with canceller.registered(conn):
+                conn.connect()
+                self._save_tls_session(key, conn)
+        finally:
+            conn.close()
+
+    def _request(self, key: ConnectionKey, conn: TimedConnection, method: str,
+                 url: urllib.parse.SplitResult, timeout: float, timings: PhaseTimings,
+                 canceller: ProbeCanceller):
+        conn.timings = timings
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+        headers = dict(CLIENT_HEADERS) # identify ourselves to server
+        if self.proxy is not None and key.scheme == 'http':
+            # plain HTTP is forwarded by the proxy, requesting the absolute URL
+            target = url.geturl()
+            headers.update(self._proxy_headers())
+        else:
+            target = urllib.parse.urlunsplit(('', '', url.path or '/', url.query, ''))
+
+        try:
+            with canceller.registered(conn):
+                # connect explicitly, so that it is not counted as TTFB
+                if conn.sock is None:
+                    conn.connect()
+                with timed(timings, Phase.TTFB):
+                    conn.request(method, target, headers=headers)
+                    # we don't care about the response code, nor do we follow redirects
+                    response = conn.getresponse()
+                response.read(MAX_DRAINED_BODY_BYTES)
+        except Exception:
+            conn.close()
+            raise
+
+        if response.isclosed() and not response.will_close:
+            self._checkin(key, conn)
+        else:
+            conn.close()
+
+    def _proxy_headers(self) -> dict[str, str]:
+        if self.proxy is not None and self.proxy.credentials is not None:
+            credentials = f"{self.proxy.credentials.username}:{self.proxy.credentials.password}"
+            return {'Proxy-Authorization': f"Basic {base64.b64encode(credentials.encode()).decode()}"}
+        else:
+            return {}
+
+    def _checkout(self, key: ConnectionKey) -> TimedConnection | None:
+        with self._lock:
+            conn = self._idle_connections.pop(key, None)
+        if conn is not None and connection_is_dropped(conn):
+            conn.close()
+            return None
+        else:
+            return conn
+
+    def _save_tls_session(self, key: ConnectionKey, conn: TimedConnection):
+        if isinstance(conn.sock, ssl.SSLSocket) and conn.sock.session is not None:
+            with self._lock:
+                self._tls_sessions[key] = conn.sock.session
+
+    def _checkin(self, key: ConnectionKey, conn: TimedConnection):
+        self._save_tls_session(key, conn)
+        with self._lock:
+            if self._closed or key in self._idle_connections:
+                conn.close()
+            else:
+                self._idle_connections[key] = conn
+
+
+def connection_is_dropped(conn: http.client.HTTPConnection) -> bool:
+    """An idle connection becomes readable when the server closes it."""
+    if conn.sock is None:
+        return True
+    readable, _, _ = select.select([conn.sock], [], [], 0)
+    return len(readable) > 0
 
 
+## Probe metrics
+
+METRICS_MEASUREMENT = "network_watchdog_probe"
+LATENCY_METRICS_MEASUREMENT = "network_watchdog_probe_latency"
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+@dataclass
+class LatencyHistogram:
+    # cumulative counts per bucket of LATENCY_BUCKETS_MS, plus one for +Inf
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    count: int = 0
+    sum_seconds: float = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if seconds * 1000 <= bound:
+                self.buckets[i] += 1
+        self.buckets[-1] += 1
+        self.count += 1
+        self.sum_seconds += seconds
+
+    def to_fields(self) -> str:
+        buckets = [f"le_{bound}ms={n}i" for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets)]
+        return ",".join([f"count={self.count}i", f"sum={self.sum_seconds}", *buckets, f"le_inf={self.buckets[-1]}i"])
+
+
+@dataclass
+class URLProbeStats:
+    successes: int = 0
+    failures: int = 0
+    latencies: dict[Phase, LatencyHistogram] = field(default_factory=dict)
+
+
+def escape_tag_value(value: str) -> str:
+    for char in ["\\", ",", "=", " "]:
+        value = value.replace(char, f"\\{char}")
+    return value
+
+
+class ProbeMetrics:
+    """Success counts and latency histograms of URL checks, per URL and phase.
+
+    Counters are cumulative since the start of the watchdog. Safe to use from
+    multiple threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, URLProbeStats] = {}
+
+    def record(self, url: str, success: bool, timings: PhaseTimings):
+        with self._lock:
+            stats = self._stats.setdefault(url, URLProbeStats())
+            if success:
+                stats.successes += 1
+            else:
+                stats.failures += 1
+            for phase, seconds in timings.items():
+                stats.latencies.setdefault(phase, LatencyHistogram()).observe(seconds)
+
+    def to_line_protocol(self, timestamp_ns: int) -> dict[str, str]:
+        """Return metrics in InfluxDB line protocol, per URL."""
+        with self._lock:
+            metrics = {}
+            for url, stats in self._stats.items():
+                tags = f"url={escape_tag_value(url)}"
+                success_ratio = stats.successes / (stats.successes + stats.failures)
+                lines = [f"{METRICS_MEASUREMENT},{tags} successes={stats.successes}i,failures={stats.failures}i,success_ratio={success_ratio} {timestamp_ns}"]
+                for phase, histogram in stats.latencies.items():
+                    lines.append(f"{LATENCY_METRICS_MEASUREMENT},{tags},phase={phase} {histogram.to_fields()} {timestamp_ns}")
+                metrics[url] = "\n".join(lines) + "\n"
+            return metrics
+
+    def send(self, port: int):
+        """Send metrics to a local UDP port, one datagram per URL."""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for url, lines in self.to_line_protocol(time.time_ns()).items():
+                try:
+                    sock.sendto(lines.encode(), ('127.0.0.1', port))
+                except OSError as e:
+                    debug(f"Failed to send metrics for {url}: {e}")
+
+
+## URL checks
+
 # returned None signals success
-def perform_single_url_check(url, timeout, proxy=None) -> None | URLCheckError:
+def perform_single_url_check(check: CheckURL, timeout, transport: ProbeTransport, metrics: ProbeMetrics | None = None,
+                             canceller: ProbeCanceller | None = None) -> None | URLCheckError:
     failure = None
-    proxies = None
-    if proxy:
-        proxies = {
-            'http': proxy.to_url(),
-            'https': proxy.to_url()
-        }
+    timings: PhaseTimings = {}
 
     try:
-        r = requests.get(url,
-                 headers=CLIENT_HEADERS, # identify ourselves to server
-                 timeout=timeout,
-                 stream=True, # avoid downloading the content, which we don't care about
-                 allow_redirects=False, # we also don't care about response code
-                 proxies=proxies)
-        r.close()
+        with timed(timings, Phase.TOTAL):
+            transport.probe(check, timeout, timings, canceller)
     except Exception as e:
-        failure = URLCheckError(url=url, reason=str(e))
+        if canceller is not None and canceller.cancelled:
+            # not a failure of the URL, nor of the network
+            debug(f"URL check for {check} cancelled")
+            return URLCheckError(url=str(check), reason="Cancelled", kind=FailureKind.REMOTE)
+        failure = URLCheckError(url=str(check), reason=str(e), kind=classify_failure(e),
+                                resolver_unavailable=is_resolver_unavailable(e))
+
+    if metrics is not None:
+        metrics.record(str(check), success=failure is None, timings=timings)
 
+    timings_brief = ", ".join([f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in timings.items()])
     if failure:
-        debug(failure)
+        debug(f"{failure} ({timings_brief})")
     else:
-        debug(f"URL check for {url} succeeded!")
+        debug(f"URL check for {check} succeeded! ({timings_brief})")
 
     return failure
 
 
 # returned None signals success
-def perform_url_checks(urls, timeout, proxy: proxy_utils.ProxyConf | None) -> None | List[URLCheckError]:
+def perform_url_checks(urls: List[CheckURL], timeout, transport: ProbeTransport, metrics: ProbeMetrics | None = None) -> None | List[URLCheckError]:
     url_queue = deque(urls)
-    errs = []
+    errs: List[URLCheckError] = []
     while url_queue:
         next_url = url_queue.popleft()
-        err = perform_single_url_check(next_url, timeout, proxy=proxy)
+        err = perform_single_url_check(next_url, timeout, transport, metrics)
 
         if err is None:
             return None
+        elif err.kind == FailureKind.LOCAL:
+            # other URLs would fail the same way
+            return errs + [err]
         else:
             errs.append(err)
             continue
@@ -104,8 +714,31 @@ def perform_url_checks(urls, timeout, proxy: proxy_utils.ProxyConf | None) -> No
     return errs
 
 
-def check_sleep(cfg):
-    time.sleep(cfg.check_interval)
+# Same contract as `perform_url_checks`, but fires all the checks at once and
+# returns as soon as the first one succeeds or fails locally. Remaining checks
+# are cancelled without being waited for, nor recorded in `metrics`. Their
+# sockets are shut down, except while still connecting, which is bounded by
+# `timeout`.
+def perform_url_checks_concurrently(urls: List[CheckURL], timeout, transport: ProbeTransport, metrics: ProbeMetrics | None = None) -> None | List[URLCheckError]:
+    executor = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix="url-check")
+    canceller = ProbeCanceller()
+    futures = {executor.submit(perform_single_url_check, url, timeout, transport, metrics, canceller): url for url in urls}
+    errs = {}
+    try:
+        for future in as_completed(futures):
+            err = future.result()
+            if err is None:
+                return None
+            else:
+                errs[futures[future]] = err
+                if err.kind == FailureKind.LOCAL:
+                    break
+    finally:
+        canceller.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # report errors in the order of the configured URLs
+    return [errs[url] for url in urls if url in errs]
 
 
 ### State ADT
@@ -114,18 +747,28 @@ class StateNames(enum.StrEnum):
     NEVER_CONNECTED = "NEVER_CONNECTED"
     ONCE_CONNECTED = "ONCE_CONNECTED"
     DISCONNECTED = "DISCONNECTED"
+    REMEDIATING = "REMEDIATING"
     SETTING_CHANGE_DELAY = "SETTING_CHANGE_DELAY"
 
 @dataclass(frozen=True)
 class StateNeverConnected():
+    failed_attempts: int = 0
+    last_failure: FailureKind | None = None
     def __str__(self):
-        return StateNames.NEVER_CONNECTED
+        if self.last_failure:
+            return f"{StateNames.NEVER_CONNECTED} (last failure = {self.last_failure})"
+        else:
+            return StateNames.NEVER_CONNECTED
 
 @dataclass(frozen=True)
 class StateOnceConnected:
     remain_attempts: int
+    last_failure: FailureKind | None = None
     def __str__(self):
-        return f"{StateNames.ONCE_CONNECTED} (remain = {self.remain_attempts})"
+        if self.last_failure:
+            return f"{StateNames.ONCE_CONNECTED} (remain = {self.remain_attempts}, last failure = {self.last_failure})"
+        else:
+            return f"{StateNames.ONCE_CONNECTED} (remain = {self.remain_attempts})"
 
 
 @dataclass(frozen=True)
@@ -134,62 +777,150 @@ class StateDisconnected:
         return StateNames.DISCONNECTED
 
 
+# Remediation step `step` (an index into cfg.remediation_steps) ran at
+# `step_started`, the first one at `started`.
+@dataclass(frozen=True)
+class StateRemediating:
+    step: int
+    started: datetime.datetime
+    step_started: datetime.datetime
+    def __str__(self):
+        return f"{StateNames.REMEDIATING} (step = {self.step + 1})"
+
+
 @dataclass(frozen=True)
 class StateSettingChangeDelay:
-    remaining_delay: datetime.timedelta
+    remaining_delay: float
     next_state: State
     def __str__(self):
         return StateNames.SETTING_CHANGE_DELAY
 
-State = StateNeverConnected | StateOnceConnected | StateDisconnected | StateSettingChangeDelay
+State = StateNeverConnected | StateOnceConnected | StateDisconnected | StateRemediating | StateSettingChangeDelay
+
+
+@dataclass(frozen=True)
+class Transition:
+    next_state: State
+    # seconds to wait before running `next_state`
+    delay: float = 0
+    # whether connman changes cut the wait short
+    interruptible: bool = True
+
+## Check intervals
+#
+# Checks are repeated quickly after a failure, back off exponentially while
+# never connected and are relaxed while connected. Jitter avoids devices behind
+# the same network from checking in lockstep.
+
+def jittered_check_interval(cfg, interval: float) -> float:
+    jitter = random.uniform(-cfg.check_interval_jitter, cfg.check_interval_jitter)
+    return min(max(interval * (1 + jitter), cfg.min_check_interval), cfg.max_check_interval)
+
+
+def backoff_check_interval(cfg, failed_attempts: int) -> float:
+    # cap before applying jitter, so that fully backed off checks are still spread out
+    interval = min(cfg.min_check_interval * 2 ** min(failed_attempts - 1, 32), cfg.max_check_interval)
+    return jittered_check_interval(cfg, interval)
 
 ## State actions
+#
+# Actions do not block, they return the next state and how long to wait before
+# running it. Waiting is left to the main loop, so that it can be interrupted by
+# connman changes.
 
-def run_state_never_connected(cfg, url_check) -> State:
-    err = url_check()
+def run_state_never_connected(cfg, err: None | List[URLCheckError], failed_attempts: int) -> Transition:
     if err is not None:
-        log(f"Check URL failed for all URLs, sleeping for {cfg.check_interval} seconds")
-        check_sleep(cfg)
-        return StateNeverConnected()
+        failed_attempts += 1
+        kind = failure_kind(err)
+        delay = backoff_check_interval(cfg, failed_attempts)
+        log(f"Check URL failed for all URLs ({kind} failure), sleeping for {delay:.1f} seconds")
+        return Transition(StateNeverConnected(failed_attempts, last_failure=kind), delay=delay)
     else:
         log("Detected a working internet connection!")
-        return StateOnceConnected(cfg.max_num_failures)
+        return Transition(StateOnceConnected(cfg.max_num_failures))
 
 
-def run_state_once_connected(cfg, url_check, remain_attempts) -> State:
-    err = url_check()
+def run_state_once_connected(cfg, err: None | List[URLCheckError], remain_attempts) -> Transition:
     if err is not None:
         remain_attempts -= 1
+        kind = failure_kind(err)
         if remain_attempts > 0:
-            log(f"Check URLs failed, remaining attempts: {remain_attempts}")
-            check_sleep(cfg)
-            return StateOnceConnected(remain_attempts)
+            log(f"Check URLs failed ({kind} failure), remaining attempts: {remain_attempts}")
+            delay = jittered_check_interval(cfg, cfg.min_check_interval)
+            return Transition(StateOnceConnected(remain_attempts, last_failure=kind), delay=delay)
 
         else:
             errs_brief = "\n".join([f"- {e.url}: {e.reason}" for e in err])
-            log(f"Check URLs failed {cfg.max_num_failures} times, internet connection considered lost.")
+            log(f"Check URLs failed {cfg.max_num_failures} times ({kind} failure), internet connection considered lost.")
             log(f"Errors from last check:\n{errs_brief}")
-            return StateDisconnected()
+            return Transition(StateDisconnected())
 
     else:
         debug("Check URL successful.")
-        check_sleep(cfg)
-        return StateOnceConnected(cfg.max_num_failures)
-
+        delay = jittered_check_interval(cfg, cfg.check_interval)
+        return Transition(StateOnceConnected(cfg.max_num_failures), delay=delay)
 
 
-def run_state_disconnected(cfg) -> State:
-    log("Restarting connman")
+def restart_connman():
     subprocess.run(CONNMAN_RESTART_COMMAND, shell=True, check=False)
 
-    return StateNeverConnected()
+
+def check_resolver(urls: List[CheckURL]):
+    for host in sorted({urllib.parse.urlsplit(url.url).hostname or "" for url in urls}):
+        started = time.monotonic()
+        try:
+            socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+            log(f"Resolved {host} in {(time.monotonic() - started) * 1000:.0f} ms")
+        except OSError as e:
+            log(f"Could not resolve {host}{' (resolver unavailable)' if is_resolver_unavailable(e) else ''}: {e}")
 
 
-def run_state_setting_change_delay(cfg, remaining_delay, next_state: State) -> State:
+def run_remediation_step(
+        cfg,
+        step: int,
+        remediate: Callable[[RemediationStep], None],
+        started: datetime.datetime,
+        now: datetime.datetime) -> Transition:
+    action = cfg.remediation_steps[step]
+    log(f"Remediation step {step + 1}/{len(cfg.remediation_steps)}: {action}")
+    step_time = time.monotonic()
+    remediate(action)
+    log(f"Remediation step {action} took {(time.monotonic() - step_time) * 1000:.0f} ms")
+
+    if step + 1 < len(cfg.remediation_steps):
+        # give connman time to settle before checking whether it helped
+        return Transition(StateRemediating(step, started, step_started=now),
+                          delay=cfg.remediation_settle_time, interruptible=False)
+    else:
+        return Transition(StateNeverConnected())
+
+
+def run_state_disconnected(cfg, remediate: Callable[[RemediationStep], None], now: datetime.datetime) -> Transition:
+    return run_remediation_step(cfg, 0, remediate, started=now, now=now)
+
+
+def run_state_remediating(
+        cfg,
+        err: None | List[URLCheckError],
+        state: StateRemediating,
+        remediate: Callable[[RemediationStep], None],
+        now: datetime.datetime) -> Transition:
+    action = cfg.remediation_steps[state.step]
+    if err is None:
+        log(f"Connectivity restored by remediation step {action} after "
+            f"{(now - state.step_started).total_seconds():.1f} seconds "
+            f"({(now - state.started).total_seconds():.1f} seconds of remediation)")
+        return Transition(StateOnceConnected(cfg.max_num_failures))
+    else:
+        log(f"Check URLs still failing ({failure_kind(err)} failure) after remediation step {action}")
+        return run_remediation_step(cfg, state.step + 1, remediate, state.started, now)
+
+
+def run_state_setting_change_delay(cfg, remaining_delay, next_state: State) -> Transition:
     sleep_seconds = math.ceil(remaining_delay)
     log(f"Sleeping for {sleep_seconds} seconds after connman setting changes")
-    time.sleep(sleep_seconds)
-    return next_state
+    # re-evaluated when the delay expires instead
+    return Transition(next_state, delay=sleep_seconds, interruptible=False)
 
 ## Connman monitor
 
@@ -201,109 +932,875 @@ class ConnmanServicePropertyChangedEvent:
     service: str
 
 
+class ConnmanChangeCoalescer:
+    """Merge bursts of connman property changes into single change events.
+
+    A roam or DHCP renewal changes many properties at once. Changes are
+    collected until none arrived for `settle_time` seconds, and reported as one
+    event dated at the first change. Ignored properties and properties set to
+    the value they already had are dropped, values being known from
+    `remember_services` or earlier changes.
+    """
+
+    def __init__(self, cfg, loop: MainLoop, on_change: Callable[[ConnmanServicePropertyChangedEvent], None]):
+        self._settle_time = cfg.connman_settle_time
+        self._ignored_properties = set(cfg.ignored_connman_properties)
+        self._loop = loop
+        self._on_change = on_change
+        self._values: dict[tuple[str, str], object] = {}
+        self._burst: List[ConnmanServicePropertyChangedEvent] = []
+        self._timer: int | None = None
+
+    def property_changed(self, service: str, name: str, value: object):
+        if name in self._ignored_properties:
+            debug(f"Ignoring connman setting ({name}) update for path ({service})")
+            return
+        if self._values.get((service, name), None) == value:
+            debug(f"Ignoring unchanged connman setting ({name}) for path ({service})")
+            return
+
+        debug(f"connman setting ({name}) change for ({service})")
+        self._values[(service, name)] = value
+        self._burst.append(ConnmanServicePropertyChangedEvent(
+            time = self._loop.now(),
+            property = name,
+            service = service,
+            value = str(value)
+        ))
+
+        if self._timer is not None:
+            self._loop.cancel(self._timer)
+        burst_seconds = (self._burst[-1].time - self._burst[0].time).total_seconds()
+        self._timer = self._loop.call_later(
+            0 if burst_seconds >= CONNMAN_MAX_BURST_SECONDS else self._settle_time,
+            self._flush)
+
+    # `services` as returned by connman's GetServices, (path, properties)
+    def remember_services(self, services):
+        for path, properties in services:
+            for name, value in properties.items():
+                self._values[(str(path), str(name))] = value
+
+    def forget_service(self, service: str):
+        for key in [key for key in self._values if key[0] == service]:
+            del self._values[key]
+
+    # connman (re)started, all values are announced again
+    def forget_values(self):
+        self._values.clear()
+
+    def _flush(self):
+        self._timer = None
+        burst, self._burst = self._burst, []
+        if len(burst) > 1:
+            debug(f"Merged {len(burst)} connman setting changes")
+        self._on_change(ConnmanServicePropertyChangedEvent(
+            time = burst[0].time,
+            property = ", ".join(dict.fromkeys(e.property for e in burst)),
+            service = ", ".join(dict.fromkeys(e.service for e in burst)),
+            value = burst[-1].value
+        ))
+
+
 class ConnmanDbusMonitor:
-    def __init__(self):
+    def __init__(self, cfg, loop: MainLoop):
+        import dbus # type: ignore
+        from dbus.mainloop.glib import DBusGMainLoop # type: ignore
+        import proxy_utils
+        from proxy_utils.failover import ProxyFailover
+        from proxy_utils.resolver import ProxyResolver
+
         DBusGMainLoop(set_as_default=True)
+        self._dbus = dbus
         self._bus = dbus.SystemBus()
-        self._thread = None
+        self._loop = loop
+        self._get_default_service = proxy_utils.get_default_service
+        # Checks the configured proxy servers in a background thread, checks
+        # pick up the fastest reachable one when they start.
+        self._proxies = ProxyFailover()
+        # Honours Excludes and PAC scripts. Check URLs share a transport, so
+        # the proxy is resolved for the first one.
+        self._make_resolver = ProxyResolver
+        self._resolver = ProxyResolver(None)
+        self._proxy_url = cfg.check_urls[0].url
+        self._on_update: Callable[[], None] = lambda: None
         self.last_update = ConnmanServicePropertyChangedEvent(
             time = datetime.datetime.fromtimestamp(0),
             property = "",
             service = "",
             value = ""
         )
-
-
-    def start_monitoring(self):
-        def monitor():
-            debug("Starting DBus monitoring thread")
-
-            self._bus.add_signal_receiver(
-                handler_function=self._mark_update,
-                bus_name='net.connman',
-                dbus_interface='net.connman.Service',
-                signal_name='PropertyChanged',
-                path_keyword='path',
-            )
-            loop = GLib.MainLoop()
-            loop.run()
-
-        thread = threading.Thread(target=monitor)
-        thread.daemon = True
-        thread.start()
-        self._thread = thread
-
-    def _mark_update(self, name, value, path=None):
-        if name in CONNMAN_SIGNAL_IGNORELIST:
-            debug(f"Ignoring connman setting ({name}) update for path ({path})")
+        self._changes = ConnmanChangeCoalescer(cfg, loop, self._mark_update)
+        # Proxy servers are only looked up again after relevant connman changes
+        self._proxy_is_stale = True
+        self.default_service: str | None = None
+
+    # Signals are dispatched by the GLib main loop, `on_update` is called from
+    # it once relevant changes have settled.
+    def start_monitoring(self, on_update: Callable[[], None]):
+        debug("Starting DBus monitoring")
+        self._on_update = on_update
+        self._bus.add_signal_receiver(
+            handler_function=self._mark_property_changed,
+            bus_name='net.connman',
+            dbus_interface='net.connman.Service',
+            signal_name='PropertyChanged',
+            path_keyword='path',
+        )
+        self._bus.add_signal_receiver(
+            handler_function=self._mark_services_changed,
+            bus_name='net.connman',
+            dbus_interface='net.connman.Manager',
+            signal_name='ServicesChanged',
+        )
+        # connman (re)started or stopped
+        self._bus.watch_name_owner('net.connman', self._mark_owner_changed)
+        # before the main loop runs, so waiting is fine
+        try:
+            services = self._connman_interface('/', 'net.connman.Manager').GetServices()
+            self.default_service = str(services[0][0]) if len(services) > 0 else None
+            self._changes.remember_services(services)
+        except self._dbus.DBusException as e:
+            log(f"Could not get the default connman service: {e}")
+
+    def _mark_owner_changed(self, owner):
+        self._invalidate_proxy()
+        self._changes.forget_values()
+        if owner:
+            self._get_services("Reading the connman services", self._changes.remember_services)
+
+    def _mark_property_changed(self, name, value, path=None):
+        if name in CONNMAN_PROXY_PROPERTIES:
+            self._invalidate_proxy()
+        self._changes.property_changed(str(path), str(name), value)
+
+    def _mark_update(self, event: ConnmanServicePropertyChangedEvent):
+        self.last_update = event
+        self._on_update()
+
+    # `changed` lists all services in order, the default one first. Wifi
+    # scans reorder the tail of the list, so only the head is relevant.
+    def _mark_services_changed(self, changed, removed):
+        for path in removed:
+            self._changes.forget_service(str(path))
+        first_service = str(changed[0][0]) if len(changed) > 0 else None
+        if first_service != self.default_service:
+            debug(f"connman default service changed to ({first_service})")
+            self.default_service = first_service
+            self._invalidate_proxy()
+
+    def _invalidate_proxy(self):
+        self._proxy_is_stale = True
+
+    def get_current_proxy(self) -> proxy_utils.ProxyConf | None:
+        if self._proxy_is_stale:
+            service = self._get_default_service(self._bus)
+            self._proxies.update(service.proxies if service else [])
+            self._resolver = self._make_resolver(service, manual=self._proxies.current)
+            self._proxy_is_stale = False
+        return self._resolver.resolve(self._proxy_url)
+
+    def recheck_proxies(self):
+        self._proxies.recheck()
+
+    def _connman_interface(self, path: str, interface: str):
+        return self._dbus.Interface(self._bus.get_object('net.connman', path), interface)
+
+    # Calls wait for connman, so they are all made with reply handlers, which
+    # keep the main loop running meanwhile. `on_services` gets the services
+    # in connman order, the default one first.
+    def _get_services(self, action: str, on_services: Callable[[list], None]):
+        self._connman_interface('/', 'net.connman.Manager').GetServices(
+            reply_handler=on_services,
+            error_handler=lambda e: log(f"{action} failed: {e}"))
+
+    def reconnect_default_service(self):
+        def on_services(services):
+            if len(services) == 0:
+                log("No connman service to reconnect")
+                return
+            path, _properties = services[0]
+            iface = self._connman_interface(path, 'net.connman.Service')
+
+            def connect(*_args):
+                iface.Connect(
+                    timeout=CONNMAN_CONNECT_TIMEOUT,
+                    reply_handler=lambda: debug(f"Reconnected {path}"),
+                    error_handler=lambda e: log(f"Reconnecting the default service failed: {e}"))
+
+            def on_disconnect_failed(e):
+                # e.g. already disconnected, connecting is what matters
+                debug(f"Disconnecting {path} failed: {e}")
+                connect()
+
+            iface.Disconnect(reply_handler=connect, error_handler=on_disconnect_failed)
+
+        self._get_services("Reconnecting the default service", on_services)
+
+    def fail_over_default_service(self):
+        def on_services(services):
+            if len(services) == 0:
+                log("No connman service to fail over from")
+                return
+            default_path, _properties = services[0]
+            for path, properties in services[1:]:
+                if properties.get('State') in ['ready', 'online']:
+                    log(f"Failing over from {default_path} to {path}")
+                    self._connman_interface(path, 'net.connman.Service').MoveBefore(
+                        default_path,
+                        reply_handler=lambda: None,
+                        error_handler=lambda e: log(f"Failing over from the default service failed: {e}"))
+                    return
+            log("No other connected connman service to fail over to")
+
+        self._get_services("Failing over from the default service", on_services)
+
+    # Powering on right after powering off may happen before the devices are
+    # down, so wait for connman to report the technology as powered off.
+    def restart_default_technology(self):
+        def on_services(services):
+            if len(services) == 0:
+                log("No connman service to restart the technology of")
+                return
+            _path, properties = services[0]
+            self._restart_technology(f"/net/connman/technology/{properties['Type']}")
+
+        self._get_services("Restarting the default service technology", on_services)
+
+    def _restart_technology(self, path: str):
+        technology = self._connman_interface(path, 'net.connman.Technology')
+        timer: int | None = None
+        done = False
+
+        # once, whichever of the handlers comes first
+        def power_on():
+            nonlocal done
+            if done:
+                return
+            done = True
+            if timer is not None:
+                self._loop.cancel(timer)
+            receiver.remove()
+            technology.SetProperty(
+                'Powered', self._dbus.Boolean(True),
+                reply_handler=lambda: debug(f"Powered on {path}"),
+                error_handler=lambda e: log(f"Powering on {path} failed: {e}"))
+
+        def on_timeout():
+            nonlocal timer
+            # fired already, must not be cancelled
+            timer = None
+            if not done:
+                log(f"{path} not reported as powered off after {CONNMAN_POWER_OFF_TIMEOUT} s, powering on")
+            power_on()
+
+        def on_property_changed(name, value):
+            if name == 'Powered' and not value:
+                power_on()
+
+        def on_power_off_failed(e):
+            # e.g. already powered off
+            log(f"Powering off {path} failed: {e}")
+            power_on()
+
+        receiver = self._bus.add_signal_receiver(
+            handler_function=on_property_changed,
+            bus_name='net.connman',
+            dbus_interface='net.connman.Technology',
+            signal_name='PropertyChanged',
+            path=path,
+        )
+        timer = self._loop.call_later(CONNMAN_POWER_OFF_TIMEOUT, on_timeout)
+        technology.SetProperty(
+            'Powered', self._dbus.Boolean(False),
+            reply_handler=lambda: debug(f"Powering off {path}"),
+            error_handler=on_power_off_failed)
+
+
+def make_url_checker(cfg, transport: ProbeTransport, metrics: ProbeMetrics):
+    def url_check() -> None | List[URLCheckError]:
+        # a proxy may be reachable on the local network without a default route
+        if transport.proxy is None and not has_default_route():
+            debug("No default route, skipping URL checks")
+            return [URLCheckError(str(url), "No default route", FailureKind.LOCAL) for url in cfg.check_urls]
+        elif cfg.concurrent_checks:
+            return perform_url_checks_concurrently(cfg.check_urls, cfg.check_url_timeout, transport, metrics)
         else:
-            debug(f"connman setting ({name}) change for ({path})")
-            self.last_update = ConnmanServicePropertyChangedEvent(
-                time = datetime.datetime.now(),
-                property = str(name),
-                service = str(path),
-                value = str(value)
-            )
-
-    def get_current_proxy(self):
-        return proxy_utils.get_current_proxy(self._bus)
+            return perform_url_checks(cfg.check_urls, cfg.check_url_timeout, transport, metrics)
 
-
-def make_url_checker(cfg, proxy: None | proxy_utils.ProxyConf):
-    return lambda: perform_url_checks(cfg.check_urls, cfg.check_url_timeout, proxy)
+    return url_check
 
 
 def override_state_if_connman_properties_changed(
         cfg,
         current_state: State,
-        last_update: ConnmanServicePropertyChangedEvent) -> State:
+        last_update: ConnmanServicePropertyChangedEvent,
+        now: datetime.datetime | None = None) -> State:
+
+    if isinstance(current_state, StateRemediating) and last_update.time >= current_state.started:
+        # caused by remediation, which waits for connman to settle anyway
+        return current_state
 
-    time_since_update = datetime.datetime.now() - last_update.time
+    time_since_update = (now or datetime.datetime.now()) - last_update.time
     remaining_delay = cfg.setting_change_delay - time_since_update.total_seconds()
 
     if remaining_delay > 0:
         # override state, because there are recent connman changes
         log("Connman service properties changed recently, overriding current state.\n" + \
            f"Last property changed: {last_update.property} for {last_update.service}")
+        if isinstance(current_state, StateNeverConnected):
+            # settings changed, start over with quick checks
+            current_state = StateNeverConnected()
         return StateSettingChangeDelay(remaining_delay, next_state=current_state)
     else:
         return current_state
 
 
-def run(cfg):
-    state = StateNeverConnected()
+## Event history
+#
+# Recent decisions of the watchdog, to look into connectivity issues of a
+# device without going through its journal.
+
+class EventHistory:
+    """Bounded buffer of events, safe to read from other threads.
+
+    Events are `(timestamp, kind, data)` tuples, kept compact as there are many.
+    """
+
+    def __init__(self, size: int):
+        self._events: deque[tuple[float, str, dict]] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, now: datetime.datetime, kind: str, **data):
+        with self._lock:
+            self._events.append((now.timestamp(), kind, data))
+
+    # Events of the last `seconds`, or all of them
+    def to_json(self, seconds: float | None = None) -> str:
+        with self._lock:
+            events = list(self._events)
+        if seconds is not None:
+            since = time.time() - seconds
+            events = [e for e in events if e[0] >= since]
+        return json.dumps([
+            {"time": datetime.datetime.fromtimestamp(timestamp).isoformat(), "kind": kind, **data}
+            for timestamp, kind, data in events
+        ])
+
+    def dump(self, directory: str) -> str:
+        path = os.path.join(directory, f"playos-network-watchdog-history-{int(time.time())}.json")
+        with open(path, "w") as f:
+            f.write(self.to_json())
+        return path
+
+    def serve(self, path: str):
+        """Serve events on a Unix socket from a background thread.
+
+        Clients may send a number of seconds on a line to only get the events
+        of that period, e.g. `echo 3600 | socat - UNIX-CONNECT:<path>`.
+        """
+        history = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            timeout = 1
+
+            def handle(self):
+                try:
+                    seconds = float(self.rfile.readline(64).strip() or "nan")
+                except (TimeoutError, ValueError):
+                    seconds = math.nan
+                self.wfile.write(history.to_json(None if math.isnan(seconds) else seconds).encode())
+
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="history", daemon=True).start()
+
+
+def describe_errors(err: None | List[URLCheckError]) -> List[dict]:
+    return [{"url": e.url, "kind": e.kind, "reason": str(e.reason)} for e in err or []]
+
+## Connectivity status
+#
+# Other components (e.g. the kiosk) follow the connectivity status of the
+# watchdog instead of probing on their own.
+
+class Connectivity(enum.StrEnum):
+    CONNECTED = "connected"
+    DISCONNECTED = "disconnected"
+    # behind a captive portal, see `portal_url`
+    CAPTIVE = "captive"
+
+
+CAPTIVE_REDIRECT_STATUSES = [
+    http.HTTPStatus.MOVED_PERMANENTLY,
+    http.HTTPStatus.FOUND,
+    http.HTTPStatus.SEE_OTHER,
+    http.HTTPStatus.TEMPORARY_REDIRECT,
+    http.HTTPStatus.PERMANENT_REDIRECT,
+]
+# known or surmised to be used by captive portals that replace page contents
+CAPTIVE_REPLACED_PAGE_STATUSES = [
+    http.HTTPStatus.OK,
+    http.HTTPStatus.UNAUTHORIZED,
+    http.HTTPStatus.PROXY_AUTHENTICATION_REQUIRED,
+    http.HTTPStatus.NETWORK_AUTHENTICATION_REQUIRED,
+]
+
+
+def find_captive_portal(url: str, timeout: float) -> str | None:
+    """Check for a captive portal, returning its URL if there is one."""
+    parsed = urllib.parse.urlsplit(url)
+    conn = http.client.HTTPConnection(parsed.hostname or "", parsed.port or 80, timeout=timeout)
+    try:
+        conn.request("GET", parsed.path or "/", headers=CLIENT_HEADERS)
+        response = conn.getresponse()
+        body = response.read(MAX_DRAINED_BODY_BYTES)
+        if response.status == http.HTTPStatus.OK and b"Open Sesame" in body:
+            return None
+        elif response.status in CAPTIVE_REDIRECT_STATUSES:
+            return response.getheader("Location", url)
+        elif response.status in CAPTIVE_REPLACED_PAGE_STATUSES:
+            return url
+        else:
+            return None
+    except (OSError, http.client.HTTPException) as e:
+        debug(f"Captive portal check failed: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+class ConnectivityBroker:
+    """Publish the connectivity status to local subscribers.
 
-    monitor = ConnmanDbusMonitor()
-    monitor.start_monitoring()
+    The status follows the checks of the watchdog. Captive portals break
+    checks, so failed checks look for one, see `Watchdog`.
 
-    while True:
-        proxy = monitor.get_current_proxy()
-        url_check = make_url_checker(cfg, proxy)
+    Subscribers get the current status as a JSON line when connecting, and a
+    line on every change. Subscribers that do not keep up are dropped rather
+    than blocking the main loop.
+    """
 
-        state = override_state_if_connman_properties_changed(cfg, state, monitor.last_update)
+    def __init__(self):
+        self._status = Connectivity.DISCONNECTED
+        self._portal_url: str | None = None
+        self._subscribers: List[socket.socket] = []
+        self._lock = threading.Lock()
 
-        debug(f"Current state: {state}")
-        match state:
-            case StateNeverConnected():
-                state = run_state_never_connected(cfg, url_check)
+    # `portal_url` is the captive portal found after a failed check
+    def handle_check(self, err: None | List[URLCheckError], portal_url: str | None = None):
+        if err is None:
+            self._publish(Connectivity.CONNECTED)
+        elif portal_url is not None:
+            self._publish(Connectivity.CAPTIVE, portal_url)
+        else:
+            self._publish(Connectivity.DISCONNECTED)
+
+    def _message(self) -> bytes:
+        return (json.dumps({"status": self._status, "portal_url": self._portal_url}) + "\n").encode()
+
+    def _publish(self, status: Connectivity, portal_url: str | None = None):
+        if (status, portal_url) == (self._status, self._portal_url):
+            return
+        log(f"Connectivity status: {status}" + (f" ({portal_url})" if portal_url else ""))
+        self._status, self._portal_url = status, portal_url
+        message = self._message()
+        with self._lock:
+            for subscriber in list(self._subscribers):
+                if not send_without_blocking(subscriber, message):
+                    debug("Dropping connectivity status subscriber that is not keeping up")
+                    self._subscribers.remove(subscriber)
+                    # ends the handler of the subscriber
+                    try:
+                        subscriber.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+    def serve(self, path: str, group: str | None = None):
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with broker._lock:
+                    if not send_without_blocking(self.request, broker._message()):
+                        return
+                    broker._subscribers.append(self.request)
+                try:
+                    # wait for the subscriber to leave
+                    while self.request.recv(64):
+                        pass
+                except OSError:
+                    pass
+                finally:
+                    with broker._lock:
+                        if self.request in broker._subscribers:
+                            broker._subscribers.remove(self.request)
+
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        server.daemon_threads = True
+        # subscribers run as other users, in `group`
+        os.chmod(path, 0o660)
+        if group is not None:
+            os.chown(path, -1, grp.getgrnam(group).gr_gid)
+        threading.Thread(target=server.serve_forever, name="status", daemon=True).start()
+
+def send_without_blocking(sock: socket.socket, message: bytes) -> bool:
+    """Send a whole message if the socket buffer has room for it."""
+    try:
+        return sock.send(message, socket.MSG_DONTWAIT) == len(message)
+    except OSError:
+        return False
 
-            case StateOnceConnected(remain_attempts):
-                state = run_state_once_connected(cfg, url_check, remain_attempts)
+## Main loop
+
+class MainLoop(Protocol):
+    def now(self) -> datetime.datetime: ...
+    def call_later(self, delay: float, callback: Callable[[], None]) -> int: ...
+    def call_repeatedly(self, interval: float, callback: Callable[[], None]) -> int: ...
+    def call_soon_threadsafe(self, callback: Callable, *args): ...
+    def cancel(self, handle: int): ...
+
+
+class ConnmanMonitor(Protocol):
+    last_update: ConnmanServicePropertyChangedEvent
+    default_service: str | None
+    def get_current_proxy(self) -> proxy_utils.ProxyConf | None: ...
+    def recheck_proxies(self): ...
+    def fail_over_default_service(self): ...
+    def reconnect_default_service(self): ...
+    def restart_default_technology(self): ...
+
+
+class GLibLoop:
+    """Schedule callbacks on the GLib main loop, which also dispatches D-Bus signals."""
+
+    def __init__(self):
+        from gi.repository import GLib # type: ignore
+        self._glib = GLib
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now()
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> int:
+        def run_once():
+            callback()
+            return self._glib.SOURCE_REMOVE
+        return self._glib.timeout_add(round(delay * 1000), run_once)
+
+    def call_repeatedly(self, interval: float, callback: Callable[[], None]) -> int:
+        def run_repeatedly():
+            callback()
+            return self._glib.SOURCE_CONTINUE
+        return self._glib.timeout_add(round(interval * 1000), run_repeatedly)
+
+    # Can be called from any thread
+    def call_soon_threadsafe(self, callback: Callable, *args):
+        def run_once():
+            callback(*args)
+            return self._glib.SOURCE_REMOVE
+        self._glib.idle_add(run_once)
+
+    def cancel(self, handle: int):
+        self._glib.source_remove(handle)
+
+    def add_signal_handler(self, signum: int, callback: Callable[[], None]):
+        def run_repeatedly():
+            callback()
+            return self._glib.SOURCE_CONTINUE
+        self._glib.unix_signal_add(self._glib.PRIORITY_DEFAULT, signum, run_repeatedly)
+
+    def run(self):
+        self._glib.MainLoop().run()
+
+
+@dataclass
+class ServiceHealth:
+    checks: int = 0
+    failed_checks: int = 0
+    last_success: datetime.datetime | None = None
+    last_failure: datetime.datetime | None = None
+
+    def record(self, err: None | List[URLCheckError], now: datetime.datetime):
+        self.checks += 1
+        if err is None:
+            self.last_success = now
+        else:
+            self.failed_checks += 1
+            self.last_failure = now
+
+    def __str__(self):
+        return f"{self.failed_checks}/{self.checks} checks failed, last success = {self.last_success}, last failure = {self.last_failure}"
+
+
+class Watchdog:
+    """Run the state machine as events of the main loop.
+
+    Timers, probe completions and connman changes are all main loop events.
+    Probes block, so they run on a worker thread and hand their result back
+    to the main loop.
+
+    Checks go through the default connman service. Each service keeps its own
+    state, so that e.g. failures over wifi do not count against ethernet once
+    it becomes the default.
+
+    Failed checks look for a captive portal as part of the probe, so that the
+    status published by `broker` follows the checks and their schedule.
+    """
+
+    def __init__(self, cfg, monitor: ConnmanMonitor, loop: MainLoop,
+                 transport: ProbeTransport, metrics: ProbeMetrics, history: EventHistory,
+                 broker: ConnectivityBroker | None = None):
+        self._cfg = cfg
+        self._monitor = monitor
+        self._loop = loop
+        self._state: State = StateNeverConnected()
+        self._service: str | None = None
+        self._service_states: dict[str | None, State] = {}
+        self._service_health: dict[str | None, ServiceHealth] = {}
+        self._timer: int | None = None
+        self._probing = False
+        self._interrupted = False
+        self._interruptible = True
+        self._transport = transport
+        self._metrics = metrics
+        self._history = history
+        self._broker = broker
+        # state, as last recorded in history
+        self._state_name = str(self._state)
+        self._state_since = loop.now()
+        self._probe_started = loop.now()
+
+    # `first_check` is a check that was started before the proxy was known
+    def start(self, first_check: Future[None | List[URLCheckError]] | None = None):
+        self._service = self._monitor.default_service
+        debug(f"Current state: {self._state}")
+        if first_check is None:
+            self._schedule(0)
+        else:
+            self._probing = True
+            self._probe_started = self._loop.now()
+            first_check.add_done_callback(
+                lambda f: self._loop.call_soon_threadsafe(self._on_first_check_done, f.result()))
+
+        if self._cfg.metrics_port:
+            self._loop.call_repeatedly(self._cfg.metrics_interval, lambda: self._metrics.send(self._cfg.metrics_port))
+
+    def _on_first_check_done(self, err: None | List[URLCheckError]):
+        if err is not None and self._transport.proxy != self._monitor.get_current_proxy():
+            self._probing = False
+            debug("First check failed without the configured proxy, checking again")
+            self._transition(Transition(StateNeverConnected()))
+        else:
+            self._on_probe_done(StateNeverConnected(), err, self._service)
+
+    def handle_connman_update(self):
+        update = self._monitor.last_update
+        self._history.record(self._loop.now(), "connman", properties=update.property, services=update.service)
+        if self._probing:
+            # apply once the running probe is done
+            self._interrupted = True
+        elif self._interruptible:
+            # interrupt any ongoing wait
+            self._schedule(0)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._loop.cancel(self._timer)
+        self._timer = self._loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._step()
+
+    def _transition(self, transition: Transition):
+        self._state = transition.next_state
+        self._interruptible = transition.interruptible
+        if self._interrupted and transition.interruptible:
+            self._schedule(0)
+        else:
+            self._schedule(transition.delay)
+        self._interrupted = False
+
+    def _follow_default_service(self):
+        service = self._monitor.default_service
+        # remediation sticks to the service it started on, failover changes it
+        if service == self._service or isinstance(self._state, StateDisconnected | StateRemediating):
+            return
+
+        state = self._state
+        if isinstance(state, StateSettingChangeDelay):
+            # re-evaluated when switching back
+            state = state.next_state
+        self._service_states[self._service] = state
+        self._state = self._service_states.pop(service, StateNeverConnected())
+        log(f"Default service changed from {self._service} to {service}, resuming its state {self._state}")
+        if service in self._service_health:
+            debug(f"History of {service}: {self._service_health[service]}")
+        self._service = service
+
+    # A failover remediation made `service` the default, the previous one is
+    # still broken. It is considered lost after another failed check, in
+    # case it becomes the default again.
+    def _follow_failover(self, service: str | None):
+        log(f"Remediation failed over from {self._service} to {service}")
+        self._service_states[self._service] = StateOnceConnected(1)
+        self._service_states.pop(service, None)
+        self._service = service
+
+    def _step(self):
+        self._follow_default_service()
+        now = self._loop.now()
+        self._state = override_state_if_connman_properties_changed(
+            self._cfg, self._state, self._monitor.last_update, now)
+
+        state_name = str(self._state)
+        debug(f"Current state: {state_name}")
+        if state_name != self._state_name:
+            self._history.record(now, "state", state=state_name, service=self._service,
+                                 previous_state=self._state_name,
+                                 previous_duration=(now - self._state_since).total_seconds())
+            self._state_since = now
+            self._state_name = state_name
+
+        match self._state:
+            case StateNeverConnected() | StateOnceConnected():
+                self._probe_started = now
+                self._start_probe(self._state)
 
             case StateDisconnected():
-                state = run_state_disconnected(cfg)
+                self._transition(run_state_disconnected(self._cfg, self._remediate, now))
+
+            case StateRemediating():
+                self._probe_started = now
+                self._start_probe(self._state)
 
             case StateSettingChangeDelay(remaining_delay, next_state):
-                state = run_state_setting_change_delay(cfg, remaining_delay, next_state)
+                self._transition(run_state_setting_change_delay(self._cfg, remaining_delay, next_state))
+
+    def _remediate(self, step: RemediationStep):
+        started = time.monotonic()
+        self._run_remediation_step(step)
+        self._history.record(self._loop.now(), "remediation", step=step, service=self._service,
+                             duration=time.monotonic() - started)
+
+    def _run_remediation_step(self, step: RemediationStep):
+        match step:
+            case RemediationStep.DNS:
+                self._transport.close()
+                self._transport = ProbeTransport(self._transport.proxy)
+                # only logged, so it does not hold up the main loop
+                threading.Thread(target=check_resolver, args=(self._cfg.check_urls,),
+                                 name="check-resolver", daemon=True).start()
+            case RemediationStep.FAILOVER:
+                self._monitor.fail_over_default_service()
+            case RemediationStep.RECONNECT:
+                self._monitor.reconnect_default_service()
+            case RemediationStep.TECHNOLOGY:
+                self._monitor.restart_default_technology()
+            case RemediationStep.RESTART:
+                restart_connman()
+
+    def _start_probe(self, state: StateNeverConnected | StateOnceConnected | StateRemediating):
+        proxy = self._monitor.get_current_proxy()
+        if proxy != self._transport.proxy:
+            log(f"Proxy changed, using {proxy.hostname}:{proxy.port}" if proxy else "Proxy changed, using none")
+            self._transport.close()
+            self._transport = ProbeTransport(proxy)
+        url_check = make_url_checker(self._cfg, self._transport, self._metrics)
+        # differs from `self._service` after a failover remediation
+        service = self._monitor.default_service
+        # behind a proxy, there is no captive portal detection
+        captive_check_url = self._cfg.captive_check_url if proxy is None else None
+
+        def probe():
+            err = url_check()
+            # captive portals break checks, look for one to tell subscribers
+            portal_url = None
+            if err is not None and captive_check_url is not None:
+                portal_url = find_captive_portal(captive_check_url, self._cfg.check_url_timeout)
+            self._loop.call_soon_threadsafe(self._on_probe_done, state, err, service, portal_url)
+
+        self._probing = True
+        threading.Thread(target=probe, name="probe", daemon=True).start()
+
+    def _on_probe_done(
+            self,
+            state: StateNeverConnected | StateOnceConnected | StateRemediating,
+            err: None | List[URLCheckError],
+            service: str | None,
+            portal_url: str | None = None):
+        self._probing = False
+        now = self._loop.now()
+        self._service_health.setdefault(service, ServiceHealth()).record(err, now)
+        self._history.record(now, "check", service=service, success=err is None,
+                             duration=(now - self._probe_started).total_seconds(), errors=describe_errors(err),
+                             portal_url=portal_url)
+        if self._broker is not None:
+            self._broker.handle_check(err, portal_url)
+        if err is not None and self._transport.proxy is not None:
+            # the proxy may have stalled, fail over to another one if configured
+            self._monitor.recheck_proxies()
+        match state:
+            case StateRemediating():
+                if err is None and service != self._service:
+                    self._follow_failover(service)
+                self._transition(run_state_remediating(self._cfg, err, state, self._remediate, self._loop.now()))
+            case StateOnceConnected(remain_attempts):
+                self._transition(run_state_once_connected(self._cfg, err, remain_attempts))
+            case StateNeverConnected(failed_attempts):
+                self._transition(run_state_never_connected(self._cfg, err, failed_attempts))
+
+
+def run(cfg, started: float):
+    transport = ProbeTransport(proxy=None)
+    metrics = ProbeMetrics()
+    history = EventHistory(cfg.history_size)
+
+    # Check right away, before D-Bus and GLib are loaded. The proxy is not
+    # known yet, so the check goes without.
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="first-check")
+    first_check = executor.submit(make_url_checker(cfg, transport, metrics))
+    # the worker thread ends once the check is done
+    executor.shutdown(wait=False)
+    first_check.add_done_callback(lambda f: log(
+        f"First check {'succeeded' if f.result() is None else 'failed'}"
+        f" {(time.monotonic() - started) * 1000:.0f} ms after startup"))
+
+    loop = GLibLoop()
+    monitor = ConnmanDbusMonitor(cfg, loop)
+    broker = ConnectivityBroker()
+    watchdog = Watchdog(cfg, monitor, loop, transport, metrics, history, broker)
+    monitor.start_monitoring(on_update=watchdog.handle_connman_update)
+    debug(f"D-Bus monitoring started {(time.monotonic() - started) * 1000:.0f} ms after startup")
+    watchdog.start(first_check)
+
+    def dump_history():
+        try:
+            log(f"Dumped event history to {history.dump(cfg.history_dump_dir)}")
+        except OSError as e:
+            log(f"Could not dump event history: {e}")
+
+    loop.add_signal_handler(signal.SIGUSR1, dump_history)
+    if cfg.history_socket:
+        history.serve(cfg.history_socket)
+    if cfg.status_socket:
+        broker.serve(cfg.status_socket, cfg.status_socket_group)
+
+    loop.run()
 
 
 def main():
+    started = time.monotonic()
     args = parse_args()
     logging.basicConfig(level=logging.INFO)
     if args.debug:
         logger.setLevel(logging.DEBUG)
 
-    run(args)
+    run(args, started)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+"""Benchmark the connman D-Bus monitor of the watchdog against a fake connman.
+
+A private bus with `proxy_utils.fake_connman.FakeConnman` stands in for the
+system bus, so this runs on a laptop without connman:
+
+    python watchdog_benchmark.py --services 100 --burst 10000
+
+Measured are the throughput of PropertyChanged signal storms through
+`ConnmanDbusMonitor`, including coalescing, and the latency of proxy lookups
+after connman changes.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import watchdog
+from proxy_utils.fake_connman import FakeConnman, fake_service
+
+
+def signal_storm(cfg, connman: FakeConnman, burst: int, name: str) -> tuple[float, int]:
+    """Time to dispatch a burst of signals, and the number of resulting updates."""
+    from gi.repository import GLib # type: ignore
+
+    loop = watchdog.GLibLoop()
+    monitor = watchdog.ConnmanDbusMonitor(cfg, loop)
+    received = 0
+    updates = 0
+
+    mark_property_changed = monitor._mark_property_changed
+    def count_signal(*args, **kwargs):
+        nonlocal received
+        received += 1
+        mark_property_changed(*args, **kwargs)
+    monitor._mark_property_changed = count_signal # type: ignore[method-assign]
+
+    def count_update():
+        nonlocal updates
+        updates += 1
+
+    monitor.start_monitoring(count_update)
+    main_loop = GLib.MainLoop()
+    elapsed = 0.0
+
+    def stop_when_done():
+        nonlocal elapsed
+        if received >= burst:
+            elapsed = time.monotonic() - started
+            # wait for coalesced updates
+            loop.call_later(cfg.connman_settle_time + 0.5, main_loop.quit)
+            return False
+        return True
+    # polled until it returns False
+    GLib.timeout_add(10, stop_when_done)
+
+    started = time.monotonic()
+    threading.Thread(target=connman.burst, args=[burst, name], daemon=True).start()
+    main_loop.run()
+    return elapsed, updates
+
+
+def proxy_lookups(cfg, count: int) -> list[float]:
+    loop = watchdog.GLibLoop()
+    monitor = watchdog.ConnmanDbusMonitor(cfg, loop)
+    durations = []
+    for _ in range(count):
+        # as after a Proxy or State change
+        monitor._invalidate_proxy()
+        started = time.monotonic()
+        monitor.get_current_proxy()
+        durations.append(time.monotonic() - started)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the watchdog connman monitor against a fake connman")
+    parser.add_argument('--services', type=int, default=100, help="Number of services, the first one online")
+    parser.add_argument('--burst', type=int, default=10_000, help="Number of PropertyChanged signals in a storm")
+    parser.add_argument('--property', default='IPv4', help="Property changed by the storm, ignored ones are only counted")
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    cfg = watchdog.parse_args([
+        '--check-url', 'https://play.dividat.com',
+        '--check-interval', '60',
+        '--max-num-failures', '3',
+        '--check-url-timeout', '5',
+        '--setting-change-delay', '300',
+    ])
+    services = [fake_service('ethernet', proxy=['proxy.dividat.com:1234'])] + \
+        [fake_service(f'wifi_{i}', state='idle') for i in range(args.services - 1)]
+
+    with FakeConnman(services) as connman:
+        elapsed, updates = signal_storm(cfg, connman, args.burst, args.property)
+        print(f"Signal storm: {args.burst} signals in {elapsed:.2f} s ({args.burst / elapsed:.0f} signals/s), "
+              f"{updates} update(s) after coalescing")
+
+        durations = proxy_lookups(cfg, args.lookups)
+        print(f"Proxy lookup with {args.services} services: median {statistics.median(durations) * 1e3:.2f} ms, "
+              f"max {max(durations) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""Replay network traces against the watchdog state machine on a virtual clock.
+
+A trace is a JSON file describing what the network did over time, in seconds
+from the start of the trace:
+
+    {
+      "duration": 3600,
+      "events": [
+        {"at": 600, "network": "down", "fixed_by": "reconnect"},
+        {"at": 1200, "network": "up"},
+        {"at": 1500, "signal": "IPv4"}
+      ]
+    }
+
+The network starts up. A `down` event starts an outage, which lasts until the
+next `up` event, or until the remediation step given in `fixed_by` or a more
+disruptive one has run. Outages are remote failures unless `"kind": "local"`
+is given. A `signal` event emits a connman PropertyChanged signal for the
+given property, with a new value unless `value` is given.
+
+Optional top-level keys are `probe_duration`, the time a successful or local
+failing probe takes (default 0.2), and `step_durations`, the time it takes
+connman to come back after each remediation step (see STEP_DURATIONS).
+Failing remote probes take the full --check-url-timeout.
+
+All arguments not known to the simulator are passed on to the watchdog:
+
+    playos-network-watchdog-simulator --trace outage.json \\
+        --check-interval 60 --max-num-failures 3 \\
+        --check-url-timeout 5 --setting-change-delay 10
+"""
+import argparse
+import datetime
+import functools
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, List
+
+import watchdog
+from watchdog import ConnmanChangeCoalescer, ConnmanServicePropertyChangedEvent, FailureKind, RemediationStep, URLCheckError
+
+EPOCH = datetime.datetime(2000, 1, 1)
+SIMULATED_SERVICE = "/net/connman/service/simulated"
+# Default time without connectivity after each remediation step
+STEP_DURATIONS = {
+    RemediationStep.DNS: 0,
+    RemediationStep.FAILOVER: 1,
+    RemediationStep.RECONNECT: 3,
+    RemediationStep.TECHNOLOGY: 5,
+    RemediationStep.RESTART: 10,
+}
+
+
+class VirtualLoop:
+    """Run main loop callbacks in order of virtual time, without waiting."""
+
+    def __init__(self):
+        self.time = 0.0
+        # `now` is called several times per callback, at the same time
+        self._now = (self.time, EPOCH)
+        self._queue: List[tuple[float, int]] = []
+        self._callbacks: dict[int, tuple[Callable[[], None], float | None]] = {}
+        self._handles = itertools.count(1)
+
+    def now(self) -> datetime.datetime:
+        if self._now[0] != self.time:
+            self._now = (self.time, EPOCH + datetime.timedelta(seconds=self.time))
+        return self._now[1]
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> int:
+        return self._add(delay, callback, interval=None)
+
+    def call_repeatedly(self, interval: float, callback: Callable[[], None]) -> int:
+        return self._add(interval, callback, interval=interval)
+
+    def call_soon_threadsafe(self, callback: Callable, *args):
+        self._add(0, lambda: callback(*args), interval=None)
+
+    def cancel(self, handle: int):
+        self._callbacks.pop(handle, None)
+
+    def _add(self, delay: float, callback: Callable[[], None], interval: float | None) -> int:
+        handle = next(self._handles)
+        self._callbacks[handle] = (callback, interval)
+        heapq.heappush(self._queue, (self.time + delay, handle))
+        return handle
+
+    def run_until(self, end: float):
+        while self._queue and self._queue[0][0] <= end:
+            at, handle = heapq.heappop(self._queue)
+            if handle not in self._callbacks:
+                # cancelled
+                continue
+            callback, interval = self._callbacks[handle]
+            if interval is None:
+                del self._callbacks[handle]
+            else:
+                heapq.heappush(self._queue, (at + interval, handle))
+            self.time = at
+            callback()
+        self.time = end
+
+
+@dataclass
+class Outage:
+    start: float
+    kind: FailureKind
+    fixed_by: RemediationStep | None
+    end: float | None = None
+    # first remediation step during the outage
+    detected_at: float | None = None
+    # first successful check after the outage
+    recovered_at: float | None = None
+
+
+class SimulatedMonitor:
+    default_service: str | None = SIMULATED_SERVICE
+
+    def __init__(self, cfg, loop: VirtualLoop):
+        self.on_update: Callable[[], None] = lambda: None
+        self.last_update = ConnmanServicePropertyChangedEvent(
+            time = datetime.datetime.fromtimestamp(0),
+            property = "",
+            service = "",
+            value = ""
+        )
+        self._changes = ConnmanChangeCoalescer(cfg, loop, self._mark_update)
+        self._values = itertools.count()
+
+    def signal(self, name: str, service: str, value: object = None):
+        self._changes.property_changed(service, name, next(self._values) if value is None else value)
+
+    def _mark_update(self, event: ConnmanServicePropertyChangedEvent):
+        self.last_update = event
+        self.on_update()
+
+    def get_current_proxy(self):
+        return None
+
+    def recheck_proxies(self):
+        pass
+
+    # remediation is simulated by SimulatedWatchdog._run_remediation_step
+
+    def fail_over_default_service(self):
+        pass
+
+    def reconnect_default_service(self):
+        pass
+
+    def restart_default_technology(self):
+        pass
+
+
+class Simulation:
+    """The network of a trace, as seen by a watchdog."""
+
+    def __init__(self, cfg, trace: dict):
+        self.loop = VirtualLoop()
+        self.monitor = SimulatedMonitor(cfg, self.loop)
+        self.outages: List[Outage] = []
+        self.steps: Counter[RemediationStep] = Counter()
+        self.spurious_steps = 0
+        self._cfg = cfg
+        self._duration = float(trace["duration"])
+        self._probe_duration = float(trace.get("probe_duration", 0.2))
+        self._step_durations = STEP_DURATIONS | {
+            RemediationStep(step): float(duration) for step, duration in trace.get("step_durations", {}).items()
+        }
+        # connman is down until then after a remediation step
+        self._back_at = 0.0
+
+        for event in trace.get("events", []):
+            self.loop.call_later(float(event["at"]), functools.partial(self._apply, event))
+
+    def _apply(self, event: dict):
+        outage = self._current_outage()
+        if event.get("network") == "down" and outage is None:
+            self.outages.append(Outage(
+                start = self.loop.time,
+                kind = FailureKind(event.get("kind", FailureKind.REMOTE)),
+                fixed_by = RemediationStep(event["fixed_by"]) if "fixed_by" in event else None
+            ))
+        elif event.get("network") == "up" and outage is not None:
+            outage.end = self.loop.time
+        elif "signal" in event:
+            self.monitor.signal(event["signal"], event.get("service", SIMULATED_SERVICE), event.get("value"))
+
+    def _current_outage(self) -> Outage | None:
+        if self.outages and self.outages[-1].end is None:
+            return self.outages[-1]
+        return None
+
+    def probe(self) -> tuple[None | List[URLCheckError], float]:
+        """Outcome and duration of a check started now."""
+        outage = self._current_outage()
+        if self.loop.time < self._back_at:
+            kind = FailureKind.LOCAL
+        elif outage is not None:
+            kind = outage.kind
+        else:
+            for past in self.outages:
+                if past.recovered_at is None:
+                    past.recovered_at = self.loop.time
+            return None, self._probe_duration
+
+        errs = [URLCheckError(str(url), "Simulated outage", kind) for url in self._cfg.check_urls]
+        duration = self._cfg.check_url_timeout if kind == FailureKind.REMOTE else self._probe_duration
+        return errs, duration
+
+    def remediate(self, step: RemediationStep):
+        self.steps[step] += 1
+        outage = self._current_outage()
+        if outage is None:
+            self.spurious_steps += 1
+        elif outage.detected_at is None:
+            outage.detected_at = self.loop.time
+
+        steps = list(RemediationStep)
+        fixes = outage is not None and outage.fixed_by is not None \
+            and steps.index(step) >= steps.index(outage.fixed_by)
+        if step == RemediationStep.DNS:
+            if fixes and outage is not None:
+                outage.end = self.loop.time
+            return
+
+        duration = self._step_durations[step]
+        self._back_at = max(self._back_at, self.loop.time + duration)
+
+        def done():
+            if fixes and outage is not None and outage.end is None:
+                outage.end = self.loop.time
+            self.monitor.signal("State", SIMULATED_SERVICE)
+
+        self.loop.call_later(duration, done)
+
+    # Probes are simulated, the transport is only there to satisfy the watchdog.
+    # It is shared per process, as creating its TLS context dominates short simulations.
+    def run(self, transport: watchdog.ProbeTransport):
+        simulated = SimulatedWatchdog(self._cfg, self, transport)
+        self.monitor.on_update = simulated.handle_connman_update
+        simulated.start()
+        self.loop.run_until(self._duration)
+
+
+class SimulatedWatchdog(watchdog.Watchdog):
+    def __init__(self, cfg, simulation: Simulation, transport: watchdog.ProbeTransport):
+        super().__init__(cfg, simulation.monitor, simulation.loop, transport,
+                         watchdog.ProbeMetrics(), watchdog.EventHistory(cfg.history_size))
+        self._simulation = simulation
+
+    def _run_remediation_step(self, step: RemediationStep):
+        self._simulation.remediate(step)
+
+    def _start_probe(self, state: watchdog.StateNeverConnected | watchdog.StateOnceConnected | watchdog.StateRemediating):
+        err, duration = self._simulation.probe()
+        self._probing = True
+        service = self._service
+        self._loop.call_later(duration, lambda: self._on_probe_done(state, err, service))
+
+
+@dataclass
+class Result:
+    outages: List[Outage]
+    steps: Counter[RemediationStep]
+    spurious_steps: int
+
+
+# Per process, see `Simulation.run`
+_transport: watchdog.ProbeTransport | None = None
+
+
+def simulate(cfg, trace: dict, seed: int) -> Result:
+    """Replay a trace in a fresh simulation, possibly in a worker process."""
+    global _transport
+    if _transport is None:
+        _transport = watchdog.ProbeTransport(proxy=None)
+    random.seed(seed)
+    simulation = Simulation(cfg, trace)
+    simulation.run(_transport)
+    return Result(simulation.outages, simulation.steps, simulation.spurious_steps)
+
+
+def summarize(values: List[float]) -> str:
+    if not values:
+        return "-"
+    return f"mean {statistics.mean(values):.1f} s, max {max(values):.1f} s"
+
+
+def report(name: str, simulations: List[Result]) -> str:
+    outages = [o for s in simulations for o in s.outages]
+    detected = [o.detected_at - o.start for o in outages if o.detected_at is not None]
+    recovered = [o.recovered_at - o.start for o in outages if o.recovered_at is not None]
+    steps = sum((s.steps for s in simulations), Counter())
+    spurious = sum(s.spurious_steps for s in simulations)
+    return "\n".join([
+        f"{name} ({len(simulations)} runs):",
+        f"  outages: {len(outages)}, detected: {len(detected)}, recovered: {len(recovered)}",
+        f"  time to detect: {summarize(detected)}",
+        f"  time to recover: {summarize(recovered)}",
+        f"  connman restarts: {steps[RemediationStep.RESTART]}",
+        f"  remediation steps: {', '.join(f'{step} {steps[step]}' for step in RemediationStep)} ({spurious} while connected)",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay network traces against the PlayOS network watchdog on a virtual clock",
+        epilog="Other arguments are passed on to the watchdog, --check-url defaults to a simulated URL"
+    )
+    parser.add_argument('--trace', dest="traces", action='append', required=True,
+                        help="JSON trace file, flag can be repeated multiple times")
+    parser.add_argument('--runs', type=int, default=1,
+                        help="Replay each trace this many times, useful with --check-interval-jitter")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first run, incremented for each next one")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help="Number of processes replaying runs in parallel (Default: number of CPUs)")
+    parser.add_argument('--verbose', action='store_true', help="Show the watchdog log")
+    args, watchdog_argv = parser.parse_known_args()
+
+    if '--check-url' not in watchdog_argv:
+        watchdog_argv += ['--check-url', 'https://simulated.invalid']
+    cfg = watchdog.parse_args(watchdog_argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if cfg.debug:
+        watchdog.logger.setLevel(logging.DEBUG)
+
+    started = time.monotonic()
+    with multiprocessing.Pool(args.jobs) as pool:
+        for path in args.traces:
+            with open(path) as f:
+                trace = json.load(f)
+            seeds = range(args.seed, args.seed + args.runs)
+            # chunks amortize sending the trace to workers
+            chunksize = max(1, args.runs // (4 * (args.jobs or 1)))
+            results = pool.starmap(simulate, [(cfg, trace, seed) for seed in seeds], chunksize=chunksize)
+            print(report(path, results))
+
+    elapsed = time.monotonic() - started
+    scenarios = len(args.traces) * args.runs
+    print(f"Simulated {scenarios} scenarios in {elapsed:.2f} s ({scenarios / elapsed:.0f} scenarios/s)")
+
+
+if __name__ == "__main__":
+    main()
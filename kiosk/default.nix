@@ -56,9 +56,7 @@ python3Packages.buildPythonApplication rec {
         qt6.qtwebchannel
       ]
       ++ (with python3Packages; [
-        dbus-python
         pyudev
-        pygobject3
         pyqt6-webengine
         requests
         playos-proxy-utils
@@ -20,7 +20,8 @@ def setChromiumFlags(max_cache_size: int):
     flags = [curFlags, disableFFmpegAllowLists, setDiskCacheSize]
     os.environ['QTWEBENGINE_CHROMIUM_FLAGS'] = " ".join(flags)
 
-def start(kiosk_url, settings_url, toggle_settings_key, max_cache_size, fullscreen = True):
+def start(kiosk_url, settings_url, toggle_settings_key, max_cache_size, fullscreen = True,
+          renderer_memory_limit = None, metrics_port = None):
 
     logging.basicConfig(level=logging.INFO)
 
@@ -34,7 +35,9 @@ def start(kiosk_url, settings_url, toggle_settings_key, max_cache_size, fullscre
         settings_url = parseUrl(settings_url),
         toggle_settings_key = QKeySequence(toggle_settings_key),
         fullscreen = fullscreen,
-        max_cache_size = max_cache_size
+        max_cache_size = max_cache_size,
+        renderer_memory_limit = renderer_memory_limit,
+        metrics_port = metrics_port
     )
 
     mainWidget.setContextMenuPolicy(Qt.ContextMenuPolicy.NoContextMenu)
@@ -14,6 +14,8 @@ from kiosk_browser.ui import DarkButton
 
 # Config
 reload_on_network_error_after = 5000 # ms
+# Retries are mostly triggered by connectivity changes, so the timer backs off up to
+reload_on_network_error_max_after = 60000 # ms
 
 """
 Webview loading status
@@ -80,9 +82,20 @@ class TimerWithTicks(QtCore.QObject):
         return self._remainingTicks * self._tickInterval
 
 
+def network_error_retry_delay(failures: int) -> int:
+    """Delay before retrying after consecutive network errors, in ms.
+
+    Doubled after each failure, starting from `reload_on_network_error_after`
+    and capped at `reload_on_network_error_max_after`.
+    """
+    delay = reload_on_network_error_after * 2 ** max(0, failures - 1)
+    return min(delay, reload_on_network_error_max_after)
+
+
 class NetworkErrorRetryWidget(QtWidgets.QWidget):
     """This widget is used when a network error occurs, it:
-        1. Manages the reload_timer while retrying
+        1. Manages the reload_timer while retrying, backing off after
+           consecutive failures
         2. Displays a reload countdown and spinner
         3. Displays the last network error details
     """
@@ -95,6 +108,7 @@ class NetworkErrorRetryWidget(QtWidgets.QWidget):
 
         super().__init__(parent)
         self._reload_timer = reload_timer
+        self._failures = 0
 
         self._retry_countdown_label = QtWidgets.QLabel(self)
         self._loading_spinner = loading_spinner()
@@ -114,11 +128,25 @@ class NetworkErrorRetryWidget(QtWidgets.QWidget):
         self._reload_timer.tick.connect(self._update_countdown)
 
     def start_reload(self):
+        """Retry after a failure, backing off further."""
+        self._failures += 1
+        return self._start_reload_timer()
+
+    def resume_reload(self):
+        """Retry after the current delay, e.g. once no longer suspended."""
+        return self._start_reload_timer()
+
+    def _start_reload_timer(self):
+        delay = network_error_retry_delay(self._failures)
         return self._reload_timer.start(
             self._tick_interval_ms,
-            (reload_on_network_error_after + self._prestart_spinner_time_ms) // self._tick_interval_ms
+            (delay + self._prestart_spinner_time_ms) // self._tick_interval_ms
         )
 
+    def reset_backoff(self):
+        """Retry after the initial delay again, e.g. once loaded or connected."""
+        self._failures = 0
+
     def _update_countdown(self, remaining_time: int):
         if remaining_time <= self._prestart_spinner_time_ms:
             self._countdown_or_spinner.setCurrentWidget(self._loading_spinner)
@@ -189,12 +217,21 @@ class ReloadHandler(QtCore.QObject):
 
 
 class BrowserWidget(QtWidgets.QWidget):
-    def __init__(self, url, get_current_proxy, parent, max_cache_size, keyboard_detector, request_network_settings):
+    """Show a web page, or a loading or network error page meanwhile.
+
+    Widgets sharing a profile, passed as `profile`, share cache, cookies and
+    local storage. Otherwise a profile is created and owned by the widget. If
+    `url` is None, nothing is loaded until `load` is called.
+    """
+
+    def __init__(self, url, get_current_proxy, parent, max_cache_size, keyboard_detector, request_network_settings,
+                 profile: QtWebEngineCore.QWebEngineProfile | None = None):
         QtWidgets.QWidget.__init__(self, parent)
         self.setStyleSheet(f"background-color: white;")
 
         self._url = url
         self._is_full_reload = False
+        self._status = Status.LOADING
 
         self._layout = QtWidgets.QHBoxLayout()
         self._layout.setContentsMargins(0, 0, 0, 0)
@@ -218,8 +255,18 @@ class BrowserWidget(QtWidgets.QWidget):
             self._network_error_retry_widget,
             request_network_settings)
 
-        self._profile = QtWebEngineCore.QWebEngineProfile("Default")
-        self._profile.setHttpCacheMaximumSize(max_cache_size)
+        if profile is None:
+            self._profile = QtWebEngineCore.QWebEngineProfile("Default")
+            self._profile.setHttpCacheMaximumSize(max_cache_size)
+
+            # Override user agent
+            self._profile.setHttpUserAgent(user_agent_with_system(
+                user_agent = self._profile.httpUserAgent(),
+                system_name = system.NAME,
+                system_version = system.VERSION
+            ))
+        else:
+            self._profile = profile
         self._webview = QtWebEngineWidgets.QWebEngineView(self._profile, self)
         self._focus_shift_script = injected_scripts.FocusShiftScript()
         self._input_with_enter_script = injected_scripts.EnableInputToggleWithEnterScript()
@@ -243,14 +290,8 @@ class BrowserWidget(QtWidgets.QWidget):
             "FocusShiftScript and PlayBridge must have the same worldId!"
         self._webview.page().setWebChannel(self._webchannel,
                                            self._play_bridge_script.worldId())
-        self._profile.scripts().insert(self._play_bridge_script)
-
-        # Override user agent
-        self._webview.page().profile().setHttpUserAgent(user_agent_with_system(
-            user_agent = self._webview.page().profile().httpUserAgent(),
-            system_name = system.NAME,
-            system_version = system.VERSION
-        ))
+        # Scripts are injected per page, as the profile may be shared
+        self._webview.page().scripts().insert(self._play_bridge_script)
 
         # Allow sound playback without user gesture
         self._webview.page().settings().setAttribute(QtWebEngineCore.QWebEngineSettings.WebAttribute.PlaybackRequiresUserGesture, False)
@@ -263,7 +304,8 @@ class BrowserWidget(QtWidgets.QWidget):
         # Load url
         self._webview.loadFinished.connect(self._load_finished)
         self._webview.page().loadingChanged.connect(self._network_error_retry_widget._loading_changed)
-        self.load(url)
+        if url is not None:
+            self.load(url)
 
     def _handle_render_process_terminated(self, termination_status, exit_code):
         is_normal_termination = termination_status == QWebEnginePage.RenderProcessTerminationStatus.NormalTerminationStatus
@@ -277,7 +319,7 @@ class BrowserWidget(QtWidgets.QWidget):
 
 
     def _toggle_script_inject(self, script: QWebEngineScript, should_enable: bool):
-        scripts = self._profile.scripts()
+        scripts = self._webview.page().scripts()
         if should_enable:
             if not scripts.contains(script):
                 scripts.insert(script)
@@ -350,6 +392,54 @@ class BrowserWidget(QtWidgets.QWidget):
         self._view(Status.LOADING)
         self._reload_timer.start(250)
 
+    def profile(self) -> QtWebEngineCore.QWebEngineProfile:
+        return self._profile
+
+    def render_process_pid(self) -> int:
+        """Pid of the renderer process of the page, 0 if there is none."""
+        return self._webview.page().renderProcessPid()
+
+    def is_loaded(self) -> bool:
+        return self._status == Status.LOADED
+
+    def suspend(self):
+        """Freeze the hidden page, keeping it loaded, until `resume` is called.
+
+        Timers and scripts of a frozen page do not run.
+        """
+        if self._reload_timer.isActive():
+            self._reload_timer.stop()
+        page = self._webview.page()
+        if page.lifecycleState() == QWebEnginePage.LifecycleState.Active:
+            page.setLifecycleState(QWebEnginePage.LifecycleState.Frozen)
+
+    def resume(self):
+        """Unfreeze the page, after it has been shown again."""
+        page = self._webview.page()
+        if page.lifecycleState() != QWebEnginePage.LifecycleState.Active:
+            page.setLifecycleState(QWebEnginePage.LifecycleState.Active)
+        if self._status == Status.NETWORK_ERROR:
+            # not another failure, the retry was only interrupted
+            self._network_error_retry_widget.resume_reload()
+
+    def retry_now(self):
+        """Retry right away if showing the network error page, e.g. after connecting.
+
+        A suspended page is retried once resumed.
+        """
+        if self._status != Status.NETWORK_ERROR:
+            return
+        self._network_error_retry_widget.reset_backoff()
+        if self._webview.page().lifecycleState() == QWebEnginePage.LifecycleState.Active:
+            logging.info("Connectivity changed, retrying to load page")
+            self.reload()
+
+    def unload(self):
+        """Release the current page, keeping the view for the next `load`."""
+        if self._reload_timer.isActive():
+            self._reload_timer.stop()
+        self._webview.setUrl(QUrl("about:blank"))
+
     def closeEvent(self, event):
         # Unset page in web view to avoid it outliving the browser profile
         self._webview.setPage(None)
@@ -366,6 +456,7 @@ class BrowserWidget(QtWidgets.QWidget):
 
         if success:
             self._view(Status.LOADED)
+            self._network_error_retry_widget.reset_backoff()
         if not success:
             self._view(Status.NETWORK_ERROR)
             self._network_error_retry_widget.start_reload()
@@ -381,6 +472,7 @@ class BrowserWidget(QtWidgets.QWidget):
             logging.info("Proxy authentication request ignored because credentials are not provided.")
 
     def _view(self, status):
+        self._status = status
         views = [ self._loading_page, self._network_error_page, self._webview ]
 
         active_view = None
@@ -1,12 +1,15 @@
 """Detect captive portals
 
-Regularly monitor the connection. Ignore captive portals if the connection is
-behind a proxy."""
+Follow the connectivity status published by the network watchdog, or
+monitor the connection if it is not available, checking again right away
+when the network changes. Ignore captive portals if the connection is behind
+a proxy."""
 
 import requests
+import json
+import socket
 import tempfile
 import threading
-import time
 import logging
 from enum import Enum, auto
 from http import HTTPStatus
@@ -17,6 +20,12 @@ import os
 from kiosk_browser.ui import DarkButton
 
 check_connection_url = os.getenv("PLAYOS_CAPTIVE_CHECK_URL", 'http://captive.dividat.com/')
+connectivity_status_socket = os.getenv("PLAYOS_CONNECTIVITY_STATUS_SOCKET", '/run/playos-network-watchdog/status.sock')
+
+# (connect, read) timeouts of connection checks, in seconds
+check_connection_timeout = (3, 5)
+# 'Open Sesame' is expected at the start of the check page
+check_connection_read_bytes = 512
 
 """
 Connection Status
@@ -29,11 +38,12 @@ class Status(Enum):
     DIRECT_CONNECTED = auto()
     PROXY = auto()
 
-def sleep(status):
+def check_interval(status):
+    """Seconds until checking the connection again, unless the network changes."""
     if status == Status.DIRECT_DISCONNECTED or status == Status.DIRECT_CAPTIVE:
-        time.sleep(5)
+        return 5
     else:
-        time.sleep(60)
+        return 60
 
 def is_redirect(status_code):
     """Check whether a status code is a redirect that is mandatorily paired with a location header."""
@@ -56,28 +66,77 @@ def is_likely_replaced_page(status_code):
 
 class CaptivePortal():
 
-    def __init__(self, get_current_proxy, show_captive_portal_message):
+    def __init__(self, get_current_proxy, show_captive_portal_message, on_connected: Callable[[], None] = lambda: None):
         self._status = Status.DIRECT_DISCONNECTED
         self._get_current_proxy = get_current_proxy
         self.show_captive_portal_message = show_captive_portal_message
+        self._on_connected = on_connected
+        self._network_changed = threading.Event()
+        self._session = requests.Session()
 
     def start_monitoring_daemon(self):
         thread = threading.Thread(target=self._check, args=[])
         thread.daemon = True
         thread.start()
 
-    def _check(self):
-        while True:
-            proxy = self._get_current_proxy()
+    def is_captive(self) -> bool:
+        return self._status == Status.DIRECT_CAPTIVE
+
+    def check_now(self):
+        """Check the connection again right away, e.g. after a connman state or proxy change.
 
-            if proxy is not None:
-                self._status = Status.PROXY
-            else:
-                try:
-                    r = requests.get(check_connection_url, allow_redirects = False)
+        Without effect while following the status of the network watchdog,
+        which watches connman itself.
+        """
+        self._network_changed.set()
 
-                    if r.status_code == HTTPStatus.OK and 'Open Sesame' in r.text:
-                        self._status = Status.DIRECT_CONNECTED
+    def _check(self):
+        while True:
+            self._follow_connectivity_status()
+            self._check_connection()
+            if self._network_changed.wait(check_interval(self._status)):
+                # Do not reuse connections of the previous network
+                self._session.close()
+            self._network_changed.clear()
+
+    def _follow_connectivity_status(self):
+        """Follow the status published by the network watchdog until it goes away."""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.connect(connectivity_status_socket)
+                for line in s.makefile('r'):
+                    self._apply_connectivity_status(json.loads(line))
+        except (OSError, ValueError) as e:
+            logging.debug('Not following connectivity status: ' + str(e))
+
+    def _set_status(self, status):
+        """Set the status, calling `on_connected` when becoming connected."""
+        if status == Status.DIRECT_CONNECTED and self._status != Status.DIRECT_CONNECTED:
+            self._on_connected()
+        self._status = status
+
+    def _apply_connectivity_status(self, message):
+        if self._get_current_proxy() is not None:
+            self._status = Status.PROXY
+        elif message['status'] == 'connected':
+            self._set_status(Status.DIRECT_CONNECTED)
+        elif message['status'] == 'captive':
+            self._status = Status.DIRECT_CAPTIVE
+            self.show_captive_portal_message(message['portal_url'])
+        else:
+            self._status = Status.DIRECT_DISCONNECTED
+
+    def _check_connection(self):
+        proxy = self._get_current_proxy()
+
+        if proxy is not None:
+            self._status = Status.PROXY
+        else:
+            try:
+                with self._session.get(check_connection_url, allow_redirects = False,
+                                       timeout = check_connection_timeout, stream = True) as r:
+                    if r.status_code == HTTPStatus.OK and b'Open Sesame' in read_start(r):
+                        self._set_status(Status.DIRECT_CONNECTED)
 
                     elif is_redirect(r.status_code):
                         self._status = Status.DIRECT_CAPTIVE
@@ -90,15 +149,26 @@ class CaptivePortal():
                     else:
                         self._status = Status.DIRECT_DISCONNECTED
 
-                except requests.exceptions.RequestException as e:
-                    self._status = Status.DIRECT_DISCONNECTED
-                    logging.error('Connection request exception: ' + str(e))
-
-                except Exception as e:
-                    self._status = Status.DIRECT_DISCONNECTED
-                    logging.error('Connection exception: ' + str(e))
-
-            sleep(self._status)
+            except requests.exceptions.RequestException as e:
+                self._status = Status.DIRECT_DISCONNECTED
+                logging.error('Connection request exception: ' + str(e))
+
+            except Exception as e:
+                self._status = Status.DIRECT_DISCONNECTED
+                logging.error('Connection exception: ' + str(e))
+
+        if self._status != Status.DIRECT_CONNECTED:
+            # Portals may intercept connections until logged in
+            self._session.close()
+
+def read_start(response: requests.Response) -> bytes:
+    """Read only the start of a streamed response body."""
+    start = b''
+    for chunk in response.iter_content(chunk_size=check_connection_read_bytes):
+        start += chunk
+        if len(start) >= check_connection_read_bytes:
+            break
+    return start[:check_connection_read_bytes]
 
 class OpenMessage(QtWidgets.QWidget):
     """ Message inviting the user to open a captive portal.
@@ -1,8 +1,8 @@
 import evdev
 import pyudev
 import logging
-import time
 import os
+import threading
 import re
 from PyQt6.QtCore import QObject, pyqtSignal, pyqtProperty
 from typing import NamedTuple, Optional
@@ -86,14 +86,68 @@ def device_is_a_keyboard(device: evdev.InputDevice) -> bool:
     return len(relevant_ev_keys) > 60
 
 
-def find_keyboard_devices() -> list[evdev.InputDevice]:
-    devices = list(map(evdev.InputDevice, evdev.list_devices()))
-    # even if nothing is plugged in, there should be at least a power button here!
-    if len(devices) == 0:
-        logging.error("No input devices found, is the current user in the `input` group?")
-        return []
-
-    return [d for d in devices if device_is_a_keyboard(d) and not device_is_blacklisted(d)]
+# Identifies a device model, regardless of its node
+class DeviceKey(NamedTuple):
+    vendor: int
+    product: int
+    name: str
+    capabilities_hash: int
+
+
+def device_key(device: evdev.InputDevice) -> DeviceKey:
+    capabilities = device.capabilities(absinfo=False)
+    return DeviceKey(
+        vendor = device.info.vendor,
+        product = device.info.product,
+        name = device.name,
+        capabilities_hash = hash(tuple(sorted((t, tuple(codes)) for t, codes in capabilities.items())))
+    )
+
+
+class KeyboardTracker:
+    """Keyboard verdicts of input device nodes, updated one node at a time.
+
+    Verdicts are cached by device model, so that replugging a device or
+    plugging an identical one does not classify it again. Devices are only
+    opened to read their identity, and closed right away.
+    """
+
+    def __init__(self):
+        # node -> (device name, is a keyboard)
+        self._nodes: dict[str, tuple[str, bool]] = {}
+        self._verdicts: dict[DeviceKey, bool] = {}
+
+    def scan(self):
+        """Classify all current device nodes."""
+        nodes = evdev.list_devices()
+        # even if nothing is plugged in, there should be at least a power button here!
+        if len(nodes) == 0:
+            logging.error("No input devices found, is the current user in the `input` group?")
+        self._nodes.clear()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        try:
+            device = evdev.InputDevice(node)
+        except OSError as e:
+            # e.g. removed in the meantime
+            logging.debug(f"Could not open input device {node}: {e}")
+            self._nodes.pop(node, None)
+            return
+        try:
+            key = device_key(device)
+            if key not in self._verdicts:
+                self._verdicts[key] = device_is_a_keyboard(device) and not device_is_blacklisted(device)
+            self._nodes[node] = (device.name, self._verdicts[key])
+        finally:
+            device.close()
+
+    def remove(self, node: str):
+        self._nodes.pop(node, None)
+
+    def keyboard_names(self) -> list[str]:
+        return [name for name, is_keyboard in self._nodes.values() if is_keyboard]
 
 
 class KeyboardDetector(QObject):
@@ -114,26 +168,61 @@ class KeyboardDetector(QObject):
             self._keyboard_available = value
             self.keyboard_available_changed.emit(self._keyboard_available)
 
+    # Time to wait for further events before updating, in seconds. Plugging in
+    # a device, or a hub, produces a burst of events.
+    settle_time = 0.2
+
     def __init__(self, parent):
         super().__init__(parent)
 
         self._keyboard_available = None
+        self._tracker = KeyboardTracker()
+        # node -> last action, waiting for events to settle
+        self._pending: dict[str, str] = {}
+        self._lock = threading.Lock()
+        # settle timers may overlap with a running update
+        self._update_lock = threading.Lock()
+        self._settle_timer: threading.Timer | None = None
 
         context = pyudev.Context()
         self._monitor = pyudev.Monitor.from_netlink(context)
         self._monitor.filter_by(subsystem='input')
 
-        # fake call to set up the initial state
-        self._observer_callback(None, None, sleep=False)
+        # set up the initial state
+        self._tracker.scan()
+        self._update()
         self._observer = pyudev.MonitorObserver(self._monitor, self._observer_callback)
         self._observer.start()
 
-    def _observer_callback(self, _action, _dev, sleep=True):
-        if sleep:
-            time.sleep(1)
-
-        keyboards = find_keyboard_devices()
-
+    def _observer_callback(self, action, device):
+        node = device.device_node
+        # only event nodes are opened with evdev, other input devices come along
+        if node is None or not os.path.basename(node).startswith('event'):
+            return
+
+        with self._lock:
+            self._pending[node] = action
+            if self._settle_timer is not None:
+                self._settle_timer.cancel()
+            self._settle_timer = threading.Timer(self.settle_time, self._apply_pending)
+            self._settle_timer.daemon = True
+            self._settle_timer.start()
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        with self._update_lock:
+            for node, action in pending.items():
+                if action == 'remove':
+                    self._tracker.remove(node)
+                else:
+                    self._tracker.add(node)
+
+            self._update()
+
+    def _update(self):
+        keyboards = self._tracker.keyboard_names()
         keyboard_available = len(keyboards) > 0
 
         if self.keyboard_available != keyboard_available:
@@ -141,6 +230,6 @@ class KeyboardDetector(QObject):
             self.keyboard_available = keyboard_available
 
             if self.keyboard_available:
-                logging.info(f"Detected keyboard devices: {", ".join([k.name for k in keyboards])}")
+                logging.info(f"Detected keyboard devices: {', '.join(keyboards)}")
             else:
                 logging.info("All keyboard devices disconnected.")
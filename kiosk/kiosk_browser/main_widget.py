@@ -8,6 +8,7 @@ from collections.abc import Callable
 from enum import StrEnum
 
 from kiosk_browser import browser_widget, captive_portal, dialogable_widget, proxy as proxy_module
+from kiosk_browser.renderer_memory import InputIdleTracker, RendererMemoryMonitor
 from kiosk_browser.keyboard_widget import KeyboardWidget
 from kiosk_browser.keyboard_detector import KeyboardDetector
 from kiosk_browser.long_press import LongPressEvents, KeyCombination
@@ -24,6 +25,18 @@ class ShortcutDef:
         return KeyCombination(name=self.name, keys=frozenset(self.keys))
 
 
+class ConnectivityEvents(QtCore.QObject):
+    """Deliver connectivity events of monitoring threads in the main thread.
+
+    Signals:
+        service_changed: The connected default service changed in connman, e.g.
+            its state turned online or its proxy changed
+        connected: The captive portal check found the connection free
+    """
+    service_changed = QtCore.pyqtSignal()
+    connected = QtCore.pyqtSignal()
+
+
 # listing only two pages, since we do not use any others currently
 class SettingsPage(StrEnum):
     HOME = "/"
@@ -36,17 +49,27 @@ class MainWidget(QtWidgets.QWidget):
     - Show settings in a dialog using a shortcut or long pressing Menu.
     - Show toolbar message when captive portal is detected, opening it in a dialog.
     - Use proxy configured in Connman.
+    - Retry loading after a network error as soon as connectivity is back.
+    - Reload the kiosk page when idle, if its renderer uses more than
+      `renderer_memory_limit` bytes.
+
+    Dialogs are shown in a second browser, sharing the profile of the kiosk
+    browser. The kiosk page stays loaded, frozen while a dialog is open.
     """
 
     def __init__(self, kiosk_url: QtCore.QUrl, settings_url: QtCore.QUrl,
-                 toggle_settings_key: str, fullscreen: bool, max_cache_size: int):
+                 toggle_settings_key: str, fullscreen: bool, max_cache_size: int,
+                 renderer_memory_limit: int | None = None, metrics_port: int | None = None):
         super(MainWidget, self).__init__()
         # Display
         self._primary_screen_con = None
         self._fullscreen = fullscreen
 
+        # Connectivity, emitted from the proxy and captive portal threads
+        self._connectivity_events = ConnectivityEvents(self)
+
         # Proxy
-        proxy = proxy_module.Proxy()
+        proxy = proxy_module.Proxy(kiosk_url.toString(), on_connected=self._connectivity_events.service_changed.emit)
         proxy.start_monitoring_daemon()
 
         # FocusObjectTracker
@@ -68,17 +91,48 @@ class MainWidget(QtWidgets.QWidget):
             max_cache_size = max_cache_size,
             keyboard_detector=self._keyboard_detector,
             request_network_settings=lambda: self._open_settings(page=SettingsPage.NETWORK))
+        self._dialog_browser_widget = browser_widget.BrowserWidget(
+            url = None,
+            get_current_proxy = proxy.get_current,
+            parent = self,
+            max_cache_size = max_cache_size,
+            keyboard_detector=self._keyboard_detector,
+            request_network_settings=lambda: self._open_settings(page=SettingsPage.NETWORK),
+            profile = self._browser_widget.profile())
         self._dialogable_browser = dialogable_widget.DialogableWidget(
             parent = self,
-            inner_widget = self._browser_widget,
+            inner_widget = self._dialog_browser_widget,
             on_close = self._close_dialog,
             keyboard_detector = self._keyboard_detector)
+        for signal in [self._connectivity_events.service_changed, self._connectivity_events.connected]:
+            signal.connect(self._browser_widget.retry_now)
+            signal.connect(self._dialog_browser_widget.retry_now)
+        self._views = QtWidgets.QStackedWidget(self)
+        self._views.addWidget(self._browser_widget)
+        self._views.addWidget(self._dialogable_browser)
+
+        # Renderer memory
+        self._renderer_memory_monitor = None
+        if renderer_memory_limit is not None:
+            self._renderer_memory_monitor = RendererMemoryMonitor(
+                get_pid = self._browser_widget.render_process_pid,
+                reload = self._browser_widget.full_reload,
+                can_reload = lambda: not self._dialogable_browser.is_decorated() and self._browser_widget.is_loaded(),
+                idle_tracker = InputIdleTracker(QApplication.instance()),
+                limit_bytes = renderer_memory_limit,
+                metrics_port = metrics_port,
+                parent = self)
+            self._renderer_memory_monitor.start()
 
         # Captive portal
         self._captive_portal_url = ''
         self._is_captive_portal_open = False
         self._captive_portal_message = captive_portal.OpenMessage(self._show_captive_portal, self)
-        self._captive_portal = captive_portal.CaptivePortal(proxy.get_current, self._show_captive_portal_message)
+        self._captive_portal = captive_portal.CaptivePortal(
+            proxy.get_current, self._show_captive_portal_message,
+            on_connected=self._connectivity_events.connected.emit)
+        self._connectivity_events.service_changed.connect(self._captive_portal.check_now)
+        self._connectivity_events.connected.connect(self._captive_portal_message.hide)
         self._captive_portal.start_monitoring_daemon()
 
         # Layout
@@ -86,7 +140,7 @@ class MainWidget(QtWidgets.QWidget):
         self._layout.setContentsMargins(0, 0, 0, 0)
         self._layout.setSpacing(0)
         self._layout.addWidget(self._captive_portal_message)
-        self._layout.addWidget(self._dialogable_browser)
+        self._layout.addWidget(self._views)
         self.setLayout(self._layout)
 
         # Application shortcuts
@@ -96,9 +150,9 @@ class MainWidget(QtWidgets.QWidget):
         # Shortcut to toggle settings (CTRL+SHIFT+12 by default)
         QtGui.QShortcut(toggle_settings_key, self).activated.connect(self._toggle_settings)
         # Shortcut to manually reload webview page
-        QtGui.QShortcut('CTRL+R', self).activated.connect(self._browser_widget.reload)
+        QtGui.QShortcut('CTRL+R', self).activated.connect(lambda: self._active_browser().reload())
         # Shortcut to perform a hard webview refresh
-        QtGui.QShortcut('CTRL+SHIFT+R', self).activated.connect(self._browser_widget.hard_refresh)
+        QtGui.QShortcut('CTRL+SHIFT+R', self).activated.connect(lambda: self._active_browser().hard_refresh())
 
         ## Remote Control long-press shortcuts
         long_press_shortcuts = [
@@ -116,13 +170,13 @@ class MainWidget(QtWidgets.QWidget):
             ShortcutDef(
                 name = "hard-refresh",
                 keys = { Qt.Key.Key_Escape, Qt.Key.Key_Down },
-                action = self._browser_widget.hard_refresh
+                action = lambda: self._active_browser().hard_refresh()
             ),
             # The DT-007c remote control has Escape+Down mapped to F20 in the firmware
             ShortcutDef(
                 name = "hard-refresh-alt",
                 keys = { Qt.Key.Key_F20 },
-                action = self._browser_widget.hard_refresh
+                action = lambda: self._active_browser().hard_refresh()
             )
         ]
 
@@ -138,6 +192,7 @@ class MainWidget(QtWidgets.QWidget):
 
 
     def closeEvent(self, event):
+        self._dialog_browser_widget.closeEvent(event)
         self._browser_widget.closeEvent(event)
         return super().closeEvent(event)
 
@@ -164,8 +219,8 @@ class MainWidget(QtWidgets.QWidget):
         path = self._settings_url.path().rstrip("/") + page
         url = QtCore.QUrl(self._settings_url)
         url.setPath(path)
-        self._browser_widget.load(url, inject_spatial_navigation_scripts=True)
-        self._dialogable_browser.decorate("System Settings")
+        self._dialog_browser_widget.load(url, inject_spatial_navigation_scripts=True)
+        self._show_dialog("System Settings")
 
 
     # Toggles setting view
@@ -184,18 +239,37 @@ class MainWidget(QtWidgets.QWidget):
     def _show_captive_portal(self):
         self._close_dialog()
         self._captive_portal_message.hide()
-        self._browser_widget.load(self._captive_portal_url,
-                                  inject_spatial_navigation_scripts=True,
-                                  inject_focus_highlight=True)
-        self._dialogable_browser.decorate("Network Login")
+        self._dialog_browser_widget.load(self._captive_portal_url,
+                                         inject_spatial_navigation_scripts=True,
+                                         inject_focus_highlight=True)
+        self._show_dialog("Network Login")
         self._is_captive_portal_open = True
 
+    def _show_dialog(self, title: str):
+        if not self._dialogable_browser.is_decorated():
+            self._dialogable_browser.decorate(title)
+            self._views.setCurrentWidget(self._dialogable_browser)
+            self._browser_widget.suspend()
+            self._dialog_browser_widget.setFocus()
+
     def _close_dialog(self):
         if self._dialogable_browser.is_decorated():
             self._dialogable_browser.undecorate()
-            self._browser_widget.load(self._kiosk_url)
+            self._views.setCurrentWidget(self._browser_widget)
+            self._browser_widget.resume()
+            self._browser_widget.setFocus()
+            self._dialog_browser_widget.unload()
             if self._is_captive_portal_open:
                 self._is_captive_portal_open = False
+                # still behind the portal, the status is only sent on changes
+                if self._captive_portal.is_captive() and not self._captive_portal_message.is_open():
+                    self._captive_portal_message.show()
+
+    def _active_browser(self) -> browser_widget.BrowserWidget:
+        if self._dialogable_browser.is_decorated():
+            return self._dialog_browser_widget
+        else:
+            return self._browser_widget
 
 
     def handle_screen_change(self, new_primary):
@@ -240,7 +314,7 @@ class MainWidget(QtWidgets.QWidget):
         if focusWidget is None:
             return False
 
-        bottom_widget = self._browser_widget
+        bottom_widget = self._active_browser()
 
         next_prev = find_next_prev_focusable_widget(focusWidget, is_forward)
 
@@ -0,0 +1,68 @@
+"""Benchmark following connman proxy changes against a fake connman.
+
+A private bus with `proxy_utils.fake_connman.FakeConnman` stands in for the
+system bus, so this runs on a laptop without connman:
+
+    python -m kiosk_browser.proxy.benchmark --services 100 --burst 10000
+
+Measured are the initial proxy lookup, and the time until a proxy change is
+applied in the Qt application, also right after a storm of unrelated signals.
+"""
+import argparse
+import statistics
+import time
+
+from PyQt6.QtNetwork import QNetworkProxy
+from proxy_utils.fake_connman import FakeConnman, fake_service
+
+from kiosk_browser.proxy.linux import Proxy
+
+KIOSK_URL = 'https://play.dividat.com'
+
+
+def proxy_settings(server: str) -> tuple:
+    return ('a{sv}', {'Method': ('s', 'manual'), 'Servers': ('as', [server]), 'Excludes': ('as', [])})
+
+
+def wait_for_application_proxy(hostname: str, timeout: float = 10) -> float:
+    started = time.monotonic()
+    while QNetworkProxy.applicationProxy().hostName() != hostname:
+        if time.monotonic() - started > timeout:
+            raise TimeoutError(f"Proxy {hostname} was not applied within {timeout} s")
+        time.sleep(0.0005)
+    return time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark kiosk proxy monitoring against a fake connman")
+    parser.add_argument('--services', type=int, default=100, help="Number of services, the first one online")
+    parser.add_argument('--changes', type=int, default=50, help="Number of proxy changes to time")
+    parser.add_argument('--burst', type=int, default=10_000, help="Number of unrelated signals before a change")
+    args = parser.parse_args()
+
+    services = [fake_service('ethernet', proxy=['proxy-0.dividat.com:3128'])] + \
+        [fake_service(f'wifi_{i}', state='idle') for i in range(args.services - 1)]
+    path = services[0][0]
+
+    with FakeConnman(services) as connman:
+        started = time.monotonic()
+        proxy = Proxy(KIOSK_URL)
+        print(f"Initial lookup with {args.services} services: {(time.monotonic() - started) * 1e3:.2f} ms")
+        proxy.start_monitoring_daemon()
+        wait_for_application_proxy('proxy-0.dividat.com')
+
+        durations = []
+        for i in range(1, args.changes + 1):
+            connman.property_changed(path, 'Proxy', proxy_settings(f'proxy-{i}.dividat.com:3128'))
+            durations.append(wait_for_application_proxy(f'proxy-{i}.dividat.com'))
+        print(f"Proxy change applied: median {statistics.median(durations) * 1e3:.2f} ms, "
+              f"max {max(durations) * 1e3:.2f} ms")
+
+        connman.burst(args.burst, 'Strength')
+        connman.property_changed(path, 'Proxy', proxy_settings('after-storm.dividat.com:3128'))
+        duration = wait_for_application_proxy('after-storm.dividat.com', timeout=60)
+        print(f"Proxy change after {args.burst} signals applied in {duration * 1e3:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
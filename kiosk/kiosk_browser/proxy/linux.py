@@ -1,13 +1,14 @@
 """Monitor proxy changes and automatically apply changes in Qt application.
 """
-import dbus
+import asyncio
 import logging
 import threading
+from collections.abc import Callable
 from PyQt6.QtNetwork import QNetworkProxy
-from dataclasses import dataclass
-from dbus.mainloop.glib import DBusGMainLoop
-from gi.repository import GLib
-from proxy_utils import get_current_proxy
+from proxy_utils import CONNECTED_STATES, Service
+from proxy_utils.aio import default_service_changes, get_default_service, open_dbus_router
+from proxy_utils.failover import ProxyFailover
+from proxy_utils.resolver import ProxyResolver
 
 
 def set_proxy_in_qt_app(hostname, port):
@@ -22,48 +23,76 @@ def set_no_proxy_in_qt_app():
     QNetworkProxy.setApplicationProxy(QNetworkProxy())
     logging.info(f"Set no proxy in Qt application")
 
+# Nothing applied in Qt application yet
+_UNSET = object()
+
 class Proxy():
+    """Proxy of the kiosk URL.
+
+    Qt WebEngine uses a single application wide proxy, so connman's Excludes
+    and PAC script are applied by resolving the proxy for the kiosk URL.
 
-    def __init__(self):
-        DBusGMainLoop(set_as_default=True)
-        self._bus = dbus.SystemBus()
-        self._proxy = get_current_proxy(self._bus)
+    `on_connected` is called from the monitoring thread whenever the default
+    service changes while connected, e.g. when its state turns online.
+    """
+
+    def __init__(self, kiosk_url: str, on_connected: Callable[[], None] = lambda: None):
+        self._kiosk_url = kiosk_url
+        self._on_connected = on_connected
+        self._service: Service | None = None
+        # With several configured proxy servers, use the fastest reachable one
+        self._failover = ProxyFailover(on_change=self._on_change)
+        self._monitoring = False
+        self._applied: object = _UNSET
+        self._update(asyncio.run(self._get_current()))
 
     def start_monitoring_daemon(self):
         """Use initial proxy in Qt application and watch for changes."""
+        self._monitoring = True
         self._use_in_qt_app()
         thread = threading.Thread(target=self._monitor, args=[])
         thread.daemon = True
         thread.start()
 
     def get_current(self):
-        return self._proxy
+        return self._resolver.resolve(self._kiosk_url)
+
+    async def _get_current(self):
+        async with open_dbus_router(bus='SYSTEM') as router:
+            return await get_default_service(router)
 
     def _monitor(self):
-        self._bus.add_signal_receiver(
-            handler_function = self._on_property_changed,
-            bus_name = 'net.connman',
-            member_keyword = 'PropertyChanged')
-
-        # Update just after monitoring is on, so that we do not miss any proxy
-        # modification that could have happen before.
-        self._update(get_current_proxy(self._bus))
-
-        loop = GLib.MainLoop()
-        loop.run()
-
-    def _on_property_changed(self, *args, **kwargs):
-        if len(args) >= 2 and args[0] == 'Proxy':
-            self._update(get_current_proxy(self._bus))
-
-    def _update(self, new_proxy):
-        """Update the proxy and use in Qt application, if the value has changed."""
-        if new_proxy != self._proxy:
-            self._proxy = new_proxy
+        asyncio.run(self._watch())
+
+    async def _watch(self):
+        async with open_dbus_router(bus='SYSTEM') as router:
+            # The first value is read just after monitoring is on, so that we
+            # do not miss any proxy modification that could have happen before.
+            async for service in default_service_changes(router):
+                previous = self._service
+                self._update(service)
+                self._use_in_qt_app()
+                if service is not None and service != previous and service.state in CONNECTED_STATES:
+                    self._on_connected()
+
+    def _update(self, service: Service | None):
+        self._service = service
+        # PAC scripts are fetched in the background, apply them once loaded
+        self._resolver = ProxyResolver(service, manual=self._failover.current,
+                                       on_pac_loaded=lambda: self._on_change(None))
+        self._failover.update(service.proxies if service else [])
+
+    def _on_change(self, _proxy):
+        """Use the new proxy in Qt application, once monitoring."""
+        if self._monitoring:
             self._use_in_qt_app()
 
     def _use_in_qt_app(self):
-        if self._proxy is not None:
-            set_proxy_in_qt_app(self._proxy.hostname, self._proxy.port)
+        proxy = self.get_current()
+        if proxy == self._applied:
+            return
+        self._applied = proxy
+        if proxy is not None:
+            set_proxy_in_qt_app(proxy.hostname, proxy.port)
         else:
             set_no_proxy_in_qt_app()
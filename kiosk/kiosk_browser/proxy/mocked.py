@@ -1,12 +1,13 @@
 """Mock proxy module for non-Linux platforms or testing."""
 
 import logging
+from collections.abc import Callable
 
 
 class Proxy:
     """Mock implementation of Proxy for platforms without D-Bus/Connman."""
 
-    def __init__(self):
+    def __init__(self, kiosk_url: str, on_connected: Callable[[], None] = lambda: None):
         logging.info("Using mock proxy - proxy monitoring disabled")
         self._proxy = None
 
@@ -0,0 +1,174 @@
+"""Watch the memory of the renderer process, reloading the page before it runs out.
+
+Renderer memory of a page running for weeks may creep up until the OOM killer
+terminates the renderer mid-session. The resident set size of the renderer is
+sampled from `/proc`, and its trend is logged and optionally sent as metrics.
+Once above a limit, a full reload is done as soon as there has been no user
+input for a while.
+"""
+import logging
+import socket
+import time
+from collections import deque
+from collections.abc import Callable
+
+from PyQt6 import QtCore
+from PyQt6.QtCore import QEvent
+
+METRICS_MEASUREMENT = "kiosk_renderer_memory"
+
+INPUT_EVENTS = {
+    QEvent.Type.KeyPress,
+    QEvent.Type.KeyRelease,
+    QEvent.Type.MouseButtonPress,
+    QEvent.Type.MouseButtonRelease,
+    QEvent.Type.MouseMove,
+    QEvent.Type.Wheel,
+    QEvent.Type.TouchBegin,
+    QEvent.Type.TouchUpdate,
+    QEvent.Type.TouchEnd,
+}
+
+
+def read_rss(pid: int) -> int | None:
+    """Resident set size of a process in bytes, None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    # e.g. "VmRSS:	  123456 kB"
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def slope(samples) -> float:
+    """Least squares slope of (time, value) samples, in value per second."""
+    if len(samples) < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in samples) / len(samples)
+    mean_v = sum(v for _, v in samples) / len(samples)
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if variance == 0:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in samples) / variance
+
+
+class InputIdleTracker(QtCore.QObject):
+    """Track the time of the last user input in the application.
+
+    Installed as event filter on the application, it sees all input events
+    without consuming them.
+    """
+
+    def __init__(self, app: QtCore.QCoreApplication):
+        super().__init__(app)
+        self._last_input = time.monotonic()
+        app.installEventFilter(self)
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self._last_input
+
+    def eventFilter(self, obj, event):
+        if event.type() in INPUT_EVENTS:
+            self._last_input = time.monotonic()
+        return False
+
+
+class RendererMemoryMonitor(QtCore.QObject):
+    """Sample the renderer memory, requesting a reload once above `limit_bytes`.
+
+    `get_pid` returns the pid of the renderer process, 0 if there is none.
+    `reload` is called once the limit is crossed and `can_reload` allows it,
+    after at least `idle_seconds` without input, and at most once per
+    `min_reload_interval_seconds`. Samples of the last `trend_window_seconds`
+    are kept to compute the growth rate.
+    """
+
+    def __init__(self, get_pid: Callable[[], int], reload: Callable[[], None],
+                 idle_tracker: InputIdleTracker, limit_bytes: int,
+                 can_reload: Callable[[], bool] = lambda: True,
+                 idle_seconds: float = 120, min_reload_interval_seconds: float = 3600,
+                 sample_interval_ms: int = 30_000,
+                 trend_window_seconds: float = 6 * 3600,
+                 metrics_port: int | None = None, parent=None):
+        super().__init__(parent)
+        self._get_pid = get_pid
+        self._reload = reload
+        self._can_reload = can_reload
+        self._idle_tracker = idle_tracker
+        self._limit_bytes = limit_bytes
+        self._idle_seconds = idle_seconds
+        self._min_reload_interval_seconds = min_reload_interval_seconds
+        self._trend_window_seconds = trend_window_seconds
+        self._metrics_port = metrics_port
+
+        self._pid = 0
+        self._samples: deque[tuple[float, int]] = deque()
+        self._reload_pending = False
+        self._reloads = 0
+        self._last_reload: float | None = None
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(sample_interval_ms)
+        self._timer.timeout.connect(self.sample)
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def trend(self) -> float:
+        """Growth of the renderer memory, in bytes per hour."""
+        return slope(self._samples) * 3600
+
+    def sample(self):
+        pid = self._get_pid()
+        if pid != self._pid:
+            # New renderer, e.g. after a reload or a crash
+            self._pid = pid
+            self._samples.clear()
+        rss = read_rss(pid) if pid > 0 else None
+        if rss is None:
+            return
+
+        now = time.monotonic()
+        self._samples.append((now, rss))
+        while self._samples[0][0] < now - self._trend_window_seconds:
+            self._samples.popleft()
+        trend = self.trend()
+        logging.debug(f"Renderer {pid} RSS: {rss / 2**20:.0f} MiB, trend {trend / 2**20:+.1f} MiB/h")
+        if self._metrics_port is not None:
+            self._send_metrics(rss, trend)
+
+        if rss > self._limit_bytes and not self._reload_pending:
+            logging.warning(f"Renderer {pid} RSS of {rss / 2**20:.0f} MiB above limit of "
+                            f"{self._limit_bytes / 2**20:.0f} MiB (trend {trend / 2**20:+.1f} MiB/h), "
+                            f"reloading after {self._idle_seconds:.0f} s without input")
+            self._reload_pending = True
+
+        if self._reload_pending:
+            self._reload_when_idle()
+
+    def _reload_when_idle(self):
+        if self._idle_tracker.idle_seconds() < self._idle_seconds or not self._can_reload():
+            return
+        now = time.monotonic()
+        if self._last_reload is not None and now - self._last_reload < self._min_reload_interval_seconds:
+            return
+        logging.info("Reloading page to release renderer memory")
+        self._reload_pending = False
+        self._reloads += 1
+        self._last_reload = now
+        self._samples.clear()
+        self._reload()
+
+    def _send_metrics(self, rss: int, trend: float):
+        line = f"{METRICS_MEASUREMENT} rss={rss}i,trend={trend},reloads={self._reloads}i {time.time_ns()}\n"
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            try:
+                sock.sendto(line.encode(), ('127.0.0.1', self._metrics_port))
+            except OSError as e:
+                logging.debug(f"Failed to send renderer metrics: {e}")
@@ -0,0 +1,33 @@
+from kiosk_browser.browser_widget import NetworkErrorRetryWidget, TimerWithTicks, network_error_retry_delay, \
+    reload_on_network_error_after, reload_on_network_error_max_after
+
+
+def test_retry_delay_backs_off():
+    delays = [network_error_retry_delay(failures) for failures in range(1, 5)]
+    assert delays[0] == reload_on_network_error_after
+    assert delays == sorted(delays)
+    assert delays[1] == 2 * delays[0]
+
+
+def test_retry_delay_is_capped():
+    assert network_error_retry_delay(100) == reload_on_network_error_max_after
+
+
+class TestNetworkErrorRetryWidget:
+    def test_resuming_does_not_back_off(self, qtbot):
+        timer = TimerWithTicks()
+        widget = NetworkErrorRetryWidget(timer)
+        qtbot.addWidget(widget)
+
+        widget.start_reload()
+        first_delay = timer.remainingTime()
+        for _ in range(3):
+            # e.g. suspended while a dialog is open
+            timer.stop()
+            widget.resume_reload()
+            assert timer.remainingTime() == first_delay
+        timer.stop()
+
+        widget.start_reload()
+        assert timer.remainingTime() > first_delay
+        timer.stop()
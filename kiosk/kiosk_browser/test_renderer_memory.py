@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from kiosk_browser import renderer_memory
+from kiosk_browser.renderer_memory import RendererMemoryMonitor, read_rss, slope
+
+
+class FakeIdleTracker:
+    def __init__(self, idle_seconds):
+        self.idle = idle_seconds
+
+    def idle_seconds(self):
+        return self.idle
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Renderer RSS in bytes, as read from /proc."""
+    value = {'bytes': 0}
+    monkeypatch.setattr(renderer_memory, 'read_rss', lambda pid: value['bytes'])
+    return value
+
+
+def make_monitor(tracker, reloads, limit_bytes=1000, can_reload=lambda: True):
+    return RendererMemoryMonitor(
+        get_pid=lambda: 42,
+        reload=lambda: reloads.append(True),
+        idle_tracker=tracker,
+        limit_bytes=limit_bytes,
+        can_reload=can_reload,
+        idle_seconds=60)
+
+
+def test_read_rss_of_own_process():
+    rss = read_rss(os.getpid())
+    assert rss is not None and rss > 0
+
+
+def test_read_rss_of_missing_process():
+    assert read_rss(0) is None
+
+
+def test_slope():
+    assert slope([]) == 0.0
+    assert slope([(0, 100)]) == 0.0
+    assert slope([(0, 100), (10, 200), (20, 300)]) == pytest.approx(10)
+
+
+class TestRendererMemoryMonitor:
+    def test_no_reload_below_limit(self, qtbot, rss):
+        reloads = []
+        monitor = make_monitor(FakeIdleTracker(3600), reloads)
+        rss['bytes'] = 999
+        monitor.sample()
+        assert reloads == []
+
+    def test_reload_waits_for_idle(self, qtbot, rss):
+        reloads = []
+        tracker = FakeIdleTracker(10)
+        monitor = make_monitor(tracker, reloads)
+        rss['bytes'] = 2000
+        monitor.sample()
+        assert reloads == []
+
+        # pending reload is done once idle, even if memory dropped meanwhile
+        tracker.idle = 120
+        rss['bytes'] = 500
+        monitor.sample()
+        assert reloads == [True]
+
+    def test_reload_waits_until_allowed(self, qtbot, rss):
+        reloads = []
+        allowed = False
+        monitor = make_monitor(FakeIdleTracker(120), reloads, can_reload=lambda: allowed)
+        rss['bytes'] = 2000
+        monitor.sample()
+        assert reloads == []
+
+        allowed = True
+        monitor.sample()
+        assert reloads == [True]
+
+    def test_reloads_at_most_once_per_interval(self, qtbot, rss):
+        reloads = []
+        monitor = make_monitor(FakeIdleTracker(120), reloads)
+        rss['bytes'] = 2000
+        monitor.sample()
+        monitor.sample()
+        assert reloads == [True]
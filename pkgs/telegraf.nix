@@ -17,11 +17,14 @@ let
     "inputs.procstat"
     "inputs.system"
     "inputs.sensors"
+    "inputs.socket_listener"
     "inputs.systemd_units"
     "inputs.wireless"
 
     "outputs.influxdb"
 
+    "parsers.influx"
+
     "processors.strings"
     ];
 in
@@ -18,6 +18,7 @@ python3Packages.buildPythonPackage rec {
         ruff
         mypy
         pytest
+        pkgs.dbus # dbus-daemon for fake_connman
     ];
 
     checkPhase = ''
@@ -42,5 +43,7 @@ python3Packages.buildPythonPackage rec {
     propagatedBuildInputs = with python3Packages; [
         dbus-python
         pygobject3
+        jeepney
+        dukpy
     ];
 }
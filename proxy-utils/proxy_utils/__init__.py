@@ -5,11 +5,16 @@ from connman service properties via DBus.
 The main entrypoint is `get_current_proxy`. The caller is expected
 to set up a DBus system session, see `kiosk_browser/proxy.py` or `wachdog.py` for
 examples.
+
+When several proxy servers are configured, `get_current_proxies` lists all of
+them and `failover.ProxyFailover` picks the fastest reachable one. To honour
+`Excludes` and PAC scripts, resolve the proxy per URL with `resolver.ProxyResolver`.
 """
 from urllib.parse import quote, unquote, urlparse
 import dbus # type: ignore
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import List
 
 @dataclass
 class Credentials:
@@ -36,25 +41,109 @@ class ProxyConf:
 class Service:
     state: str
     proxy: ProxyConf | None
+    # All configured proxy servers, in configured order
+    proxies: List[ProxyConf] = field(default_factory=list)
+    # Hosts accessed directly with the manual proxy method
+    excludes: List[str] = field(default_factory=list)
+    # PAC script URL of the auto proxy method
+    pac_url: str | None = None
 
-def parse_service(service: dbus.Struct) -> Service | None:
+# States of services that may be the default service
+CONNECTED_STATES = ['online', 'ready']
+
+class ServiceSnapshot:
+    """A service of `GetServices`, decoding its proxy settings on first access.
+
+    Reading `state` is cheap, so services can be skipped without decoding them.
+    """
+    __slots__ = ('path', 'state', '_properties', '_proxies', '_excludes', '_pac_url')
+
+    def __init__(self, path: str, properties: dbus.Dictionary):
+        self.path = path
+        self.state = properties['State']
+        self._properties = properties
+        self._proxies: List[ProxyConf] | None = None
+        self._excludes: List[str] = []
+        self._pac_url: str | None = None
+
+    @property
+    def proxy(self) -> ProxyConf | None:
+        proxies = self.proxies
+        return proxies[0] if proxies else None
+
+    @property
+    def proxies(self) -> List[ProxyConf]:
+        return self._decode()
+
+    @property
+    def excludes(self) -> List[str]:
+        self._decode()
+        return self._excludes
+
+    @property
+    def pac_url(self) -> str | None:
+        self._decode()
+        return self._pac_url
+
+    def _decode(self) -> List[ProxyConf]:
+        if self._proxies is None:
+            self._proxies = extract_manual_proxies(self._properties)
+            self._excludes = extract_excludes(self._properties)
+            self._pac_url = extract_pac_url(self._properties)
+        return self._proxies
+
+    def to_service(self) -> Service:
+        return Service(self.state, self.proxy, self.proxies, self.excludes, self.pac_url)
+
+def snapshot_service(service: dbus.Struct) -> ServiceSnapshot | None:
     if len(service) >= 2 and 'State' in service[1]:
-        return Service(service[1]['State'], extract_manual_proxy(service[1]))
+        return ServiceSnapshot(service[0], service[1])
     else:
         return None
 
+def parse_service(service: dbus.Struct) -> Service | None:
+    snapshot = snapshot_service(service)
+    return snapshot.to_service() if snapshot else None
+
+def find_default_service(services) -> ServiceSnapshot | None:
+    """Find the first connected or ready service of `GetServices`.
+
+    The service with the default route will always be sorted at the top of the
+    list (from connman doc/overview-api.txt). Services after it are not looked at.
+    """
+    for service in services:
+        snapshot = snapshot_service(service)
+        if snapshot is not None and snapshot.state in CONNECTED_STATES:
+            return snapshot
+    return None
+
 def extract_manual_proxy(service_conf: dbus.Dictionary) -> ProxyConf | None:
+    proxies = extract_manual_proxies(service_conf)
+    return proxies[0] if proxies else None
+
+def extract_manual_proxies(service_conf: dbus.Dictionary) -> List[ProxyConf]:
+    """Parse all servers of a manual proxy configuration, skipping invalid ones."""
     if 'Proxy' in service_conf:
         proxy = service_conf['Proxy']
-        if 'Method' in proxy and 'Servers' in proxy:
-            method = proxy['Method']
-            servers = proxy['Servers']
-            if method == 'manual' and len(servers) >= 1:
-                return parse_proxy_url(servers[0])
-            else:
-                return None
+        if 'Method' in proxy and 'Servers' in proxy and proxy['Method'] == 'manual':
+            parsed = [parse_proxy_url(server) for server in proxy['Servers']]
+            return [p for p in parsed if p is not None]
         else:
-            return None
+            return []
+    else:
+        return []
+
+def extract_excludes(service_conf: dbus.Dictionary) -> List[str]:
+    proxy = service_conf.get('Proxy', {})
+    if proxy.get('Method') == 'manual':
+        return [str(host) for host in proxy.get('Excludes', [])]
+    else:
+        return []
+
+def extract_pac_url(service_conf: dbus.Dictionary) -> str | None:
+    proxy = service_conf.get('Proxy', {})
+    if proxy.get('Method') == 'auto' and proxy.get('URL'):
+        return str(proxy['URL'])
     else:
         return None
 
@@ -89,23 +178,27 @@ def get_current_proxy(bus) -> ProxyConf | None:
 
     Return None if Connman is not installed (DBusException).
     """
+    default_service = get_default_snapshot(bus)
+    return default_service.proxy if default_service else None
 
+def get_current_proxies(bus) -> List[ProxyConf]:
+    """Get all proxy servers of the current service, see `get_current_proxy`."""
+    default_service = get_default_snapshot(bus)
+    return default_service.proxies if default_service else []
+
+def get_default_service(bus) -> Service | None:
+    """Get the first connected or ready service from dbus, if any."""
+    default_service = get_default_snapshot(bus)
+    return default_service.to_service() if default_service else None
+
+def get_default_snapshot(bus) -> ServiceSnapshot | None:
     try:
         client = dbus.Interface(
             bus.get_object('net.connman', '/'),
             'net.connman.Manager')
 
         # List services, each service is a (id, properties) struct
-        services = [parse_service(s) for s in client.GetServices()]
-
-        # The service with the default route will always be sorted at the top of
-        # the list. (From connman doc/overview-api.txt)
-        default_service = find(lambda s: s.state in ['online', 'ready'], services)
-
-        if default_service:
-            return default_service.proxy
-        else:
-            return None
+        return find_default_service(client.GetServices())
 
     except dbus.exceptions.DBusException:
         return None
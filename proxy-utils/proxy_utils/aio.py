@@ -0,0 +1,158 @@
+"""
+Asyncio variant of the `proxy_utils` API, talking to connman with jeepney, a
+pure-Python D-Bus implementation.
+
+Results are the same `Service` and `ProxyConf` values as with the dbus-python
+based API, but no GLib main loop is needed:
+
+    async with open_dbus_router(bus='SYSTEM') as router:
+        async for proxy in proxy_changes(router):
+            ...
+"""
+import asyncio
+from contextlib import ExitStack
+from typing import AsyncIterator, Callable, List, TypeVar
+from jeepney import DBusAddress, DBusErrorResponse, MatchRule, new_method_call # type: ignore
+from jeepney.low_level import HeaderFields # type: ignore
+from jeepney.wrappers import unwrap_msg # type: ignore
+from jeepney.bus_messages import message_bus # type: ignore
+from jeepney.io.asyncio import DBusRouter, Proxy, open_dbus_router # type: ignore
+
+from proxy_utils import CONNECTED_STATES, ProxyConf, Service, find, parse_service
+
+__all__ = [
+    "open_dbus_router", "get_services", "get_default_service", "get_current_proxy", "get_current_proxies",
+    "proxy_changes", "proxies_changes", "default_service_changes"
+]
+
+CONNMAN_MANAGER = DBusAddress('/', bus_name='net.connman', interface='net.connman.Manager')
+
+# Properties of the services that the current proxy depends on
+PROXY_PROPERTIES = ['Proxy', 'State']
+
+def connman_owner_changed_rule() -> MatchRule:
+    rule = MatchRule(type='signal', sender='org.freedesktop.DBus', interface='org.freedesktop.DBus',
+                     member='NameOwnerChanged', path='/org/freedesktop/DBus')
+    rule.add_arg_condition(0, 'net.connman')
+    return rule
+
+SIGNAL_RULES = [
+    MatchRule(type='signal', interface='net.connman.Service', member='PropertyChanged'),
+    # the default service may change
+    MatchRule(type='signal', interface='net.connman.Manager', member='ServicesChanged'),
+    # connman (re)started or stopped
+    connman_owner_changed_rule(),
+]
+
+def unwrap_variant(variant):
+    """Unwrap a jeepney variant, a (signature, value) tuple, and nested ones."""
+    signature, value = variant
+    if signature == 'a{sv}':
+        return {k: unwrap_variant(v) for k, v in value.items()}
+    else:
+        return value
+
+async def get_services(router: DBusRouter) -> List[Service | None]:
+    """List services as `parse_service` does, in connman order."""
+    services = await get_raw_services(router)
+    return [parse_service((path, unwrap_variant(('a{sv}', properties)))) for path, properties in services]
+
+async def get_raw_services(router: DBusRouter) -> list:
+    """List services as (path, properties) with the property values still wrapped."""
+    reply = await router.send_and_get_reply(new_method_call(CONNMAN_MANAGER, 'GetServices'))
+    (services,) = unwrap_msg(reply)
+    return services
+
+async def get_default_service(router: DBusRouter) -> Service | None:
+    """Get the first connected or ready service, None if Connman is not available."""
+    try:
+        services = await get_raw_services(router)
+    except DBusErrorResponse:
+        return None
+    return _find_default_service(services)
+
+def _find_default_service(services: list) -> Service | None:
+    """Find the first connected or ready service in raw services, see `get_raw_services`."""
+    # only the default service is unwrapped
+    default_service = find(lambda s: s[1].get('State', ('s', None))[1] in CONNECTED_STATES, services)
+    if default_service is None:
+        return None
+    path, properties = default_service
+    return parse_service((path, unwrap_variant(('a{sv}', properties))))
+
+async def get_current_proxy(router: DBusRouter) -> ProxyConf | None:
+    """Get current proxy, see `proxy_utils.get_current_proxy`.
+
+    Return None if Connman is not available.
+    """
+    default_service = await get_default_service(router)
+    return default_service.proxy if default_service else None
+
+async def get_current_proxies(router: DBusRouter) -> List[ProxyConf]:
+    """Get all proxy servers of the current service, see `get_current_proxy`."""
+    default_service = await get_default_service(router)
+    return default_service.proxies if default_service else []
+
+def proxy_changes(router: DBusRouter) -> AsyncIterator[ProxyConf | None]:
+    """Yield the current proxy, and then the proxy whenever it changes."""
+    return _changes(router, lambda services: _proxy(_find_default_service(services)))
+
+def proxies_changes(router: DBusRouter) -> AsyncIterator[List[ProxyConf]]:
+    """Yield all current proxy servers, and then whenever they change."""
+    return _changes(router, lambda services: _proxies(_find_default_service(services)))
+
+def default_service_changes(router: DBusRouter) -> AsyncIterator[Service | None]:
+    """Yield the current service, and then whenever it or its properties change."""
+    return _changes(router, _find_default_service)
+
+def _proxy(service: Service | None) -> ProxyConf | None:
+    return service.proxy if service else None
+
+def _proxies(service: Service | None) -> List[ProxyConf]:
+    return service.proxies if service else []
+
+T = TypeVar('T')
+
+async def _get_raw_services_or_none(router: DBusRouter) -> list:
+    try:
+        return await get_raw_services(router)
+    except DBusErrorResponse:
+        # connman is not available
+        return []
+
+# Services are fetched once, and then kept up to date from the signals, in
+# `GetServices` order. `ServicesChanged` lists all services in order, with
+# properties only for new or changed ones.
+async def _changes(router: DBusRouter, get: Callable[[list], T]) -> AsyncIterator[T]:
+    signals: asyncio.Queue = asyncio.Queue()
+    with ExitStack() as stack:
+        for rule in SIGNAL_RULES:
+            await Proxy(message_bus, router).AddMatch(rule)
+            stack.enter_context(router.filter(rule, queue=signals))
+
+        # read only after subscribing, so that no change is missed
+        services = dict(await _get_raw_services_or_none(router))
+        value = get(list(services.items()))
+        yield value
+
+        while True:
+            signal = await signals.get()
+            member = signal.header.fields.get(HeaderFields.member)
+            if member == 'NameOwnerChanged':
+                services = dict(await _get_raw_services_or_none(router))
+            elif member == 'ServicesChanged':
+                changed, removed = signal.body
+                services = {path: {**services.get(path, {}), **properties}
+                            for path, properties in changed if path not in removed}
+            else:
+                name, variant = signal.body
+                path = signal.header.fields.get(HeaderFields.path)
+                if path in services:
+                    services[path][name] = variant
+                if name not in PROXY_PROPERTIES:
+                    continue
+
+            new_value = get(list(services.items()))
+            if new_value != value:
+                value = new_value
+                yield value
@@ -0,0 +1,122 @@
+"""
+Microbenchmark of finding the current proxy in `GetServices` payloads.
+
+Synthetic payloads of wifi services are built like connman returns them, the
+connected service first, followed by services seen in scans. Looking up the
+proxy by parsing every service is compared with stopping at the first
+connected one:
+
+    python -m proxy_utils.benchmark --sizes 10 100 1000
+
+With `--bus`, `get_current_proxy` is timed end to end instead, including D-Bus
+calls to a `fake_connman.FakeConnman` on a private bus, for both the
+dbus-python and the asyncio client.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import timeit
+from typing import List
+
+import proxy_utils
+from proxy_utils import CONNECTED_STATES, find
+
+
+def make_service(index: int, state: str) -> tuple:
+    return (f'/net/connman/service/wifi_a0510b58100d_{index:08x}_managed_psk', {
+        'Type': 'wifi',
+        'Security': ['psk'],
+        'State': state,
+        'Strength': index % 100,
+        'Favorite': False,
+        'AutoConnect': False,
+        'Name': f'Network-{index}',
+        'Ethernet': {'Method': 'auto', 'Interface': 'wlp2s0', 'Address': 'B7:71:01:51:10:AD', 'MTU': 1500},
+        'IPv4': {}, 'IPv4.Configuration': {'Method': 'dhcp'},
+        'IPv6': {}, 'IPv6.Configuration': {'Method': 'auto', 'Privacy': 'disabled'},
+        'Nameservers': [], 'Timeservers': [], 'Domains': [],
+        'Proxy': {
+            'Method': 'manual',
+            'Servers': ['http://proxy.dividat.com:1234', 'user:pw@backup.dividat.com:3128'],
+            'Excludes': ['intranet', '.dividat.local'],
+        },
+        'Proxy.Configuration': {},
+    })
+
+
+def make_payload(size: int, connected: int | None) -> List[tuple]:
+    """`size` services, the one at index `connected` being online."""
+    return [make_service(i, 'online' if i == connected else 'idle') for i in range(size)]
+
+
+def parse_all(services) -> proxy_utils.ProxyConf | None:
+    """Parse every service before looking for the connected one, as done before."""
+    parsed = [proxy_utils.parse_service(s) for s in services]
+    default_service = find(lambda s: s is not None and s.state in CONNECTED_STATES, parsed)
+    return default_service.proxy if default_service else None
+
+
+def snapshot(services) -> proxy_utils.ProxyConf | None:
+    default_service = proxy_utils.find_default_service(services)
+    return default_service.proxy if default_service else None
+
+
+def bus_lookups(sizes: List[int], count: int):
+    import dbus # type: ignore
+    from proxy_utils import aio
+    from proxy_utils.fake_connman import FakeConnman, fake_service
+
+    async def aio_lookups() -> List[float]:
+        async with aio.open_dbus_router(bus='SYSTEM') as router:
+            durations = []
+            for _ in range(count):
+                started = time.monotonic()
+                await aio.get_current_proxy(router)
+                durations.append(time.monotonic() - started)
+            return durations
+
+    print(f"{'services':>8}  {'dbus-python':>12}  {'asyncio':>12}")
+    for size in sizes:
+        services = [fake_service('ethernet', proxy=['proxy.dividat.com:1234'])] + \
+            [fake_service(f'wifi_{i}', state='idle') for i in range(size - 1)]
+        with FakeConnman(services):
+            bus = dbus.SystemBus(private=True)
+            durations = []
+            for _ in range(count):
+                started = time.monotonic()
+                proxy_utils.get_current_proxy(bus)
+                durations.append(time.monotonic() - started)
+            bus.close()
+            aio_durations = asyncio.run(aio_lookups())
+        print(f"{size:>8}  {statistics.median(durations) * 1e3:>9.2f} ms  "
+              f"{statistics.median(aio_durations) * 1e3:>9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark current proxy lookups in GetServices payloads")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--bus', action='store_true', help="Time lookups over D-Bus, against a fake connman")
+    args = parser.parse_args()
+
+    if args.bus:
+        bus_lookups(args.sizes, count=20 * args.repeat)
+        return
+
+    print(f"{'services':>8}  {'connected':>9}  {'parse all':>12}  {'snapshot':>12}  {'speedup':>7}")
+    for size in args.sizes:
+        for label, connected in [('first', 0), ('last', size - 1), ('none', None)]:
+            services = make_payload(size, connected)
+            assert parse_all(services) == snapshot(services)
+            number = max(1, 10_000 // size)
+            results = []
+            for lookup in [parse_all, snapshot]:
+                best = min(timeit.repeat(lambda: lookup(services), number=number, repeat=args.repeat))
+                results.append(best / number)
+            print(f"{size:>8}  {label:>9}  {results[0] * 1e6:>9.1f} µs  {results[1] * 1e6:>9.1f} µs  "
+                  f"{results[0] / results[1]:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
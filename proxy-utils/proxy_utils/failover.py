@@ -0,0 +1,153 @@
+"""
+Fail over between several configured proxy servers.
+
+Connman services can list more than one proxy server. `ProxyFailover` checks
+them in a background thread with a TCP connect, and picks the reachable one
+with the lowest connect latency. Callers still get a single `ProxyConf`:
+
+    failover = ProxyFailover(on_change=lambda proxy: ...)
+    failover.update(get_current_proxies(bus))
+    proxy = failover.current()
+"""
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from proxy_utils import ProxyConf
+
+__all__ = ["ProxyFailover", "rank", "connect_latency"]
+
+# Proxies are identified by address, credentials do not change reachability
+Address = Tuple[str, int]
+
+
+def address(proxy: ProxyConf) -> Address:
+    return (proxy.hostname, proxy.port)
+
+
+def connect_latency(proxy: ProxyConf, timeout: float) -> float | None:
+    """Time to open a TCP connection to the proxy, None if unreachable."""
+    start = time.monotonic()
+    try:
+        with socket.create_connection(address(proxy), timeout=timeout):
+            return time.monotonic() - start
+    except OSError as e:
+        logging.debug(f"Proxy {proxy.hostname}:{proxy.port} is unreachable: {e}")
+        return None
+
+
+def rank(proxies: List[ProxyConf], latencies: Dict[Address, float | None],
+         current: ProxyConf | None, tolerance: float) -> ProxyConf | None:
+    """Pick the proxy to use.
+
+    Reachable proxies are preferred by latency. The current proxy is kept
+    unless it became unreachable or another one is faster by more than
+    `tolerance` seconds, so that jitter does not make the choice flap.
+
+    Proxies that were not checked yet count as reachable with unknown latency,
+    behind checked ones, in configured order. If none is reachable, the first
+    configured one is used.
+    """
+    if not proxies:
+        return None
+
+    reachable = [p for p in proxies if latencies.get(address(p), 0.0) is not None]
+    if not reachable:
+        return proxies[0]
+
+    def latency(p: ProxyConf) -> float:
+        value = latencies.get(address(p))
+        return value if value is not None else float('inf')
+
+    best = min(reachable, key=latency)
+    if current is not None and current in reachable and latency(current) <= latency(best) + tolerance:
+        return current
+    return best
+
+
+class ProxyFailover:
+    """Keep track of the best of several proxies, checked in a background thread.
+
+    With a single configured proxy, it is used as is and nothing is checked.
+    `on_change` is called from the checking thread when the best proxy changes.
+    """
+
+    def __init__(self,
+                 on_change: Callable[[ProxyConf | None], None] = lambda _: None,
+                 interval: float = 30,
+                 timeout: float = 3,
+                 tolerance: float = 0.05):
+        self._on_change = on_change
+        self._interval = interval
+        self._timeout = timeout
+        self._tolerance = tolerance
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._proxies: List[ProxyConf] = []
+        self._latencies: Dict[Address, float | None] = {}
+        self._current: ProxyConf | None = None
+        self._thread: threading.Thread | None = None
+
+    def current(self) -> ProxyConf | None:
+        with self._lock:
+            return self._current
+
+    def update(self, proxies: List[ProxyConf]):
+        """Use a new list of configured proxies, in configured order."""
+        with self._lock:
+            if proxies == self._proxies:
+                return
+            self._proxies = list(proxies)
+            addresses = {address(p) for p in proxies}
+            self._latencies = {a: latency for a, latency in self._latencies.items() if a in addresses}
+            # keep using the same server, but with its new credentials
+            current = next((p for p in proxies if self._current is not None
+                            and address(p) == address(self._current)), None)
+            changed = self._select(current)
+        self._notify(changed)
+        self.recheck()
+
+    def recheck(self):
+        """Check all proxies now, e.g. after a request through the current one failed."""
+        with self._lock:
+            if len(self._proxies) < 2:
+                return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        with ThreadPoolExecutor(thread_name_prefix="proxy-check") as executor:
+            while True:
+                self._wake.wait(self._interval)
+                self._wake.clear()
+                with self._lock:
+                    proxies = self._proxies
+                if len(proxies) < 2:
+                    continue
+                latencies = dict(zip(map(address, proxies),
+                                     executor.map(lambda p: connect_latency(p, self._timeout), proxies)))
+                with self._lock:
+                    if proxies is not self._proxies:
+                        # updated meanwhile, the new list is checked next
+                        continue
+                    self._latencies = latencies
+                    changed = self._select(self._current)
+                self._notify(changed)
+
+    # Called with the lock held, return whether the selected proxy changed
+    def _select(self, current: ProxyConf | None) -> bool:
+        best = rank(self._proxies, self._latencies, current, self._tolerance)
+        changed = best != self._current
+        self._current = best
+        return changed
+
+    def _notify(self, changed: bool):
+        if changed:
+            best = self.current()
+            logging.info(f"Using proxy {best.hostname}:{best.port}" if best else "Using no proxy")
+            self._on_change(best)
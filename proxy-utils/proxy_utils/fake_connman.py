@@ -0,0 +1,150 @@
+"""
+Scriptable stand-in for connman, for benchmarks without a real network stack.
+
+`FakeConnman` starts a private `dbus-daemon`, owns `net.connman` on it and
+points `DBUS_SYSTEM_BUS_ADDRESS` there, so that code talking to connman on the
+system bus (dbus-python or jeepney) talks to the fake instead:
+
+    with FakeConnman([fake_service('ethernet', proxy=['proxy.dividat.com:1234'])]) as connman:
+        proxy_utils.get_current_proxy(dbus.SystemBus())
+        connman.burst(1000, 'Strength')
+
+Service methods (Connect, Disconnect, MoveBefore, SetProperty) succeed without
+doing anything, they are recorded in `calls`.
+"""
+import itertools
+import os
+import subprocess
+import threading
+from typing import Any, Dict, List, Tuple
+from jeepney import DBusAddress, MessageType, new_error, new_method_return, new_signal # type: ignore
+from jeepney.bus_messages import message_bus # type: ignore
+from jeepney.io.blocking import Proxy, open_dbus_connection # type: ignore
+from jeepney.low_level import HeaderFields # type: ignore
+
+__all__ = ["FakeConnman", "fake_service", "SERVICE_PREFIX"]
+
+SERVICE_PREFIX = '/net/connman/service/'
+
+# (path, properties) with jeepney variants, (signature, value), as values
+FakeService = Tuple[str, Dict[str, tuple]]
+
+
+def fake_service(name: str, state: str = 'online', proxy: List[str] | None = None,
+                 excludes: List[str] | None = None, pac_url: str | None = None) -> FakeService:
+    """A service with a manual proxy if `proxy` servers are given, an auto proxy with `pac_url`."""
+    proxy_conf: Dict[str, Tuple[str, Any]]
+    if pac_url is not None:
+        proxy_conf = {'Method': ('s', 'auto'), 'URL': ('s', pac_url)}
+    elif proxy:
+        proxy_conf = {'Method': ('s', 'manual'), 'Servers': ('as', proxy), 'Excludes': ('as', excludes or [])}
+    else:
+        proxy_conf = {'Method': ('s', 'direct')}
+
+    return (SERVICE_PREFIX + name, {
+        'Type': ('s', 'ethernet' if name.startswith('ethernet') else 'wifi'),
+        'Name': ('s', name),
+        'State': ('s', state),
+        'Strength': ('y', 50),
+        'Proxy': ('a{sv}', proxy_conf),
+        'IPv4': ('a{sv}', {'Method': ('s', 'dhcp')}),
+    })
+
+
+class FakeConnman:
+    """Answer connman D-Bus calls from a configurable service list.
+
+    Calls are served by a background thread. Services and signals can be
+    changed and emitted from any thread.
+    """
+
+    def __init__(self, services: List[FakeService] | None = None):
+        self.calls: List[Tuple[str, str]] = []
+        self._services: List[FakeService] = list(services or [])
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._values = itertools.count()
+
+    def __enter__(self) -> 'FakeConnman':
+        self._daemon = subprocess.Popen(
+            ['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+            stdout=subprocess.PIPE, text=True)
+        assert self._daemon.stdout is not None
+        self.address = self._daemon.stdout.readline().strip()
+
+        self._connection = open_dbus_connection(bus=self.address)
+        Proxy(message_bus, self._connection).RequestName('net.connman', 0)
+        self._thread = threading.Thread(target=self._serve, name="fake-connman", daemon=True)
+        self._thread.start()
+
+        self._previous_address = os.environ.get('DBUS_SYSTEM_BUS_ADDRESS')
+        os.environ['DBUS_SYSTEM_BUS_ADDRESS'] = self.address
+        return self
+
+    def __exit__(self, *_exc):
+        if self._previous_address is None:
+            os.environ.pop('DBUS_SYSTEM_BUS_ADDRESS', None)
+        else:
+            os.environ['DBUS_SYSTEM_BUS_ADDRESS'] = self._previous_address
+        self._stopped.set()
+        self._thread.join()
+        self._connection.close()
+        self._daemon.terminate()
+        self._daemon.wait()
+
+    def set_services(self, services: List[FakeService]):
+        """Replace the service list, in connman order, and signal ServicesChanged."""
+        with self._lock:
+            self._services = list(services)
+        manager = DBusAddress('/', interface='net.connman.Manager')
+        self._send(new_signal(manager, 'ServicesChanged', 'a(oa{sv})ao', (services, [])))
+
+    def property_changed(self, path: str, name: str, value: tuple):
+        """Change a service property, `value` being a variant, and signal PropertyChanged."""
+        with self._lock:
+            for service_path, properties in self._services:
+                if service_path == path:
+                    properties[name] = value
+        service = DBusAddress(path, interface='net.connman.Service')
+        self._send(new_signal(service, 'PropertyChanged', 'sv', (name, value)))
+
+    def burst(self, count: int, name: str = 'Strength', path: str | None = None):
+        """Signal `count` changes of a byte property as fast as possible."""
+        path = path or self._services[0][0]
+        for _ in range(count):
+            self.property_changed(path, name, ('y', next(self._values) % 100))
+
+    def _send(self, message):
+        with self._send_lock:
+            self._connection.send(message)
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                message = self._connection.receive(timeout=0.1)
+            except TimeoutError:
+                continue
+            if message.header.message_type == MessageType.method_call:
+                self._send(self._reply(message))
+
+    def _reply(self, message):
+        fields = message.header.fields
+        path = fields.get(HeaderFields.path)
+        member = fields.get(HeaderFields.member)
+        with self._lock:
+            self.calls.append((path, member))
+            services = list(self._services)
+
+        match member:
+            case 'GetServices':
+                return new_method_return(message, 'a(oa{sv})', (services,))
+            case 'GetProperties':
+                properties = next((p for s, p in services if s == path), None)
+                if properties is None:
+                    return new_error(message, 'net.connman.Error.NotFound')
+                return new_method_return(message, 'a{sv}', (properties,))
+            case 'Connect' | 'Disconnect' | 'MoveBefore' | 'SetProperty':
+                return new_method_return(message)
+            case _:
+                return new_error(message, 'net.connman.Error.NotSupported')
@@ -0,0 +1,267 @@
+"""
+Resolve the proxy to use per URL, honouring connman's proxy configuration.
+
+With the manual method, hosts listed in `Excludes` are accessed directly. With
+the auto method and a PAC URL, the script is fetched in the background, kept
+per URL across resolvers, and evaluated with Duktape, which gives it no access
+to files or the network. Decisions are made per host and kept in an LRU cache:
+
+    resolver = ProxyResolver(get_default_service(bus))
+    proxy = resolver.resolve('https://play.dividat.com')
+"""
+import functools
+import ipaddress
+import logging
+import socket
+import threading
+import time
+import urllib.request
+from typing import Callable, List
+from urllib.parse import urlsplit
+
+from proxy_utils import ProxyConf, Service, parse_proxy_url
+
+__all__ = ["ProxyResolver", "PacScripts", "PAC_SCRIPTS", "is_excluded", "parse_pac_result"]
+
+# Helper functions available to PAC scripts, see
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Proxy_servers_and_tunneling/Proxy_Auto-Configuration_PAC_file
+PAC_FUNCTIONS = r"""
+function dnsResolve(host) { return call_python('dnsResolve', host); }
+function myIpAddress() { return call_python('myIpAddress'); }
+function isResolvable(host) { return dnsResolve(host) !== null; }
+function isInNet(host, pattern, mask) { return call_python('isInNet', host, pattern, mask); }
+function isPlainHostName(host) { return host.indexOf('.') < 0; }
+function dnsDomainIs(host, domain) {
+    return host.length >= domain.length && host.substring(host.length - domain.length) === domain;
+}
+function localHostOrDomainIs(host, hostdom) {
+    return host === hostdom || (isPlainHostName(host) && hostdom.indexOf(host + '.') === 0);
+}
+function dnsDomainLevels(host) { return host.split('.').length - 1; }
+function shExpMatch(str, shexp) {
+    var re = shexp.replace(/[.+^${}()|[\]\\]/g, '\\$&').replace(/\*/g, '.*').replace(/\?/g, '.');
+    return new RegExp('^' + re + '$').test(str);
+}
+function weekdayRange() { return true; }
+function dateRange() { return true; }
+function timeRange() { return true; }
+"""
+
+
+def is_excluded(host: str, excludes: List[str]) -> bool:
+    """Whether the host is to be accessed directly.
+
+    Entries match a host name and its subdomains (a leading `*.` or `.` is
+    optional), an IP address, or a network in CIDR notation.
+    """
+    host = host.lower().rstrip('.')
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        address = None
+
+    for entry in excludes:
+        entry = entry.strip().lower()
+        if address is not None and '/' in entry:
+            try:
+                if address in ipaddress.ip_network(entry, strict=False):
+                    return True
+            except ValueError:
+                pass
+            continue
+
+        domain = entry.removeprefix('*').removeprefix('.')
+        if domain and (host == domain or host.endswith('.' + domain)):
+            return True
+    return False
+
+
+def parse_pac_result(result: str) -> ProxyConf | None:
+    """Take the first usable entry of a FindProxyForURL result, None for DIRECT.
+
+    SOCKS proxies are not supported and skipped.
+    """
+    for entry in result.split(';'):
+        parts = entry.split()
+        if not parts:
+            continue
+        kind = parts[0].upper()
+        if kind == 'DIRECT':
+            return None
+        elif kind in ['PROXY', 'HTTP', 'HTTPS'] and len(parts) >= 2:
+            proxy = parse_proxy_url(parts[1])
+            if proxy is not None:
+                return proxy
+    return None
+
+
+class PacScript:
+    """A PAC script, evaluated in a Duktape interpreter.
+
+    The interpreter is not thread safe, evaluations are serialized.
+    """
+
+    def __init__(self, source: str):
+        import dukpy # type: ignore
+
+        self._lock = threading.Lock()
+        self._interpreter = dukpy.JSInterpreter()
+        self._interpreter.export_function('dnsResolve', pac_dns_resolve)
+        self._interpreter.export_function('myIpAddress', pac_my_ip_address)
+        self._interpreter.export_function('isInNet', pac_is_in_net)
+        self._interpreter.evaljs(PAC_FUNCTIONS + source)
+
+    def find_proxy(self, url: str, host: str) -> str:
+        with self._lock:
+            return str(self._interpreter.evaljs('FindProxyForURL(dukpy.url, dukpy.host)', url=url, host=host))
+
+
+def pac_dns_resolve(host: str) -> str | None:
+    try:
+        return socket.gethostbyname(host)
+    except OSError:
+        return None
+
+
+def pac_my_ip_address() -> str:
+    # the source address of a route to the internet, nothing is sent
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(('192.0.2.1', 80))
+            return sock.getsockname()[0]
+    except OSError:
+        return '127.0.0.1'
+
+
+def pac_is_in_net(host: str, pattern: str, mask: str) -> bool:
+    address = pac_dns_resolve(host)
+    if address is None:
+        return False
+    try:
+        return ipaddress.ip_address(address) in ipaddress.ip_network(f'{pattern}/{mask}', strict=False)
+    except ValueError:
+        return False
+
+
+def fetch_pac_script(url: str, timeout: float) -> str:
+    # the PAC script itself is never fetched through a proxy
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    with opener.open(url, timeout=timeout) as response:
+        return response.read().decode('utf-8', errors='replace')
+
+
+class PacScripts:
+    """PAC scripts by URL, fetched in background threads.
+
+    Scripts are fetched once and kept, so that resolvers built after every
+    connman change do not fetch them again. Failed fetches are retried after
+    `retry_after` seconds.
+
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, timeout: float = 10, retry_after: float = 60):
+        self._timeout = timeout
+        self._retry_after = retry_after
+        self._lock = threading.Lock()
+        self._scripts: dict[str, PacScript] = {}
+        self._failed_at: dict[str, float] = {}
+        # URL -> callbacks waiting for the script
+        self._loading: dict[str, List[Callable[[], None]]] = {}
+
+    def get(self, url: str, on_loaded: Callable[[], None] | None = None) -> PacScript | None:
+        """The script if loaded, otherwise start loading it and return None.
+
+        `on_loaded` is called from the loading thread once loaded.
+        """
+        with self._lock:
+            if url in self._scripts:
+                return self._scripts[url]
+            failed_at = self._failed_at.get(url)
+            if failed_at is not None and time.monotonic() - failed_at < self._retry_after:
+                return None
+            if url in self._loading:
+                if on_loaded is not None:
+                    self._loading[url].append(on_loaded)
+                return None
+            self._loading[url] = [on_loaded] if on_loaded is not None else []
+        threading.Thread(target=self._load, args=[url], name="pac-fetch", daemon=True).start()
+        return None
+
+    def _load(self, url: str):
+        script: PacScript | None = None
+        try:
+            script = PacScript(fetch_pac_script(url, self._timeout))
+            logging.info(f"Loaded PAC script from {url}")
+        except Exception as e:
+            logging.warning(f"Could not load PAC script from {url}, accessing URLs directly: {e}")
+
+        with self._lock:
+            callbacks = self._loading.pop(url, [])
+            if script is not None:
+                self._scripts[url] = script
+                self._failed_at.pop(url, None)
+            else:
+                self._failed_at[url] = time.monotonic()
+
+        if script is not None:
+            for callback in callbacks:
+                callback()
+
+
+# Shared by all resolvers of the process
+PAC_SCRIPTS = PacScripts()
+
+
+class ProxyResolver:
+    """Decide per URL whether to go through a proxy, and which one.
+
+    `manual` gives the proxy of the manual method, by default the first
+    configured server, e.g. `failover.ProxyFailover.current` to fail over
+    between several ones.
+
+    The PAC script is fetched in the background from `pac_scripts`. Until it
+    is loaded, or if it can not be fetched or evaluated, URLs are accessed
+    directly. `on_pac_loaded` is called from the fetching thread once it is
+    loaded, so that callers can resolve again.
+
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self,
+                 service: Service | None,
+                 manual: Callable[[], ProxyConf | None] | None = None,
+                 cache_size: int = 256,
+                 pac_scripts: PacScripts = PAC_SCRIPTS,
+                 on_pac_loaded: Callable[[], None] | None = None):
+        self._excludes = service.excludes if service else []
+        self._pac_url = service.pac_url if service else None
+        self._manual = manual or (lambda: service.proxy if service else None)
+        self._pac_scripts = pac_scripts
+        self._on_pac_loaded = on_pac_loaded
+        self._find_pac_proxy = functools.lru_cache(maxsize=cache_size)(self._evaluate_pac)
+        if self._pac_url is not None:
+            # start fetching right away
+            self._pac_scripts.get(self._pac_url, on_pac_loaded)
+
+    def resolve(self, url: str) -> ProxyConf | None:
+        parsed = urlsplit(url if '://' in url else f'http://{url}')
+        host = parsed.hostname
+        if self._pac_url is not None:
+            pac = self._pac_scripts.get(self._pac_url, self._on_pac_loaded)
+            if host is None or pac is None:
+                return None
+            # The script only gets to see scheme and host, so that decisions
+            # can be cached per host.
+            return self._find_pac_proxy(pac, parsed.scheme, host)
+        elif host is not None and is_excluded(host, self._excludes):
+            return None
+        else:
+            return self._manual()
+
+    def _evaluate_pac(self, pac: PacScript, scheme: str, host: str) -> ProxyConf | None:
+        try:
+            return parse_pac_result(pac.find_proxy(f'{scheme}://{host}/', host))
+        except Exception as e:
+            logging.warning(f"Could not evaluate PAC script for {host}, accessing it directly: {e}")
+            return None
@@ -17,3 +17,125 @@ def test_extract_manual_proxy():
     assert proxy.parse_proxy_url('dividat') == None
     assert proxy.parse_proxy_url('dividat:88') == proxy.ProxyConf('dividat', 88, None)
     assert proxy.parse_proxy_url('user:pw@dividat:987') == proxy.ProxyConf('dividat', 987, proxy.Credentials('user', 'pw'))
+
+def test_parse_jeepney_service():
+    from proxy_utils.aio import unwrap_variant
+    properties = ('a{sv}', {
+        'State': ('s', 'ready'),
+        'Proxy': ('a{sv}', {'Method': ('s', 'manual'), 'Servers': ('as', ['user:pw@dividat:987'])})
+    })
+    s = proxy.parse_service(('/net/connman/service/ethernet', unwrap_variant(properties)))
+    assert s.state == 'ready'
+    assert s.proxy == proxy.ProxyConf('dividat', 987, proxy.Credentials('user', 'pw'))
+
+def test_extract_manual_proxies():
+    conf = {'Proxy': {'Method': 'manual', 'Servers': ['primary:3128', 'invalid', 'user:pw@backup:8080']}}
+    assert proxy.extract_manual_proxies(conf) == [
+        proxy.ProxyConf('primary', 3128, None),
+        proxy.ProxyConf('backup', 8080, proxy.Credentials('user', 'pw'))
+    ]
+    assert proxy.extract_manual_proxy(conf) == proxy.ProxyConf('primary', 3128, None)
+    assert proxy.extract_manual_proxies({'Proxy': {'Method': 'direct', 'Servers': ['primary:3128']}}) == []
+
+def test_rank_proxies():
+    from proxy_utils.failover import rank
+    primary = proxy.ProxyConf('primary', 3128, None)
+    backup = proxy.ProxyConf('backup', 3128, None)
+
+    # unchecked proxies are used in configured order
+    assert rank([primary, backup], {}, None, 0.05) == primary
+    # stalled primary
+    assert rank([primary, backup], {('primary', 3128): None, ('backup', 3128): 0.2}, primary, 0.05) == backup
+    # faster backup, within tolerance
+    assert rank([primary, backup], {('primary', 3128): 0.12, ('backup', 3128): 0.1}, primary, 0.05) == primary
+    # faster backup, beyond tolerance
+    assert rank([primary, backup], {('primary', 3128): 0.5, ('backup', 3128): 0.1}, primary, 0.05) == backup
+    # none reachable
+    assert rank([primary, backup], {('primary', 3128): None, ('backup', 3128): None}, backup, 0.05) == primary
+    assert rank([], {}, None, 0.05) == None
+
+def test_is_excluded():
+    from proxy_utils.resolver import is_excluded
+    excludes = ['intranet', '.dividat.local', '*.mirror.example.com', 'updates.example.org', '10.0.0.0/8']
+    assert is_excluded('intranet', excludes)
+    assert is_excluded('Box.Dividat.Local', excludes)
+    assert is_excluded('eu.mirror.example.com', excludes)
+    assert is_excluded('updates.example.org', excludes)
+    assert is_excluded('10.1.2.3', excludes)
+    assert not is_excluded('play.dividat.com', excludes)
+    assert not is_excluded('example.org', excludes)
+    assert not is_excluded('192.168.1.1', excludes)
+
+def test_parse_pac_result():
+    from proxy_utils.resolver import parse_pac_result
+    assert parse_pac_result('DIRECT') == None
+    assert parse_pac_result('PROXY proxy.dividat.com:3128; DIRECT') == proxy.ProxyConf('proxy.dividat.com', 3128, None)
+    assert parse_pac_result('SOCKS5 socks:1080; PROXY backup:8080') == proxy.ProxyConf('backup', 8080, None)
+    assert parse_pac_result('') == None
+
+def test_resolve_with_excludes():
+    from proxy_utils.resolver import ProxyResolver
+    primary = proxy.ProxyConf('primary', 3128, None)
+    resolver = ProxyResolver(proxy.Service('online', primary, [primary], ['intranet']))
+    assert resolver.resolve('http://intranet/updates') == None
+    assert resolver.resolve('https://play.dividat.com') == primary
+
+def test_find_default_service():
+    services = [
+        ('/net/connman/service/wifi_idle', {'State': 'idle', 'Proxy': 'not decoded'}),
+        ('/net/connman/service/wifi_online', {'State': 'online', 'Proxy': {'Method': 'manual', 'Servers': ['dividat:88']}}),
+        ('/net/connman/service/ethernet', {'State': 'ready'}),
+    ]
+    snapshot = proxy.find_default_service(services)
+    assert snapshot.path == '/net/connman/service/wifi_online'
+    assert snapshot.proxy == proxy.ProxyConf('dividat', 88, None)
+    assert snapshot.to_service() == proxy.parse_service(services[1])
+    assert proxy.find_default_service(services[:1]) == None
+
+def test_resolve_with_pac_fetched_in_background(monkeypatch):
+    import threading
+    from proxy_utils import resolver
+    fetches = []
+    release = threading.Event()
+    def fetch_pac_script(url, timeout):
+        fetches.append(url)
+        release.wait(5)
+        return 'function FindProxyForURL(url, host) { return "PROXY pac-proxy:3128"; }'
+    monkeypatch.setattr(resolver, 'fetch_pac_script', fetch_pac_script)
+
+    loaded = threading.Event()
+    scripts = resolver.PacScripts()
+    service = proxy.Service('online', None, pac_url='http://wpad/wpad.dat')
+    first = resolver.ProxyResolver(service, pac_scripts=scripts, on_pac_loaded=loaded.set)
+    # direct until loaded, without waiting for the script
+    assert first.resolve('https://play.dividat.com') == None
+    release.set()
+    assert loaded.wait(5)
+    assert first.resolve('https://play.dividat.com') == proxy.ProxyConf('pac-proxy', 3128, None)
+    # kept across resolvers
+    second = resolver.ProxyResolver(service, pac_scripts=scripts)
+    assert second.resolve('https://play.dividat.com') == proxy.ProxyConf('pac-proxy', 3128, None)
+    assert fetches == ['http://wpad/wpad.dat']
+
+def test_proxy_changes_follow_signals():
+    import asyncio
+    from proxy_utils import aio
+    from proxy_utils.fake_connman import FakeConnman, fake_service, SERVICE_PREFIX
+    ethernet = SERVICE_PREFIX + 'ethernet'
+
+    async def changes(connman):
+        async with aio.open_dbus_router(bus='SYSTEM') as router:
+            proxies = aio.proxy_changes(router)
+            assert await anext(proxies) == proxy.ProxyConf('first', 1234, None)
+
+            connman.set_services([fake_service('ethernet', proxy=['second:1234']), fake_service('wifi')])
+            assert await anext(proxies) == proxy.ProxyConf('second', 1234, None)
+
+            connman.property_changed(ethernet, 'Strength', ('y', 10))
+            connman.property_changed(ethernet, 'Proxy', ('a{sv}', {'Method': ('s', 'direct')}))
+            assert await anext(proxies) == None
+
+    with FakeConnman([fake_service('ethernet', proxy=['first:1234'])]) as connman:
+        asyncio.run(asyncio.wait_for(changes(connman), 5))
+        # services are fetched once, and then kept up to date from the signals
+        assert [member for _path, member in connman.calls].count('GetServices') == 1
@@ -85,8 +85,13 @@ pkgs.testers.runNixOSTest {
             ];
             maxNumFailures = 3;
             checkInterval = 1;
+            minCheckInterval = 1;
+            maxCheckInterval = 4;
+            checkIntervalJitter = 0;
             settingChangeDelay = 3;
             checkUrlTimeout = 0.2;
+            # the test cases expect an immediate connman restart
+            remediationSteps = [ "restart" ];
             debug = true;
         };
       };
@@ -110,15 +115,18 @@ import datetime
 ## == Config vars
 
 check_interval = ${toString watchdogCfg.checkInterval}
+min_check_interval = ${toString watchdogCfg.minCheckInterval}
+max_check_interval = ${toString watchdogCfg.maxCheckInterval}
 retries = ${toString watchdogCfg.maxNumFailures}
 setting_change_delay = ${toString watchdogCfg.settingChangeDelay}
 watchdog_http_req_timeout = ${toString watchdogCfg.checkUrlTimeout}
 timeout_for_all_urls = watchdog_http_req_timeout * 2
 
 # Worst case when we don't expect any SETTING_CHANGE_DELAY to happen
-max_state_change_time_without_delay = (retries-1)*check_interval + retries*timeout_for_all_urls
-# Worst case delay: once or twice delayed due to connman setting changes + retries exhausted
-max_state_change_time = setting_change_delay*2 + max_state_change_time_without_delay
+max_state_change_time_without_delay = (retries-1)*min_check_interval + retries*timeout_for_all_urls
+# Worst case delay: once or twice delayed due to connman setting changes + retries exhausted,
+# or a fully backed off check while never connected
+max_state_change_time = max(setting_change_delay*2, max_check_interval) + max_state_change_time_without_delay
 
 ## == Helpers
 